@@ -1,18 +1,50 @@
-import importlib
-
 from django.conf import settings
 from django import get_version
 from django.contrib import admin
 from django.contrib import messages
 from django.core.paginator import PageNotAnInteger, EmptyPage
+from django.http import JsonResponse
 from django.shortcuts import redirect, reverse
 from django.template.response import TemplateResponse
 from django.urls import path
-from drf_user_activity_tracker_mongodb.utils import (MyCollection,
-                                                     get_all_url_names,
+from drf_user_activity_tracker_mongodb.backends import get_storage_backend
+from drf_user_activity_tracker_mongodb.metrics import METRICS
+from drf_user_activity_tracker_mongodb.utils import (URL_NAME_INDEX,
                                                      ParamsHandler,
                                                      CustomPaginator,
-                                                     database_log_enabled)
+                                                     LRUCache,
+                                                     database_log_enabled,
+                                                     format_count)
+from drf_user_activity_tracker_mongodb.rollups import rollups_enabled
+
+DRF_ACTIVITY_TRACKER_ADMIN_PAGINATION = 'CURSOR'  # Keyset pagination by default
+if hasattr(settings, 'DRF_ACTIVITY_TRACKER_ADMIN_PAGINATION'):
+    if settings.DRF_ACTIVITY_TRACKER_ADMIN_PAGINATION in ['CURSOR', 'PAGE']:
+        DRF_ACTIVITY_TRACKER_ADMIN_PAGINATION = settings.DRF_ACTIVITY_TRACKER_ADMIN_PAGINATION
+
+DRF_ACTIVITY_TRACKER_ADMIN_COUNT_LIMIT = 10000  # Stop counting after 10000 logs by default
+if hasattr(settings, 'DRF_ACTIVITY_TRACKER_ADMIN_COUNT_LIMIT'):
+    if isinstance(settings.DRF_ACTIVITY_TRACKER_ADMIN_COUNT_LIMIT, int):
+        DRF_ACTIVITY_TRACKER_ADMIN_COUNT_LIMIT = settings.DRF_ACTIVITY_TRACKER_ADMIN_COUNT_LIMIT
+
+DRF_ACTIVITY_TRACKER_ADMIN_COUNT_CACHE_TTL = 60  # Default to 60 seconds
+if hasattr(settings, 'DRF_ACTIVITY_TRACKER_ADMIN_COUNT_CACHE_TTL'):
+    if isinstance(settings.DRF_ACTIVITY_TRACKER_ADMIN_COUNT_CACHE_TTL, (int, float)):
+        DRF_ACTIVITY_TRACKER_ADMIN_COUNT_CACHE_TTL = settings.DRF_ACTIVITY_TRACKER_ADMIN_COUNT_CACHE_TTL
+
+# Counts of the filters, so paging through a filter counts the logs once.
+COUNT_CACHE = LRUCache(max_size=256, ttl=DRF_ACTIVITY_TRACKER_ADMIN_COUNT_CACHE_TTL)
+
+
+def get_data_count(request, filters):
+    # Keyed by the query parameters, the created_time filter moves with the current time.
+    key = tuple((name, request.GET.get(name)) for name in ('url_name', 'q', 'status', 'created_time'))
+    data_count = COUNT_CACHE.get(key)
+    if data_count is None:
+        data_count = get_storage_backend().count(limit=DRF_ACTIVITY_TRACKER_ADMIN_COUNT_LIMIT + 1, **filters)
+        COUNT_CACHE.set(key, data_count)
+    return data_count
+
 
 if database_log_enabled():
     from drf_user_activity_tracker_mongodb.models import ActivityLog
@@ -25,32 +57,73 @@ if database_log_enabled():
         def get_urls(self):
             info = "{}_{}_changelist".format(self.model._meta.app_label, self.model._meta.model_name)
             detail = "{}_{}_change".format(self.model._meta.app_label, self.model._meta.model_name)
+            rollups = "{}_{}_rollups".format(self.model._meta.app_label, self.model._meta.model_name)
+            metrics = "{}_{}_metrics".format(self.model._meta.app_label, self.model._meta.model_name)
 
-            return [
+            urls = [
                 path(r'', self.activity_log_view, name=info),
+                path(r'metrics/', self.admin_site.admin_view(self.activity_log_metrics_view), name=metrics),
                 path(r'<str:pk>/change/', self.activity_log_detail_view, name=detail)
             ]
+            if rollups_enabled():
+                urls.insert(1, path(r'rollups/', self.activity_log_rollups_view, name=rollups))
+            return urls
 
         def activity_log_view(self, request):
             params = ParamsHandler(request)
 
-            project_urls = f"{settings.ROOT_URLCONF}"
-            urls = getattr(importlib.import_module(project_urls), 'urlpatterns')
-
-            url_names_list = get_all_url_names(urls)
+            url_names_list = URL_NAME_INDEX.get_url_names()
             url_name = params.get_url_name()
             search_value = params.get_search_value()
             status_code = params.get_status()
             time_delta = params.get_time_delta()
 
-            data_count = MyCollection().data_count(url_name=url_name, user_id=search_value, status_code=status_code,
-                                                   time_delta=time_delta)
+            filters = dict(url_name=url_name, user_id=search_value, status_code=status_code, time_delta=time_delta)
 
             dataset_limit = 50
             if hasattr(settings, 'DRF_ACTIVITY_TRACKER_DJANGO_ADMIN_LIMIT'):
                 if isinstance(settings.DRF_ACTIVITY_TRACKER_DJANGO_ADMIN_LIMIT, int):
                     dataset_limit = settings.DRF_ACTIVITY_TRACKER_DJANGO_ADMIN_LIMIT
 
+            if DRF_ACTIVITY_TRACKER_ADMIN_PAGINATION == 'CURSOR':
+                data_count = get_data_count(request, filters)
+                page_object = self._get_cursor_page(params, filters, data_count, dataset_limit)
+            else:
+                data_count = get_storage_backend().count(**filters)
+                page_object = self._get_page(request, filters, data_count, dataset_limit)
+
+            context = dict(self.admin_site.each_context(request), dataset=page_object.dataset,
+                           page_object=page_object,
+                           url_names=url_names_list,
+                           count=data_count,
+                           count_display=format_count(data_count, DRF_ACTIVITY_TRACKER_ADMIN_COUNT_LIMIT
+                                                      if DRF_ACTIVITY_TRACKER_ADMIN_PAGINATION == 'CURSOR' else None))
+
+            if int(get_version()[0]) == 2:
+                return TemplateResponse(request, "activity_log/admin/change_list_v2.html", context=context)
+
+            return TemplateResponse(request, "activity_log/admin/change_list_v3.html", context=context)
+
+        @staticmethod
+        def _get_cursor_page(params, filters, data_count, dataset_limit):
+            after = params.get_cursor('after')
+            before = None if after else params.get_cursor('before')
+
+            # One more log tells if there is another page in that direction.
+            dataset = get_storage_backend().list(dataset_limit=dataset_limit + 1, after=after, before=before, **filters)
+            has_more = len(dataset) > dataset_limit
+            if before:
+                dataset = dataset[1:] if has_more else dataset
+                has_next, has_previous = True, has_more
+            else:
+                dataset = dataset[:dataset_limit]
+                has_next, has_previous = has_more, after is not None
+
+            paginator = CustomPaginator(dataset=dataset, data_count=data_count, per_page=dataset_limit)
+            return paginator.cursor_page(has_next=has_next, has_previous=has_previous)
+
+        @staticmethod
+        def _get_page(request, filters, data_count, dataset_limit):
             page = request.GET.get('page', "")
 
             if page.isdigit():
@@ -60,29 +133,30 @@ if database_log_enabled():
 
             skip = (page - 1) * dataset_limit
 
-            dataset = MyCollection().list(url_name=url_name, user_id=search_value, status_code=status_code,
-                                          time_delta=time_delta, dataset_limit=dataset_limit, skip=skip)
+            dataset = get_storage_backend().list(dataset_limit=dataset_limit, skip=skip, **filters)
 
             paginator = CustomPaginator(dataset=dataset, data_count=data_count, per_page=dataset_limit)
 
             try:
-                page_object = paginator.page(page)
+                return paginator.page(page)
             except PageNotAnInteger:
-                page_object = paginator.page(1)
+                return paginator.page(1)
             except EmptyPage:
-                page_object = paginator.page(paginator.num_pages)
-
-            context = dict(self.admin_site.each_context(request), dataset=dataset, page_object=page_object,
-                           url_names=url_names_list,
-                           count=data_count)
+                return paginator.page(paginator.num_pages)
 
-            if int(get_version()[0]) == 2:
-                return TemplateResponse(request, "activity_log/admin/change_list_v2.html", context=context)
+        def activity_log_rollups_view(self, request):
+            params = ParamsHandler(request)
+            rollups = get_storage_backend().aggregate(time_delta=params.get_time_delta())
+            context = dict(self.admin_site.each_context(request), rollups=rollups)
+            return TemplateResponse(request, "activity_log/admin/rollups.html", context=context)
 
-            return TemplateResponse(request, "activity_log/admin/change_list_v3.html", context=context)
+        def activity_log_metrics_view(self, request):
+            if not self.has_view_permission(request):
+                return JsonResponse({'detail': 'You do not have permission to view the metrics.'}, status=403)
+            return JsonResponse(METRICS.get_summary())
 
         def activity_log_detail_view(self, request, pk=None):
-            data = MyCollection().detail(pk)
+            data = get_storage_backend().detail(pk)
             if not data:
                 messages.warning(request, f"Log with ID '{pk}' doesn’t exist. Perhaps it was deleted?")
                 return redirect(reverse('admin:index'))
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LoggerConfig(AppConfig):
     name = 'drf_user_activity_tracker_mongodb'
     verbose_name = 'DRF User Activity Tracker Mongodb'
+
+    def ready(self):
+        from drf_user_activity_tracker_mongodb.start_logger_when_server_starts import install_sigterm_handler
+
+        # ready() runs on the main thread, unlike the first log under a threaded server.
+        install_sigterm_handler()
@@ -0,0 +1,52 @@
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+STORAGE_BACKENDS = {
+    'mongo': 'drf_user_activity_tracker_mongodb.backends.mongo.MongoBackend',
+    'memory': 'drf_user_activity_tracker_mongodb.backends.memory.MemoryBackend',
+    'sqlite': 'drf_user_activity_tracker_mongodb.backends.sqlite.SQLiteBackend',
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_storage_backend_path():
+    backend_path = STORAGE_BACKENDS['mongo']  # Default to MongoDB
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_STORAGE_BACKEND'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_STORAGE_BACKEND, str):
+            backend_path = STORAGE_BACKENDS.get(settings.DRF_ACTIVITY_TRACKER_STORAGE_BACKEND,
+                                                settings.DRF_ACTIVITY_TRACKER_STORAGE_BACKEND)
+    return backend_path
+
+
+def get_storage_backend():
+    """
+    Returns the storage backend of the process, built once from DRF_ACTIVITY_TRACKER_STORAGE_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                try:
+                    backend_class = import_string(get_storage_backend_path())
+                except ImportError:
+                    raise Exception("""
+                    DRF ACTIVITY TRACKER EXCEPTION
+                    Value of DRF_ACTIVITY_TRACKER_STORAGE_BACKEND must be 'mongo', 'memory', 'sqlite' or the dotted path of a BaseStorageBackend subclass
+                    """)
+                _backend = backend_class()
+    return _backend
+
+
+def reset_storage_backend():
+    """
+    Drops the backend of the process, the next call of get_storage_backend builds it from the settings again.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = None
@@ -0,0 +1,154 @@
+import operator
+from datetime import datetime, timezone
+
+
+class BaseStorageBackend:
+    """
+    Storage of the activity logs. Logs are dicts with an ObjectId `_id` and a `created_time`,
+    and filters are the Mongo style dicts built by MyCollection, ParamsHandler and create_time_delta_for_api,
+    so every backend answers the same queries as MongoDB.
+    """
+    name = None
+
+    # Backends without a rollup collection summarize the raw logs in aggregate().
+    supports_rollups = False
+
+    def save_many(self, logs, ordered=True):
+        """
+        Inserts the logs. A log whose _id is already stored is never inserted twice.
+        """
+        raise NotImplementedError
+
+    def list(self, user_id=None, url_name=None, status_code=None, time_delta=None, dataset_limit=0, skip=0,
+             after=None, before=None):
+        """
+        Returns logs from the newest, see MyCollection.list.
+        """
+        raise NotImplementedError
+
+    def count(self, user_id=None, url_name=None, status_code=None, time_delta=None, limit=None):
+        """
+        Counts the matching logs. With `limit`, counting stops after `limit` logs.
+        """
+        raise NotImplementedError
+
+    def api_list(self, user_id=None, time_delta=None, url_name=None, projection=None):
+        """
+        Returns a sliceable, countable sequence of logs for the history API.
+        """
+        raise NotImplementedError
+
+    def detail(self, pk):
+        raise NotImplementedError
+
+    def aggregate(self, time_delta=None, url_name=None, group_by='endpoint'):
+        """
+        Returns the rows of RollupCollection.summary.
+        """
+        raise NotImplementedError
+
+    def save_rollups(self, aggregator):
+        """
+        Writes the counters of a RollupAggregator, only called when supports_rollups is True.
+        """
+        return True
+
+    def check_indexes(self, create=False, ttl_seconds=None):
+        """
+        Returns the index report of IndexManager, or None if the backend has no indexes to check.
+        """
+        return None
+
+    def get_index_manager(self, ttl_seconds=None):
+        """
+        Returns the IndexManager of the logs, or None if the backend has no indexes to manage.
+        """
+        return None
+
+    def get_rollup_index_manager(self):
+        """
+        Returns the IndexManager of the rollups, or None if the backend has no indexes to manage.
+        """
+        return None
+
+    def close(self):
+        pass
+
+
+def to_utc(value):
+    """
+    Datetimes are compared as naive UTC, as MongoDB returns them.
+    """
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_stored_time(value):
+    """
+    Naive UTC with milliseconds, as MongoDB stores datetimes.
+    """
+    value = to_utc(value)
+    if isinstance(value, datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _in(value, operand):
+    return value in operand
+
+
+def _not_in(value, operand):
+    return value not in operand
+
+
+FILTER_OPERATORS = {
+    '$eq': operator.eq,
+    '$ne': operator.ne,
+    '$gt': operator.gt,
+    '$gte': operator.ge,
+    '$lt': operator.lt,
+    '$lte': operator.le,
+    '$in': _in,
+    '$nin': _not_in,
+}
+
+
+def match_filter(log, filter_params):
+    """
+    Tells if a log matches a Mongo style filter of FILTER_OPERATORS, $and and $or.
+    """
+    for field, condition in filter_params.items():
+        if field == '$and':
+            if not all(match_filter(log, item) for item in condition):
+                return False
+        elif field == '$or':
+            if not any(match_filter(log, item) for item in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            value = log.get(field)
+            for name, operand in condition.items():
+                if name not in FILTER_OPERATORS:
+                    raise Exception("""
+                    DRF ACTIVITY TRACKER EXCEPTION
+                    Filter operator {} is not supported by this storage backend
+                    """.format(name))
+                if name in ('$in', '$nin'):
+                    operand = [to_utc(item) for item in operand]
+                try:
+                    if not FILTER_OPERATORS[name](value, to_utc(operand)):
+                        return False
+                except TypeError:
+                    # Like MongoDB, values of other types never match a range.
+                    return False
+    return True
+
+
+def apply_projection(log, projection):
+    if not projection:
+        return log
+    # _id is returned unless excluded, like MongoDB does.
+    return {key: value for key, value in log.items()
+            if projection.get(key) or (key == '_id' and projection.get(key, 1))}
@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+
+from bson import ObjectId
+from django.conf import settings
+
+from drf_user_activity_tracker_mongodb.backends.base import BaseStorageBackend, apply_projection, match_filter, \
+    to_stored_time
+from drf_user_activity_tracker_mongodb.compression import decompress_log
+from drf_user_activity_tracker_mongodb.rollups import summarize_logs
+from drf_user_activity_tracker_mongodb.utils import MyCollection, get_api_limit
+
+
+def _get_sort_key(log):
+    return log['created_time'], log['_id']
+
+
+class MemoryBackend(BaseStorageBackend):
+    """
+    Keeps the logs of the process in memory, for tests and local development.
+    The oldest logs are dropped beyond DRF_ACTIVITY_TRACKER_MEMORY_MAX_SIZE.
+    """
+    name = 'memory'
+
+    def __init__(self, max_size=None):
+        if max_size is None:
+            max_size = 10000  # Default to 10000 logs
+            if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MEMORY_MAX_SIZE'):
+                if isinstance(settings.DRF_ACTIVITY_TRACKER_MEMORY_MAX_SIZE, int):
+                    max_size = settings.DRF_ACTIVITY_TRACKER_MEMORY_MAX_SIZE
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._logs = OrderedDict()
+
+    def save_many(self, logs, ordered=True):
+        with self._lock:
+            for log in logs:
+                log.setdefault('_id', ObjectId())
+                if log['_id'] in self._logs:
+                    continue
+                self._logs[log['_id']] = dict(log, created_time=to_stored_time(log.get('created_time')))
+            while len(self._logs) > self.max_size:
+                self._logs.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._logs.clear()
+
+    def _find(self, filter_params, reverse=True):
+        with self._lock:
+            logs = list(self._logs.values())
+        logs = [log for log in logs if log.get('created_time') is not None and match_filter(log, filter_params)]
+        logs.sort(key=_get_sort_key, reverse=reverse)
+        return logs
+
+    def list(self, user_id=None, url_name=None, status_code=None, time_delta=None, dataset_limit=0, skip=0,
+             after=None, before=None):
+        filter_params = MyCollection._get_filter_params(user_id=user_id, url_name=url_name,
+                                                        status_code=status_code, time_delta=time_delta)
+        reverse = True
+        if after:
+            filter_params = {'$and': [filter_params, MyCollection._get_cursor_filter(after, '$lt')]}
+        elif before:
+            filter_params = {'$and': [filter_params, MyCollection._get_cursor_filter(before, '$gt')]}
+            reverse = False
+
+        logs = self._find(filter_params, reverse=reverse)
+        logs = logs[skip:skip + dataset_limit] if dataset_limit else logs[skip:]
+        if before:
+            logs.reverse()
+        return [dict(log) for log in logs]
+
+    def count(self, user_id=None, url_name=None, status_code=None, time_delta=None, limit=None):
+        filter_params = MyCollection._get_filter_params(user_id=user_id, url_name=url_name,
+                                                        status_code=status_code, time_delta=time_delta)
+        count = len(self._find(filter_params))
+        return min(count, limit) if limit else count
+
+    def api_list(self, user_id=None, time_delta=None, url_name=None, projection=None):
+        filter_params = MyCollection._get_api_filter_params(user_id=user_id, time_delta=time_delta,
+                                                            url_name=url_name)
+        return [apply_projection(log, projection) for log in self._find(filter_params)[:get_api_limit()]]
+
+    def detail(self, pk):
+        try:
+            pk = ObjectId(pk)
+        except:
+            return None
+        log = self._logs.get(pk)
+        return decompress_log(dict(log)) if log is not None else None
+
+    def aggregate(self, time_delta=None, url_name=None, group_by='endpoint'):
+        filter_params = {}
+        if time_delta:
+            filter_params.update({'created_time': time_delta})
+        if url_name:
+            filter_params.update({'url_name': url_name})
+        return summarize_logs(self._find(filter_params), group_by=group_by)
@@ -0,0 +1,57 @@
+from drf_user_activity_tracker_mongodb.backends.base import BaseStorageBackend
+from drf_user_activity_tracker_mongodb.indexes import IndexManager
+from drf_user_activity_tracker_mongodb.rollups import ROLLUP_INDEXES, RollupCollection, rollups_enabled
+from drf_user_activity_tracker_mongodb.utils import MyCollection, get_write_concern
+
+
+class MongoBackend(BaseStorageBackend):
+    """
+    The default backend, logs are stored in DRF_ACTIVITY_TRACKER_MONGO_DB_COLLECTION_NAME.
+    Collections come from the shared client registry, so creating them per call is cheap.
+    """
+    name = 'mongo'
+    supports_rollups = True
+
+    def __init__(self):
+        self.write_concern = get_write_concern()
+
+    def save_many(self, logs, ordered=True):
+        MyCollection().save(logs, ordered=ordered, write_concern=self.write_concern)
+
+    def list(self, user_id=None, url_name=None, status_code=None, time_delta=None, dataset_limit=0, skip=0,
+             after=None, before=None):
+        return MyCollection().list(user_id=user_id, url_name=url_name, status_code=status_code,
+                                   time_delta=time_delta, dataset_limit=dataset_limit, skip=skip, after=after,
+                                   before=before)
+
+    def count(self, user_id=None, url_name=None, status_code=None, time_delta=None, limit=None):
+        return MyCollection().data_count(user_id=user_id, url_name=url_name, status_code=status_code,
+                                         time_delta=time_delta, limit=limit)
+
+    def api_list(self, user_id=None, time_delta=None, url_name=None, projection=None):
+        return MyCollection().api_list(user_id=user_id, time_delta=time_delta, url_name=url_name,
+                                       projection=projection)
+
+    def detail(self, pk):
+        return MyCollection().detail(pk)
+
+    def aggregate(self, time_delta=None, url_name=None, group_by='endpoint'):
+        return RollupCollection().summary(time_delta=time_delta, url_name=url_name, group_by=group_by)
+
+    def save_rollups(self, aggregator):
+        return aggregator.flush(RollupCollection().collection)
+
+    def check_indexes(self, create=False, ttl_seconds=None):
+        manager = self.get_index_manager(ttl_seconds=ttl_seconds)
+        if create:
+            manager.create_missing_indexes()
+            manager.apply_ttl()
+            if rollups_enabled():
+                self.get_rollup_index_manager().create_missing_indexes()
+        return manager.get_report()
+
+    def get_index_manager(self, ttl_seconds=None):
+        return IndexManager(MyCollection().collection, ttl_seconds=ttl_seconds)
+
+    def get_rollup_index_manager(self):
+        return IndexManager(RollupCollection().collection, indexes=ROLLUP_INDEXES)
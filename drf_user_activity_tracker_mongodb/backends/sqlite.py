@@ -0,0 +1,292 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import bson
+from bson import ObjectId
+from django.conf import settings
+
+from drf_user_activity_tracker_mongodb.backends.base import BaseStorageBackend, apply_projection, to_stored_time, \
+    to_utc
+from drf_user_activity_tracker_mongodb.compression import decompress_log
+from drf_user_activity_tracker_mongodb.rollups import LATENCY_BUCKETS, get_summary_row
+from drf_user_activity_tracker_mongodb.utils import LogQuerySet, MyCollection, get_api_limit
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+MINUTE_FORMAT = '%Y-%m-%d %H:%M'
+
+# Fields of the log copied into columns, so they can be filtered and sorted.
+COLUMNS = {
+    '_id': 'id',
+    'created_time': 'created_time',
+    'user_id': 'user_id',
+    'url_name': 'url_name',
+    'status_code': 'status_code',
+}
+
+SQL_OPERATORS = {'$eq': '=', '$ne': '!=', '$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS activity_log (
+        id TEXT PRIMARY KEY,
+        created_time TEXT NOT NULL,
+        user_id,
+        url_name TEXT,
+        status_code INTEGER,
+        method TEXT,
+        execution_time REAL,
+        sample_weight REAL,
+        document BLOB NOT NULL
+    )""",
+    'CREATE INDEX IF NOT EXISTS activity_log_created_time ON activity_log (created_time DESC, id DESC)',
+    'CREATE INDEX IF NOT EXISTS activity_log_user_id ON activity_log (user_id, created_time DESC, id DESC)',
+    'CREATE INDEX IF NOT EXISTS activity_log_url_name ON activity_log (url_name, created_time DESC, id DESC)',
+]
+
+
+def _to_column(field, value):
+    value = to_utc(value)
+    if field == 'created_time':
+        return value.strftime(TIME_FORMAT)
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    # ObjectId and other user ids are compared as strings.
+    return str(value)
+
+
+def _to_number(value):
+    # Summaries count numbers only, like RollupAggregator.
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _get_summary_columns():
+    """
+    Returns the SQL of the RollupAggregator counters, the histogram buckets are named histogram_<index>.
+    """
+    columns = [
+        'COUNT(*) AS count',
+        'TOTAL(COALESCE(sample_weight, 1)) AS weighted_count',
+        "COUNT(CASE WHEN typeof(status_code) = 'integer' AND status_code >= 500 THEN 1 END) AS error_count",
+        'TOTAL(execution_time) AS execution_time_sum',
+        'MIN(execution_time) AS execution_time_min',
+        'MAX(execution_time) AS execution_time_max',
+    ]
+    # Same buckets as bisect_left: a bucket holds the times above the previous bound, up to its own.
+    bounds = [None] + LATENCY_BUCKETS + [None]
+    for index, (lower, upper) in enumerate(zip(bounds, bounds[1:])):
+        conditions = []
+        if lower is not None:
+            conditions.append('execution_time > {!r}'.format(lower))
+        if upper is not None:
+            conditions.append('execution_time <= {!r}'.format(upper))
+        columns.append('COUNT(CASE WHEN {} THEN 1 END) AS histogram_{}'.format(' AND '.join(conditions), index))
+    return columns
+
+
+SUMMARY_COLUMNS = _get_summary_columns()
+
+
+class SQLiteQuerySet(LogQuerySet):
+    """
+    LogQuerySet of a SQLite query, slices run with LIMIT and OFFSET.
+    """
+
+    def __init__(self, backend, where, params, projection=None, max_size=None):
+        super().__init__(None, None, projection=projection, max_size=max_size)
+        self.backend = backend
+        self.where = where
+        self.params = params
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend._count(self.where, self.params, limit=self.max_size)
+        return self._count
+
+    def _fetch(self, start, stop):
+        logs = self.backend._select(self.where, self.params, limit=None if stop is None else stop - start,
+                                    offset=start)
+        return [apply_projection(log, self.projection) for log in logs]
+
+
+class SQLiteBackend(BaseStorageBackend):
+    """
+    Stores the logs in a SQLite database, a single file at DRF_ACTIVITY_TRACKER_SQLITE_PATH.
+    Logs are kept whole as BSON, with the filtered fields copied into indexed columns.
+    Every thread, and every forked process, opens its own connection.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path=None):
+        if path is None:
+            path = 'activity_log.sqlite3'  # Default to a file in the working directory
+            if hasattr(settings, 'DRF_ACTIVITY_TRACKER_SQLITE_PATH'):
+                if isinstance(settings.DRF_ACTIVITY_TRACKER_SQLITE_PATH, str):
+                    path = settings.DRF_ACTIVITY_TRACKER_SQLITE_PATH
+        self.path = path
+        self._local = threading.local()
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            if self.path != ':memory:':
+                # Readers don't wait for the writer thread.
+                connection.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+        self._local.connection = None
+
+    def save_many(self, logs, ordered=True):
+        rows = []
+        for log in logs:
+            log.setdefault('_id', ObjectId())
+            # The caller's log is left as it is, only the stored copy has the stored time.
+            created_time = to_stored_time(log['created_time'])
+            rows.append((str(log['_id']), _to_column('created_time', created_time),
+                         _to_column('user_id', log.get('user_id')), log.get('url_name'), log.get('status_code'),
+                         log.get('method'), _to_number(log.get('execution_time')),
+                         _to_number(log.get('sample_weight')), bson.encode(dict(log, created_time=created_time))))
+
+        connection = self._get_connection()
+        with connection:
+            # A log replayed from the journal is already there.
+            connection.executemany('INSERT OR IGNORE INTO activity_log '
+                                   '(id, created_time, user_id, url_name, status_code, method, execution_time, '
+                                   'sample_weight, document) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def _get_where(self, filter_params, params):
+        clauses = []
+        for field, condition in filter_params.items():
+            if field in ('$and', '$or'):
+                parts = [self._get_where(item, params) for item in condition]
+                clauses.append('({})'.format((' AND ' if field == '$and' else ' OR ').join(parts) or '1'))
+                continue
+
+            column = COLUMNS.get(field)
+            if column is None:
+                raise Exception("""
+                DRF ACTIVITY TRACKER EXCEPTION
+                Field {} can't be filtered by the sqlite storage backend
+                """.format(field))
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+
+            for name, operand in condition.items():
+                if name in ('$in', '$nin'):
+                    operand = [_to_column(field, item) for item in operand]
+                    placeholders = ', '.join('?' * len(operand))
+                    if name == '$in':
+                        clauses.append('{} IN ({})'.format(column, placeholders) if operand else '0')
+                    else:
+                        # Like MongoDB, a missing value is not in the list.
+                        clauses.append('({} IS NULL OR {} NOT IN ({}))'.format(column, column, placeholders)
+                                       if operand else '1')
+                    params.extend(operand)
+                elif name in SQL_OPERATORS:
+                    if operand is None and name in ('$eq', '$ne'):
+                        clauses.append('{} IS {}NULL'.format(column, '' if name == '$eq' else 'NOT '))
+                    else:
+                        clauses.append('{} {} ?'.format(column, SQL_OPERATORS[name]))
+                        params.append(_to_column(field, operand))
+                else:
+                    raise Exception("""
+                    DRF ACTIVITY TRACKER EXCEPTION
+                    Filter operator {} is not supported by the sqlite storage backend
+                    """.format(name))
+        return ' AND '.join(clauses) or '1'
+
+    def _select(self, where, params, ascending=False, limit=None, offset=0):
+        direction = 'ASC' if ascending else 'DESC'
+        query = 'SELECT document FROM activity_log WHERE {} ORDER BY created_time {}, id {} LIMIT ? OFFSET ?'.format(
+            where, direction, direction)
+        rows = self._get_connection().execute(query, params + [-1 if limit is None else limit, offset])
+        return [bson.decode(document) for document, in rows]
+
+    def _count(self, where, params, limit=None):
+        if limit:
+            query = 'SELECT COUNT(*) FROM (SELECT 1 FROM activity_log WHERE {} LIMIT ?)'.format(where)
+            params = params + [limit]
+        else:
+            query = 'SELECT COUNT(*) FROM activity_log WHERE {}'.format(where)
+        return self._get_connection().execute(query, params).fetchone()[0]
+
+    def list(self, user_id=None, url_name=None, status_code=None, time_delta=None, dataset_limit=0, skip=0,
+             after=None, before=None):
+        filter_params = MyCollection._get_filter_params(user_id=user_id, url_name=url_name,
+                                                        status_code=status_code, time_delta=time_delta)
+        if after:
+            filter_params = {'$and': [filter_params, MyCollection._get_cursor_filter(after, '$lt')]}
+        elif before:
+            filter_params = {'$and': [filter_params, MyCollection._get_cursor_filter(before, '$gt')]}
+
+        params = []
+        where = self._get_where(filter_params, params)
+        logs = self._select(where, params, ascending=bool(before), limit=dataset_limit or None, offset=skip)
+        if before:
+            logs.reverse()
+        return logs
+
+    def count(self, user_id=None, url_name=None, status_code=None, time_delta=None, limit=None):
+        filter_params = MyCollection._get_filter_params(user_id=user_id, url_name=url_name,
+                                                        status_code=status_code, time_delta=time_delta)
+        params = []
+        return self._count(self._get_where(filter_params, params), params, limit=limit)
+
+    def api_list(self, user_id=None, time_delta=None, url_name=None, projection=None):
+        filter_params = MyCollection._get_api_filter_params(user_id=user_id, time_delta=time_delta,
+                                                            url_name=url_name)
+        params = []
+        return SQLiteQuerySet(self, self._get_where(filter_params, params), params, projection=projection,
+                              max_size=get_api_limit())
+
+    def detail(self, pk):
+        try:
+            pk = ObjectId(pk)
+        except:
+            return None
+        logs = self._select('id = ?', [str(pk)], limit=1)
+        return decompress_log(logs[0]) if logs else None
+
+    def aggregate(self, time_delta=None, url_name=None, group_by='endpoint'):
+        """
+        Same rows as RollupCollection.summary, counted by SQLite with GROUP BY on the columns.
+        """
+        filter_params = {}
+        if time_delta:
+            filter_params.update({'created_time': time_delta})
+        if url_name:
+            filter_params.update({'url_name': url_name})
+        params = []
+        where = self._get_where(filter_params, params)
+
+        if group_by == 'minute':
+            keys = ['substr(created_time, 1, 16) AS minute']
+            group, order = 'minute', 'minute ASC'
+        else:
+            keys = ['url_name', 'method',
+                    "CASE WHEN typeof(status_code) = 'integer' THEN (status_code / 100) || 'xx' END AS status_class"]
+            group, order = 'url_name, method, status_class', 'count DESC'
+        query = 'SELECT {} FROM activity_log WHERE {} GROUP BY {} ORDER BY {}'.format(
+            ', '.join(keys + SUMMARY_COLUMNS), where, group, order)
+
+        cursor = self._get_connection().execute(query, params)
+        names = [column[0] for column in cursor.description]
+        summary = []
+        for values in cursor:
+            row = dict(zip(names, values))
+            histogram = [row.pop('histogram_{}'.format(index)) for index in range(len(LATENCY_BUCKETS) + 1)]
+            if group_by == 'minute':
+                key = datetime.strptime(row.pop('minute'), MINUTE_FORMAT)
+            else:
+                key = {name: row.pop(name) for name in ['url_name', 'method', 'status_class']}
+            summary.append(get_summary_row(row, key, histogram, group_by))
+        return summary
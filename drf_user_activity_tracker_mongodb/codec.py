@@ -0,0 +1,105 @@
+import json
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Install drf-user-activity-tracker-mongodb[orjson] for orjson
+    orjson = None
+
+
+class StdlibJSONCodec:
+    """
+    Codec of the json module, values it doesn't know are encoded as DRF renders them.
+    """
+    name = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, data, indent=False):
+        """
+        Returns data encoded as UTF-8 JSON bytes.
+        """
+        if indent:
+            return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, indent=2).encode('utf-8')
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonCodec(StdlibJSONCodec):
+    """
+    Codec of orjson. Dates are left to the DRF encoder so both codecs give the same output,
+    and data orjson rejects (e.g. NaN or integers above 64 bits) falls back to the json module.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        self._default = JSONEncoder().default
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return super().loads(data)
+
+    def dumps(self, data, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(data, default=self._default, option=option)
+        except TypeError:
+            return super().dumps(data, indent=indent)
+
+
+JSON_CODECS = {'json': StdlibJSONCodec()}
+if orjson is not None:
+    JSON_CODECS['orjson'] = OrjsonCodec()
+
+
+def get_json_codec():
+    codec = 'auto'  # Default to orjson when it is installed
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_JSON_CODEC'):
+        codec = settings.DRF_ACTIVITY_TRACKER_JSON_CODEC
+
+    if codec == 'auto':
+        codec = 'orjson' if orjson is not None else 'json'
+    if codec == 'orjson' and orjson is None:
+        raise Exception("""
+        DRF ACTIVITY TRACKER EXCEPTION
+        DRF_ACTIVITY_TRACKER_JSON_CODEC is 'orjson' but the orjson package is not installed
+        """)
+    if codec not in JSON_CODECS:
+        raise Exception("""
+        DRF ACTIVITY TRACKER EXCEPTION
+        Value of DRF_ACTIVITY_TRACKER_JSON_CODEC must be 'orjson', 'json' or 'auto'
+        """)
+    return JSON_CODECS[codec]
+
+
+class ActivityJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer of the history views, compact responses are encoded by the JSON codec.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        codec = get_json_codec()
+        if codec.name == 'json' or self.get_indent(accepted_media_type, renderer_context) or self.ensure_ascii or \
+                not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Escaped like DRF does, they are not valid in javascript strings.
+        return codec.dumps(data).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def get_renderer_classes():
+    """
+    Renderers of the project, with ActivityJSONRenderer in place of DRF's JSONRenderer.
+    """
+    return [ActivityJSONRenderer if renderer is JSONRenderer else renderer
+            for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
@@ -0,0 +1,157 @@
+import threading
+import zlib
+
+import bson
+import bson.errors
+from bson.binary import Binary
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # Install drf-user-activity-tracker-mongodb[zstd] for zstd
+    zstandard = None
+
+COMPRESSED_KEY = '_compressed'
+
+COMPRESSED_FIELDS = ['body', 'response', 'headers']
+
+
+def is_compressed(value):
+    return isinstance(value, dict) and COMPRESSED_KEY in value and 'data' in value
+
+
+class FieldCompressor:
+    """
+    Stores large fields of a log as compressed BSON blobs:
+    {"_compressed": <codec>, "size": <raw size>, "data": <compressed bytes>}.
+    Fields smaller than `threshold` bytes are kept as they are.
+    """
+
+    def __init__(self, codec='zlib', threshold=1024, level=None, fields=None):
+        if codec == 'auto':
+            codec = 'zstd' if zstandard is not None else 'zlib'
+        if codec == 'zstd' and zstandard is None:
+            raise Exception("""
+            DRF ACTIVITY TRACKER EXCEPTION
+            DRF_ACTIVITY_TRACKER_COMPRESSION is 'zstd' but the zstandard package is not installed
+            """)
+        if codec not in ('zlib', 'zstd'):
+            raise Exception("""
+            DRF ACTIVITY TRACKER EXCEPTION
+            Value of DRF_ACTIVITY_TRACKER_COMPRESSION must be 'zlib', 'zstd' or 'auto'
+            """)
+
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+        self.fields = COMPRESSED_FIELDS if fields is None else fields
+
+        self.compressed_count = 0
+        self.raw_size = 0
+        self.compressed_size = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _compress(self, data):
+        if self.codec == 'zstd':
+            # Compressors are not thread safe, each thread keeps its own.
+            compressor = getattr(self._local, 'compressor', None)
+            if compressor is None:
+                compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level or 3)
+            return compressor.compress(data)
+        return zlib.compress(data, 6 if self.level is None else self.level)
+
+    def compress_log(self, log):
+        """
+        Compresses the large fields of the log in place.
+        """
+        raw_size, compressed_size, compressed_count = 0, 0, 0
+        for field in self.fields:
+            value = log.get(field)
+            if not value or is_compressed(value):
+                continue
+            try:
+                # Values are wrapped because BSON documents must be dicts.
+                data = bson.encode({'v': value})
+            except (bson.errors.InvalidDocument, OverflowError):
+                # Left as is, the insertion reports the error.
+                continue
+            if len(data) < self.threshold:
+                continue
+
+            compressed = self._compress(data)
+            if len(compressed) >= len(data):
+                continue
+            log[field] = {COMPRESSED_KEY: self.codec, 'size': len(data), 'data': Binary(compressed)}
+            raw_size += len(data)
+            compressed_size += len(compressed)
+            compressed_count += 1
+
+        if compressed_count:
+            with self._lock:
+                self.raw_size += raw_size
+                self.compressed_size += compressed_size
+                self.compressed_count += compressed_count
+        return log
+
+    def get_stats(self):
+        return {
+            'codec': self.codec,
+            'threshold': self.threshold,
+            'compressed_count': self.compressed_count,
+            'raw_size': self.raw_size,
+            'compressed_size': self.compressed_size,
+            'compression_ratio': self.raw_size / self.compressed_size if self.compressed_size else None,
+        }
+
+
+def decompress_value(value):
+    if not is_compressed(value):
+        return value
+
+    codec, data = value[COMPRESSED_KEY], bytes(value['data'])
+    if codec == 'zstd':
+        if zstandard is None:
+            return '** Compressed with zstd, install zstandard to read it **'
+        data = zstandard.ZstdDecompressor().decompress(data, max_output_size=value.get('size', 0))
+    else:
+        data = zlib.decompress(data)
+    return bson.decode(data)['v']
+
+
+def decompress_log(log):
+    """
+    Decompresses the compressed fields of a log read from the database, in place.
+    """
+    if log is None:
+        return log
+    for field, value in log.items():
+        if is_compressed(value):
+            log[field] = decompress_value(value)
+    return log
+
+
+def get_field_compressor():
+    codec = None  # Fields are not compressed by default
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_COMPRESSION'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_COMPRESSION, str):
+            codec = settings.DRF_ACTIVITY_TRACKER_COMPRESSION
+    if codec is None:
+        return None
+
+    threshold = 1024  # Default to 1 KB
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_COMPRESSION_THRESHOLD'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_COMPRESSION_THRESHOLD, int):
+            threshold = settings.DRF_ACTIVITY_TRACKER_COMPRESSION_THRESHOLD
+
+    level = None
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_COMPRESSION_LEVEL'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_COMPRESSION_LEVEL, int):
+            level = settings.DRF_ACTIVITY_TRACKER_COMPRESSION_LEVEL
+
+    fields = None
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_COMPRESSION_FIELDS'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_COMPRESSION_FIELDS, (list, tuple)):
+            fields = list(settings.DRF_ACTIVITY_TRACKER_COMPRESSION_FIELDS)
+
+    return FieldCompressor(codec=codec, threshold=threshold, level=level, fields=fields)
@@ -1,3 +1,14 @@
+import atexit
+import logging
+import os
+import threading
+import time
+import weakref
+from queue import Queue, Empty, Full
+
+logger = logging.getLogger('error')
+
+
 class EventsException(Exception):
     pass
 
@@ -67,15 +78,30 @@ class Events:
 class _EventSlot:
     def __init__(self, name):
         self.targets = []
+        self.dispatcher = None
         self.__name__ = name
 
     def __repr__(self):
         return "event '%s'" % self.__name__
 
     def __call__(self, *a, **kw):
+        if self.dispatcher is not None:
+            self.dispatcher.submit(self, a, kw)
+            return
+
         for f in tuple(self.targets):
             f(*a, **kw)
 
+    def set_dispatcher(self, dispatcher):
+        """
+        Fires the targets through the dispatcher instead of the calling thread.
+        Pass None to go back to synchronous firing.
+        """
+        previous, self.dispatcher = self.dispatcher, dispatcher
+        for target in tuple(self.targets):
+            if isinstance(target, BatchListener) and previous is not None and target.dispatcher is previous:
+                target.set_dispatcher(None)
+
     def __iadd__(self, f):
         self.targets.append(f)
         return self
@@ -97,3 +123,268 @@ class _EventSlot:
 
     def __getitem__(self, key):
         return self.targets[key]
+
+
+_BATCH_LISTENERS = weakref.WeakSet()
+
+
+class BatchListener:
+    """
+    Wraps a listener that receives lists of events (the kwargs of each call)
+    instead of one event per call. A batch is delivered when it reaches
+    `batch_size` events, or `max_wait` seconds after its first event, even
+    if no other event comes. Due batches are delivered by the workers of the
+    EventDispatcher firing the listener, or by a timer without one.
+    Pending batches are delivered on exit.
+    """
+
+    def __init__(self, func, batch_size=100, max_wait=1.0):
+        self.func = func
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.__name__ = getattr(func, '__name__', repr(func))
+        self._events = []
+        self._first_event_time = None
+        self._lock = threading.Lock()
+        self._timer = None
+        self._timer_pid = None
+        self.dispatcher = None
+        _BATCH_LISTENERS.add(self)
+
+    def __repr__(self):
+        return "batch listener '%s'" % self.__name__
+
+    def __call__(self, *a, **kw):
+        with self._lock:
+            if not self._events:
+                self._first_event_time = time.monotonic()
+                if self.dispatcher is None:
+                    self._start_timer(self.max_wait)
+            self._events.append(kw)
+            is_full = len(self._events) >= self.batch_size
+        if is_full or self.is_due():
+            self.flush()
+
+    def get_due_time(self):
+        """
+        Returns the time.monotonic() time at which the pending batch is due, or None without pending batch.
+        """
+        first_event_time = self._first_event_time
+        return None if first_event_time is None else first_event_time + self.max_wait
+
+    def is_due(self):
+        due_time = self.get_due_time()
+        return due_time is not None and time.monotonic() >= due_time
+
+    def set_dispatcher(self, dispatcher):
+        """
+        Lets the workers of `dispatcher` deliver due batches. Pass None to go back to a timer.
+        """
+        with self._lock:
+            self.dispatcher = dispatcher
+            if dispatcher is None and self._first_event_time is not None:
+                self._start_timer(max(0, self.get_due_time() - time.monotonic()))
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+            self._first_event_time = None
+        if events:
+            self.func(events)
+
+    def _start_timer(self, wait):
+        """
+        Starts the timer of the due batch, one at a time per process. Called with the lock held.
+        """
+        # Timers don't survive os.fork, a forked process starts its own.
+        if self._timer is not None and self._timer_pid == os.getpid():
+            return
+        self._timer = threading.Timer(wait, self._on_timer)
+        self._timer.daemon = True
+        self._timer_pid = os.getpid()
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            if self._first_event_time is None:
+                return
+            # The batch that started the timer was already delivered, wait for the current one.
+            wait = self.max_wait - (time.monotonic() - self._first_event_time)
+            if wait > 0:
+                if self.dispatcher is None:
+                    self._start_timer(wait)
+                return
+        self.safe_flush()
+
+    def safe_flush(self):
+        """
+        Delivers the pending batch outside of a request, failures are logged.
+        """
+        try:
+            self.flush()
+        except Exception as e:
+            message = "DRF ACTIVITY TRACKER SIGNAL EXCEPTION: {}: {}, {}".format(self, str(e), type(e))
+            logger.error(message)
+
+
+def flush_batch_listeners():
+    """
+    Delivers the pending batches of every batch listener.
+    """
+    for listener in list(_BATCH_LISTENERS):
+        listener.safe_flush()
+
+
+atexit.register(flush_batch_listeners)
+
+
+class EventDispatcher:
+    """
+    Fires event slots on a bounded pool of worker threads.
+    When the queue is full, the caller waits at most `block_timeout` seconds
+    before the event is dropped. A failing listener never affects the caller
+    or the other listeners, and calls, failures and timing are recorded per listener.
+    """
+
+    def __init__(self, workers=2, max_size=1000, block_timeout=0):
+        self.workers = workers
+        self.max_size = max_size
+        self.block_timeout = block_timeout
+        self.dropped_count = 0
+        self._queue = Queue(maxsize=max_size)
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._listener_stats = {}
+        self._slots = set()
+
+    def submit(self, slot, args, kwargs):
+        self._start_workers()
+        self._slots.add(slot)
+        try:
+            if self.block_timeout:
+                self._queue.put((slot, args, kwargs), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((slot, args, kwargs))
+        except Full:
+            self.dropped_count += 1
+
+    def _start_workers(self):
+        # Threads don't survive os.fork, each process starts its own workers.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = Queue(maxsize=self.max_size)
+            self._threads = []
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name='activity_tracker_signal_{}'.format(index))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._get_flush_wait())
+            except Empty:
+                self._flush_due_batches()
+                continue
+
+            if item is None:
+                self._queue.task_done()
+                return
+
+            slot, args, kwargs = item
+            for target in tuple(slot.targets):
+                if isinstance(target, BatchListener) and target.dispatcher is not self:
+                    # The workers deliver its due batches, the listener needs no timer.
+                    target.set_dispatcher(self)
+                self._call_target(target, target, args, kwargs)
+            self._queue.task_done()
+            # A steady stream of other events doesn't hold due batches back.
+            if not self._get_flush_wait():
+                self._flush_due_batches()
+
+    def _get_flush_wait(self):
+        """
+        Returns how long a worker may wait for an event before a pending batch is due, at most 0.5 seconds.
+        """
+        wait = 0.5
+        now = time.monotonic()
+        for target in self._batch_listeners():
+            due_time = target.get_due_time()
+            if due_time is not None:
+                wait = min(wait, max(0, due_time - now))
+        return wait
+
+    def _batch_listeners(self):
+        for slot in tuple(self._slots):
+            for target in tuple(slot.targets):
+                if isinstance(target, BatchListener):
+                    yield target
+
+    def _flush_due_batches(self):
+        for target in self._batch_listeners():
+            if target.is_due():
+                self._call_target(target, target.flush, (), {})
+
+    def _call_target(self, target, func, args, kwargs):
+        start_time = time.perf_counter()
+        failed = False
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            failed = True
+            message = "DRF ACTIVITY TRACKER SIGNAL EXCEPTION: {}: {}, {}".format(target, str(e), type(e))
+            logger.error(message)
+        duration = time.perf_counter() - start_time
+
+        with self._stats_lock:
+            stats = self._listener_stats.get(target)
+            if stats is None:
+                stats = self._listener_stats[target] = {
+                    'calls': 0, 'failures': 0, 'total_time': 0.0, 'max_time': 0.0,
+                }
+            stats['calls'] += 1
+            stats['failures'] += failed
+            stats['total_time'] += duration
+            stats['max_time'] = max(stats['max_time'], duration)
+
+    def shutdown(self, timeout=5):
+        """
+        Waits up to `timeout` seconds for queued events, then delivers pending batches.
+        """
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=max(0, deadline - time.monotonic()))
+            except Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout=max(0, deadline - time.monotonic()))
+        self._pid = None
+        for target in self._batch_listeners():
+            self._call_target(target, target.flush, (), {})
+            if target.dispatcher is self:
+                target.set_dispatcher(None)
+
+    def get_stats(self):
+        with self._stats_lock:
+            listeners = {
+                getattr(target, '__name__', repr(target)): dict(
+                    stats, average_time=stats['total_time'] / stats['calls'] if stats['calls'] else 0.0)
+                for target, stats in self._listener_stats.items()
+            }
+        return {
+            'queue_size': self._queue.qsize(),
+            'max_size': self.max_size,
+            'dropped_count': self.dropped_count,
+            'listeners': listeners,
+        }
@@ -0,0 +1,102 @@
+from django.conf import settings
+
+from drf_user_activity_tracker_mongodb.redaction import FILTERED_MARKER, TRUNCATED_MARKER, get_redaction_plan
+
+
+def to_meta_key(name):
+    """
+    Returns the request.META key of a header given as 'User-Agent', 'user_agent' or 'HTTP_USER_AGENT'.
+    """
+    key = name.upper().replace('-', '_')
+    return key if key.startswith('HTTP_') else 'HTTP_' + key
+
+
+class HeaderPolicy:
+    """
+    Captures the request headers in one pass over request.META, compiled once from settings.
+    With `include`, only these headers are looked up, otherwise every header but `exclude` is kept.
+    Values are cut to their max length and hidden by the redaction plan, headers are stored
+    under their request.META name without the HTTP_ prefix, e.g. USER_AGENT.
+    """
+    NAME_CACHE_SIZE = 1024
+
+    def __init__(self, include=None, exclude=(), max_length=None, max_lengths=None, redaction_plan=None):
+        self.max_length = max_length
+        self.max_lengths = {to_meta_key(name): length for name, length in (max_lengths or {}).items()}
+        self.exclude = frozenset(to_meta_key(name) for name in exclude)
+        self.redaction_plan = redaction_plan
+        self.include = None
+        if include is not None:
+            keys = dict.fromkeys(to_meta_key(name) for name in include)
+            self.include = [(key,) + self._get_rule(key) for key in keys if key not in self.exclude]
+        self._rules = {}
+
+    def _get_rule(self, key):
+        """
+        Returns (name, max_length, sensitive) of a request.META key, or False if it is not captured.
+        """
+        if not key.startswith('HTTP_') or key in self.exclude:
+            return False
+        name = key[5:]
+        sensitive = self.redaction_plan is not None and self.redaction_plan.is_sensitive_key(name)
+        return name, self.max_lengths.get(key, self.max_length), sensitive
+
+    def _capture_value(self, value, max_length, sensitive):
+        if sensitive:
+            return FILTERED_MARKER
+        if not isinstance(value, str):
+            value = str(value)
+        if max_length is not None and len(value) > max_length:
+            value = value[:max_length] + TRUNCATED_MARKER
+        if self.redaction_plan is not None:
+            value = self.redaction_plan.redact(value)
+        return value
+
+    def capture(self, meta):
+        headers = {}
+        if self.include is not None:
+            for key, name, max_length, sensitive in self.include:
+                value = meta.get(key)
+                if value is not None:
+                    headers[name] = self._capture_value(value, max_length, sensitive)
+            return headers
+
+        rules = self._rules
+        for key, value in meta.items():
+            rule = rules.get(key)
+            if rule is None:
+                rule = self._get_rule(key)
+                # Clients choose the header names, so the cache is bounded.
+                if len(rules) < self.NAME_CACHE_SIZE:
+                    rules[key] = rule
+            if rule is False:
+                continue
+            name, max_length, sensitive = rule
+            headers[name] = self._capture_value(value, max_length, sensitive)
+        return headers
+
+
+def build_header_policy():
+    include = None  # Default to every header
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_HEADERS_INCLUDE'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_HEADERS_INCLUDE, (list, tuple)):
+            include = settings.DRF_ACTIVITY_TRACKER_HEADERS_INCLUDE
+
+    exclude = ['Cookie']  # Default to every header but cookies
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_HEADERS_EXCLUDE'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_HEADERS_EXCLUDE, (list, tuple)):
+            exclude = settings.DRF_ACTIVITY_TRACKER_HEADERS_EXCLUDE
+
+    max_length = 1024  # Default to 1024 characters per header
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_HEADER_MAX_LENGTH'):
+        if settings.DRF_ACTIVITY_TRACKER_HEADER_MAX_LENGTH is None or \
+                isinstance(settings.DRF_ACTIVITY_TRACKER_HEADER_MAX_LENGTH, int):
+            max_length = settings.DRF_ACTIVITY_TRACKER_HEADER_MAX_LENGTH
+
+    max_lengths = {}
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_HEADER_MAX_LENGTHS'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_HEADER_MAX_LENGTHS, dict):
+            max_lengths = settings.DRF_ACTIVITY_TRACKER_HEADER_MAX_LENGTHS
+
+    return HeaderPolicy(include=include, exclude=exclude, max_length=max_length, max_lengths=max_lengths,
+                        redaction_plan=get_redaction_plan())
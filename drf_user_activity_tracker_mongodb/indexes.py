@@ -0,0 +1,131 @@
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING
+
+# Indexes matching the filters and the sort of MyCollection queries:
+# equality fields first, then the (created_time, _id) sort, then ranges.
+ACTIVITY_LOG_INDEXES = [
+    # Unfiltered lists, created_time ranges and status_code filters.
+    [('created_time', DESCENDING), ('_id', DESCENDING)],
+    # User history and admin search by user id.
+    [('user_id', ASCENDING), ('created_time', DESCENDING), ('_id', DESCENDING)],
+    # Admin filter by url name, with or without status code.
+    [('url_name', ASCENDING), ('created_time', DESCENDING), ('_id', DESCENDING), ('status_code', ASCENDING)],
+    # Admin history filtered by both user id and url name.
+    [('user_id', ASCENDING), ('url_name', ASCENDING), ('created_time', DESCENDING), ('_id', DESCENDING)],
+]
+
+# TTL indexes must be single field indexes. It only exists when DRF_ACTIVITY_TRACKER_TTL_SECONDS is set.
+TTL_INDEX_KEYS = [('created_time', ASCENDING)]
+
+
+def get_index_name(keys):
+    return '_'.join('{}_{}'.format(field, direction) for field, direction in keys)
+
+
+def get_ttl_seconds():
+    ttl_seconds = None  # Logs are kept forever by default
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_TTL_SECONDS'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_TTL_SECONDS, int):
+            ttl_seconds = settings.DRF_ACTIVITY_TRACKER_TTL_SECONDS
+    return ttl_seconds
+
+
+class IndexManager:
+    """
+    Creates and verifies the indexes of the activity log collection.
+    """
+
+    def __init__(self, collection, ttl_seconds=None, indexes=None):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.indexes = ACTIVITY_LOG_INDEXES if indexes is None else indexes
+
+    def _get_existing_indexes(self):
+        return {name: info for name, info in self.collection.index_information().items() if name != '_id_'}
+
+    @staticmethod
+    def _find_index(existing_indexes, keys):
+        for name, info in existing_indexes.items():
+            # Directions are floats in indexes created from the mongo shell.
+            if [(field, int(direction) if isinstance(direction, float) else direction)
+                    for field, direction in info['key']] == keys:
+                return name, info
+        return None, None
+
+    def get_report(self):
+        existing_indexes = self._get_existing_indexes()
+
+        missing, expected_names = [], set()
+        for keys in self.indexes:
+            name, info = self._find_index(existing_indexes, keys)
+            if name is None:
+                missing.append(get_index_name(keys))
+            else:
+                expected_names.add(name)
+
+        ttl_name, ttl_info = self._find_index(existing_indexes, TTL_INDEX_KEYS)
+        current_ttl_seconds = None
+        if ttl_name is not None:
+            expected_names.add(ttl_name)
+            current_ttl_seconds = ttl_info.get('expireAfterSeconds')
+
+        return {
+            'missing': missing,
+            'unknown': sorted(set(existing_indexes) - expected_names),
+            'unused': self._get_unused_indexes(),
+            'ttl_seconds': self.ttl_seconds,
+            'current_ttl_seconds': current_ttl_seconds,
+        }
+
+    def _get_unused_indexes(self):
+        """
+        Returns indexes never used since the server started, or None if $indexStats is not allowed.
+        """
+        try:
+            index_stats = list(self.collection.aggregate([{'$indexStats': {}}]))
+        except Exception:
+            return None
+        return sorted(stats['name'] for stats in index_stats
+                      if stats['name'] != '_id_' and not stats.get('accesses', {}).get('ops'))
+
+    def create_missing_indexes(self):
+        existing_indexes = self._get_existing_indexes()
+        created = []
+        for keys in self.indexes:
+            name, info = self._find_index(existing_indexes, keys)
+            if name is not None:
+                continue
+
+            created.append(self.collection.create_index(keys, name=get_index_name(keys)))
+        return created
+
+    def apply_ttl(self, rebuild=False):
+        """
+        Sets the TTL of the created_time index to DRF_ACTIVITY_TRACKER_TTL_SECONDS.
+        An existing index without TTL can only be converted on recent servers, otherwise it is rebuilt
+        if `rebuild` is True.
+        Returns True if the TTL is applied.
+        """
+        if self.ttl_seconds is None:
+            return True
+
+        name, info = self._find_index(self._get_existing_indexes(), TTL_INDEX_KEYS)
+        if name is None:
+            self.collection.create_index(TTL_INDEX_KEYS, name=get_index_name(TTL_INDEX_KEYS),
+                                         expireAfterSeconds=self.ttl_seconds)
+            return True
+
+        if info.get('expireAfterSeconds') == self.ttl_seconds:
+            return True
+
+        try:
+            self.collection.database.command('collMod', self.collection.name, index={
+                'keyPattern': dict(TTL_INDEX_KEYS), 'expireAfterSeconds': self.ttl_seconds})
+            return True
+        except Exception:
+            if not rebuild:
+                return False
+
+        self.collection.drop_index(name)
+        self.collection.create_index(TTL_INDEX_KEYS, name=name, expireAfterSeconds=self.ttl_seconds)
+        return True
@@ -1,18 +1,31 @@
 import logging
+import random
 import time
-from queue import Queue
-from threading import Thread
+from collections import deque
+from threading import Event, Lock, Thread
 
+import bson
+from bson import ObjectId
 from django.conf import settings
 
-from drf_user_activity_tracker_mongodb.utils import MyCollection
+from drf_user_activity_tracker_mongodb.backends import get_storage_backend
+from drf_user_activity_tracker_mongodb.compression import get_field_compressor
+from drf_user_activity_tracker_mongodb.indexes import get_ttl_seconds
+from drf_user_activity_tracker_mongodb.journal import CONNECTION_ERRORS, SpillJournal
+from drf_user_activity_tracker_mongodb.metrics import (BATCH_SIZE, BATCH_SIZE_TARGET, FLUSHES, INSERT_FAILURES,
+                                                       INSERT_LATENCY, LOGS_DROPPED, LOGS_ENQUEUED, LOGS_INSERTED,
+                                                       QUEUE_DEPTH, metrics_enabled)
+from drf_user_activity_tracker_mongodb.rollups import RollupAggregator, rollups_enabled
 
 logger = logging.getLogger('error')
 
+# Logs of a batch encoded to estimate the average log size.
+LOG_SIZE_SAMPLE_SIZE = 16
+
 
 class InsertLogIntoDatabase(Thread):
 
-    def __init__(self):
+    def __init__(self, backend=None):
         super().__init__()
 
         self.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE = 50  # Default queue size 50
@@ -35,33 +48,389 @@ class InsertLogIntoDatabase(Thread):
                 Value of DRF_ACTIVITY_TRACKER_INTERVAL must be greater than 0
                 """)
 
-        self._queue = Queue(maxsize=self.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE)
+        # Default buffer size is 10000 logs, and never smaller than the queue size.
+        self.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE = max(10000, self.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE)
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE'):
+            self.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE = settings.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE
+
+            if self.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE < self.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE:
+                raise Exception("""
+                DRF ACTIVITY TRACKER EXCEPTION
+                Value of DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE must not be less than DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE
+                """)
+
+        self.DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY = 'DROP_NEWEST'
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY'):
+            if settings.DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY in ['DROP_NEWEST', 'DROP_OLDEST', 'SAMPLE']:
+                self.DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY = settings.DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY
+
+        self.DRF_ACTIVITY_TRACKER_OVERFLOW_SAMPLE_RATE = 0.1  # Keep 10% of the overflowing logs by default
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_OVERFLOW_SAMPLE_RATE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_OVERFLOW_SAMPLE_RATE, (int, float)):
+                self.DRF_ACTIVITY_TRACKER_OVERFLOW_SAMPLE_RATE = settings.DRF_ACTIVITY_TRACKER_OVERFLOW_SAMPLE_RATE
+
+        self.DRF_ACTIVITY_TRACKER_JOURNAL_DIR = None  # Journal is disabled by default
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_JOURNAL_DIR'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_JOURNAL_DIR, str):
+                self.DRF_ACTIVITY_TRACKER_JOURNAL_DIR = settings.DRF_ACTIVITY_TRACKER_JOURNAL_DIR
+
+        self.DRF_ACTIVITY_TRACKER_JOURNAL_SEGMENT_SIZE = 16 * 1024 * 1024  # Default segment size is 16 MB
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_JOURNAL_SEGMENT_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_JOURNAL_SEGMENT_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_JOURNAL_SEGMENT_SIZE = settings.DRF_ACTIVITY_TRACKER_JOURNAL_SEGMENT_SIZE
+
+        self.DRF_ACTIVITY_TRACKER_JOURNAL_MAX_SIZE = 1024 * 1024 * 1024  # Default max journal size is 1 GB
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_JOURNAL_MAX_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_JOURNAL_MAX_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_JOURNAL_MAX_SIZE = settings.DRF_ACTIVITY_TRACKER_JOURNAL_MAX_SIZE
+
+        self.DRF_ACTIVITY_TRACKER_CHECK_INDEXES = False
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_CHECK_INDEXES'):
+            self.DRF_ACTIVITY_TRACKER_CHECK_INDEXES = bool(settings.DRF_ACTIVITY_TRACKER_CHECK_INDEXES)
+
+        self.DRF_ACTIVITY_TRACKER_CREATE_INDEXES = False
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_CREATE_INDEXES'):
+            self.DRF_ACTIVITY_TRACKER_CREATE_INDEXES = bool(settings.DRF_ACTIVITY_TRACKER_CREATE_INDEXES)
+
+        self.DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES = 16 * 1024 * 1024  # Default to 16 MB of BSON per batch
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES, int):
+                self.DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES = settings.DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES
+
+        self.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE = None  # Logs wait at most DRF_ACTIVITY_TRACKER_INTERVAL by default
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE, (int, float)):
+                self.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE = settings.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE
+
+                if self.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE <= 0:
+                    raise Exception("""
+                    DRF ACTIVITY TRACKER EXCEPTION
+                    Value of DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE must be greater than 0
+                    """)
+
+        self.DRF_ACTIVITY_TRACKER_BATCH_TARGET_LATENCY = None  # The batch size is fixed by default
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_BATCH_TARGET_LATENCY'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_BATCH_TARGET_LATENCY, (int, float)):
+                self.DRF_ACTIVITY_TRACKER_BATCH_TARGET_LATENCY = settings.DRF_ACTIVITY_TRACKER_BATCH_TARGET_LATENCY
+
+        # Bounds of the adaptive batch size, default to a tenth and ten times DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE.
+        self.DRF_ACTIVITY_TRACKER_BATCH_MIN_SIZE = max(1, self.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE // 10)
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_BATCH_MIN_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_BATCH_MIN_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_BATCH_MIN_SIZE = max(1, settings.DRF_ACTIVITY_TRACKER_BATCH_MIN_SIZE)
+
+        self.DRF_ACTIVITY_TRACKER_BATCH_MAX_SIZE = min(self.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE * 10,
+                                                       self.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE)
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_BATCH_MAX_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_BATCH_MAX_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_BATCH_MAX_SIZE = min(settings.DRF_ACTIVITY_TRACKER_BATCH_MAX_SIZE,
+                                                               self.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE)
+
+        self.DRF_ACTIVITY_TRACKER_INSERT_ORDERED = True
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_INSERT_ORDERED'):
+            self.DRF_ACTIVITY_TRACKER_INSERT_ORDERED = bool(settings.DRF_ACTIVITY_TRACKER_INSERT_ORDERED)
+
+        self.journal = None
+        if self.DRF_ACTIVITY_TRACKER_JOURNAL_DIR:
+            self.journal = SpillJournal(self.DRF_ACTIVITY_TRACKER_JOURNAL_DIR,
+                                        segment_max_size=self.DRF_ACTIVITY_TRACKER_JOURNAL_SEGMENT_SIZE,
+                                        max_size=self.DRF_ACTIVITY_TRACKER_JOURNAL_MAX_SIZE)
+
+        self.backend = backend if backend is not None else get_storage_backend()
+        # Backends without rollups summarize the raw logs when they are read.
+        self.rollups = RollupAggregator() if rollups_enabled() and self.backend.supports_rollups else None
+        self.compressor = get_field_compressor()
+        self.metrics_enabled = metrics_enabled()
+
+        self.batch_size = self.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE
+        self.avg_log_size = None
+
+        self._queue = deque()
+        self._oldest_time = None
+        self._lock = Lock()
+        self._flush_event = Event()
+        self._stop_event = Event()
+
+        self.dropped_newest_count = 0
+        self.dropped_oldest_count = 0
 
     def run(self) -> None:
+        if self.DRF_ACTIVITY_TRACKER_CHECK_INDEXES or self.DRF_ACTIVITY_TRACKER_CREATE_INDEXES:
+            self._check_indexes()
         self.start_queue_process()
 
+    def _check_indexes(self):
+        try:
+            report = self.backend.check_indexes(create=self.DRF_ACTIVITY_TRACKER_CREATE_INDEXES,
+                                                ttl_seconds=get_ttl_seconds())
+            if report is None:
+                return
+            if report['missing']:
+                logger.warning("DRF ACTIVITY TRACKER: missing indexes {}, run 'manage.py activity_tracker_indexes "
+                               "--create'".format(', '.join(report['missing'])))
+            if report['ttl_seconds'] != report['current_ttl_seconds']:
+                logger.warning("DRF ACTIVITY TRACKER: TTL of created_time is {}, expected {}".format(
+                    report['current_ttl_seconds'], report['ttl_seconds']))
+        except Exception as e:
+            message = "DRF ACTIVITY TRACKER EXCEPTION: {}, {}".format(str(e), type(e))
+            logger.error(message)
+
     def put_log_data(self, data):
-        self._queue.put(data)
+        """
+        Adds a log to the buffer without ever blocking the calling request.
+        When the buffer is full, the overflow policy decides which log is dropped.
+        """
+        with self._lock:
+            is_first_log = not self._queue
+            if len(self._queue) >= self.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE:
+                self._handle_overflow(data)
+            else:
+                self._queue.append(data)
+            queue_size = len(self._queue)
+            if is_first_log:
+                self._oldest_time = time.monotonic()
+
+        if self.metrics_enabled:
+            LOGS_ENQUEUED.inc()
+            QUEUE_DEPTH.set(queue_size)
+
+        # The first log wakes the thread up to start its age timer.
+        if queue_size >= self.batch_size or self._get_estimated_bytes(queue_size) >= \
+                self.DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES or \
+                (is_first_log and self.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE is not None):
+            self._flush_event.set()
+
+    def _get_estimated_bytes(self, queue_size):
+        if self.avg_log_size is None:
+            return 0
+        return queue_size * self.avg_log_size
 
-        if self._queue.qsize() >= self.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE:
-            self._start_bulk_insertion()
+    def _handle_overflow(self, data):
+        if self.DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY == 'DROP_OLDEST':
+            keep_new_log = True
+        elif self.DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY == 'SAMPLE':
+            keep_new_log = random.random() < self.DRF_ACTIVITY_TRACKER_OVERFLOW_SAMPLE_RATE
+        else:
+            keep_new_log = False
+
+        if keep_new_log:
+            self._queue.popleft()
+            self._queue.append(data)
+            self.dropped_oldest_count += 1
+        else:
+            self.dropped_newest_count += 1
+        if self.metrics_enabled:
+            LOGS_DROPPED.inc()
+
+    def get_stats(self):
+        return {
+            'queue_size': len(self._queue),
+            'buffer_max_size': self.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE,
+            'overflow_policy': self.DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY,
+            'dropped_newest_count': self.dropped_newest_count,
+            'dropped_oldest_count': self.dropped_oldest_count,
+            'dropped_count': self.dropped_newest_count + self.dropped_oldest_count,
+            'journal': self.journal.get_stats() if self.journal else None,
+            'pending_rollups': len(self.rollups) if self.rollups is not None else None,
+            'compression': self.compressor.get_stats() if self.compressor is not None else None,
+            'storage_backend': self.backend.name,
+            'batch_size': self.batch_size,
+            'avg_log_size': self.avg_log_size,
+        }
 
     def start_queue_process(self):
-        while True:
-            time.sleep(self.DRF_ACTIVITY_TRACKER_INTERVAL)
-            self._start_bulk_insertion()
+        last_flush_time = time.monotonic()
+        while not self._stop_event.is_set():
+            # Wakes up when the interval ends, when the oldest log is too old, as soon as
+            # the batch is full or when stopping.
+            self._flush_event.wait(timeout=self._get_wait_timeout(last_flush_time))
+            self._flush_event.clear()
+            trigger = self._get_flush_trigger(last_flush_time)
+            if trigger is None:
+                continue
+
+            last_flush_time = time.monotonic()
+            if self.metrics_enabled:
+                FLUSHES.inc(labels=(trigger,))
+            if self._start_bulk_insertion() and self.journal:
+                self._replay_journal()
+
+        # Drain what was added while the last insertion was running.
+        self._start_bulk_insertion()
+        if self.journal:
+            self.journal.rotate()
+
+    def _get_wait_timeout(self, last_flush_time):
+        deadline = last_flush_time + self.DRF_ACTIVITY_TRACKER_INTERVAL
+        oldest_time = self._oldest_time
+        if self.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE is not None and oldest_time is not None and self._queue:
+            deadline = min(deadline, oldest_time + self.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE)
+        return max(0, deadline - time.monotonic())
+
+    def _get_flush_trigger(self, last_flush_time):
+        """
+        Returns why the buffer must be inserted now: count, bytes, age or interval, or None.
+        """
+        now = time.monotonic()
+        queue_size = len(self._queue)
+        if queue_size >= self.batch_size:
+            return 'count'
+        if self._get_estimated_bytes(queue_size) >= self.DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES:
+            return 'bytes'
+        oldest_time = self._oldest_time
+        if queue_size and self.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE is not None and oldest_time is not None and \
+                now - oldest_time >= self.DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE:
+            return 'age'
+        if now - last_flush_time >= self.DRF_ACTIVITY_TRACKER_INTERVAL:
+            return 'interval'
+        if self._stop_event.is_set():
+            return 'stop'
+        return None
+
+    def stop(self, timeout=None):
+        """
+        Asks the thread to insert the remaining logs and exit, waiting at most `timeout` seconds.
+        """
+        self._stop_event.set()
+        self._flush_event.set()
+        if self.is_alive():
+            self.join(timeout=timeout)
 
     def _start_bulk_insertion(self):
-        bulk_item = []
-        while not self._queue.empty():
-            bulk_item.append(self._queue.get())
-        if bulk_item:
-            self._insert_into_data_base(bulk_item)
+        """
+        Inserts the logs of the buffer. Returns False if the insertion failed.
+        """
+        with self._lock:
+            bulk_item = list(self._queue)
+            self._queue.clear()
+            self._oldest_time = None
+        if self.metrics_enabled:
+            QUEUE_DEPTH.set(0)
+        if not bulk_item:
+            return True
+
+        # Counted before the insertion, a log replayed from the journal is never counted twice.
+        if self.rollups is not None:
+            self.rollups.add(bulk_item)
+        if self.compressor is not None:
+            # Compressed once, the journal keeps the compressed logs too.
+            for item in bulk_item:
+                self.compressor.compress_log(item)
+        self._measure_log_size(bulk_item)
+
+        inserted, connection_lost = True, False
+        for batch in self._get_batches(bulk_item):
+            if connection_lost:
+                # The database is unreachable, the remaining logs go to the journal at once.
+                self._journal_logs(batch)
+                continue
+            # A batch rejected by the database (e.g. an oversized log) doesn't stop the next ones.
+            error = self._insert_into_data_base(batch)
+            if error is not None:
+                inserted = False
+                connection_lost = isinstance(error, CONNECTION_ERRORS)
+        if self.rollups is not None:
+            self._flush_rollups()
+        return inserted
+
+    def _measure_log_size(self, bulk_item):
+        """
+        Updates the moving average of the log size from a few logs of the batch.
+        """
+        step = max(1, len(bulk_item) // LOG_SIZE_SAMPLE_SIZE)
+        sizes = []
+        for item in bulk_item[::step][:LOG_SIZE_SAMPLE_SIZE]:
+            try:
+                sizes.append(len(bson.encode(item)))
+            except Exception:
+                continue
+        if not sizes:
+            return
+        size = sum(sizes) / len(sizes)
+        self.avg_log_size = size if self.avg_log_size is None else 0.8 * self.avg_log_size + 0.2 * size
+
+    def _get_batches(self, bulk_item):
+        """
+        Splits the logs into batches of at most batch_size logs and DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES.
+        """
+        batch_size = self.batch_size
+        if self.avg_log_size:
+            batch_size = min(batch_size, max(1, int(self.DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES // self.avg_log_size)))
+        return [bulk_item[start:start + batch_size] for start in range(0, len(bulk_item), batch_size)]
+
+    def _adapt_batch_size(self, size, duration):
+        """
+        Halves the batch size when an insertion is slower than the target latency,
+        and grows it by a quarter when a full batch takes less than half of it.
+        """
+        target_latency = self.DRF_ACTIVITY_TRACKER_BATCH_TARGET_LATENCY
+        if target_latency is None:
+            return
+        if duration > target_latency:
+            self.batch_size = max(self.DRF_ACTIVITY_TRACKER_BATCH_MIN_SIZE, self.batch_size // 2)
+        elif duration < target_latency / 2 and size >= self.batch_size:
+            self.batch_size = min(self.DRF_ACTIVITY_TRACKER_BATCH_MAX_SIZE,
+                                  self.batch_size + max(1, self.batch_size // 4))
+        if self.metrics_enabled:
+            BATCH_SIZE_TARGET.set(self.batch_size)
+
+    def _flush_rollups(self):
+        try:
+            self.backend.save_rollups(self.rollups)
+        except Exception as e:
+            message = "DRF ACTIVITY TRACKER EXCEPTION: {}, {}".format(str(e), type(e))
+            logger.error(message)
 
     def _insert_into_data_base(self, bulk_item):
+        """
+        Inserts one batch, or journals it if the insertion failed. Returns the error, None on success.
+        """
+        # Logs get their _id before the first attempt, so a replayed log is never inserted twice.
+        for item in bulk_item:
+            item.setdefault('_id', ObjectId())
+
+        start_time = time.perf_counter()
         try:
-            MyCollection().save(bulk_item)
+            self.backend.save_many(bulk_item, ordered=self.DRF_ACTIVITY_TRACKER_INSERT_ORDERED)
+            self._adapt_batch_size(len(bulk_item), time.perf_counter() - start_time)
+            if self.metrics_enabled:
+                self._track_insertion(len(bulk_item), start_time)
+            return None
         except Exception as e:
+            error = e
             message = "DRF ACTIVITY TRACKER EXCEPTION: {}, {}".format(str(e), type(e))
             logger.error(message)
             print(message)
+        if self.metrics_enabled:
+            self._track_insertion(len(bulk_item), start_time, failed=True)
+
+        self._journal_logs(bulk_item)
+        return error
+
+    def _journal_logs(self, bulk_item):
+        if self.journal:
+            try:
+                self.journal.append(bulk_item)
+            except Exception as e:
+                message = "DRF ACTIVITY TRACKER JOURNAL EXCEPTION: {}, {}".format(str(e), type(e))
+                logger.error(message)
+
+    @staticmethod
+    def _track_insertion(size, start_time, failed=False):
+        INSERT_LATENCY.observe(time.perf_counter() - start_time)
+        BATCH_SIZE.observe(size)
+        if failed:
+            INSERT_FAILURES.inc()
+        else:
+            LOGS_INSERTED.inc(size)
+
+    def _replay_journal(self):
+        def flush_live_logs():
+            # Live logs are not kept waiting while a long journal is replayed.
+            if len(self._queue) >= self.batch_size:
+                self._start_bulk_insertion()
+
+        if self.journal.has_pending_segments():
+            self.journal.replay(lambda documents: self.backend.save_many(documents, ordered=False),
+                                batch_size=max(self.batch_size, 1000),
+                                before_batch=flush_live_logs)
@@ -0,0 +1,261 @@
+import glob
+import logging
+import os
+import time
+
+import bson
+from pymongo.errors import AutoReconnect, BulkWriteError, ServerSelectionTimeoutError
+
+logger = logging.getLogger('error')
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Errors of an unreachable database, the logs are kept to be inserted later.
+CONNECTION_ERRORS = (AutoReconnect, ServerSelectionTimeoutError)
+
+
+class SpillJournal:
+    """
+    Append-only journal on local disk for logs that couldn't be inserted into the database.
+    Logs are written as BSON documents into segment files. A segment is written by
+    one process as "<name>.open", and renamed to "<name>.bson" once rotated, so only
+    closed segments are replayed. Every log keeps its _id, so replaying a segment twice
+    never inserts a log twice. Logs the database rejects are moved to "<name>.failed",
+    so they never block the segments after them.
+    """
+
+    def __init__(self, directory, segment_max_size=16 * 1024 * 1024, max_size=1024 * 1024 * 1024):
+        self.directory = directory
+        self.segment_max_size = segment_max_size
+        self.max_size = max_size
+
+        self.spilled_count = 0
+        self.dropped_count = 0
+        self.replayed_count = 0
+        self.failed_count = 0
+        self.replay_time = 0.0
+        self.last_replay_throughput = 0.0
+
+        self._segment = None
+        self._segment_path = None
+        self._segment_size = 0
+        self._sequence = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._close_orphan_segments()
+
+    def append(self, bulk_item):
+        """
+        Writes the logs into the current segment. Returns False if the journal is full.
+        """
+        documents = []
+        for item in bulk_item:
+            try:
+                documents.append(bson.encode(item))
+            except Exception as e:
+                # Only the log that can't be encoded is lost.
+                self.dropped_count += 1
+                logger.error("DRF ACTIVITY TRACKER JOURNAL EXCEPTION: {}, {}".format(str(e), type(e)))
+        if not documents:
+            return False
+        size = sum(len(document) for document in documents)
+        if self.get_size() + size > self.max_size:
+            self.dropped_count += len(documents)
+            return False
+
+        if self._segment is None or self._segment_size >= self.segment_max_size:
+            self.rotate()
+            self._open_segment()
+
+        self._segment.write(b''.join(documents))
+        self._segment.flush()
+        self._segment_size += size
+        self.spilled_count += len(documents)
+        return True
+
+    def rotate(self):
+        """
+        Closes the current segment, so it can be replayed.
+        """
+        if self._segment is None:
+            return
+        self._segment.close()
+        os.replace(self._segment_path, self._segment_path[:-len('.open')] + '.bson')
+        self._segment, self._segment_path, self._segment_size = None, None, 0
+
+    def pending_segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, '*.bson')))
+
+    def failed_segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, '*.failed')))
+
+    def has_pending_segments(self):
+        return self._segment is not None or bool(self.pending_segments())
+
+    def replay(self, save, batch_size=1000, before_batch=None):
+        """
+        Inserts closed segments with `save(documents)` from the oldest, and deletes each one once inserted.
+        Stops and returns False when the database is unreachable, the segment is kept for the next replay.
+        """
+        self.rotate()
+        for segment_path in self.pending_segments():
+            claimed_path = '{}.replaying-{}'.format(segment_path, os.getpid())
+            try:
+                # Claiming the segment keeps other processes from replaying it at the same time.
+                os.rename(segment_path, claimed_path)
+            except OSError:
+                continue
+
+            failed_path = segment_path[:-len('.bson')] + '.failed'
+            if not self._replay_segment(claimed_path, failed_path, save, batch_size, before_batch):
+                os.replace(claimed_path, segment_path)
+                return False
+            os.remove(claimed_path)
+        return True
+
+    def _replay_segment(self, path, failed_path, save, batch_size, before_batch):
+        start_time = time.perf_counter()
+        replayed_count = 0
+        with open(path, 'rb') as segment:
+            documents = []
+            for document in self._iter_documents(segment):
+                documents.append(document)
+                if len(documents) >= batch_size:
+                    if before_batch:
+                        before_batch()
+                    if not self._save(save, documents, failed_path):
+                        return False
+                    replayed_count += len(documents)
+                    documents = []
+            if documents:
+                if not self._save(save, documents, failed_path):
+                    return False
+                replayed_count += len(documents)
+
+        duration = time.perf_counter() - start_time
+        self.replayed_count += replayed_count
+        self.replay_time += duration
+        self.last_replay_throughput = replayed_count / duration if duration else 0.0
+        return True
+
+    @staticmethod
+    def _iter_documents(segment):
+        try:
+            for document in bson.decode_file_iter(segment):
+                yield document
+        except bson.InvalidBSON:
+            # A process stopped in the middle of a write, the rest of the segment is lost.
+            logger.error("DRF ACTIVITY TRACKER EXCEPTION: truncated journal segment {}".format(segment.name))
+
+    def _save(self, save, documents, failed_path):
+        """
+        Inserts the documents, the ones the database rejects are moved to `failed_path`.
+        Returns False if the database is unreachable.
+        """
+        try:
+            save(documents)
+        except BulkWriteError as e:
+            # Logs inserted by an earlier, interrupted replay are already in the database.
+            details = e.details or {}
+            if details.get('writeConcernErrors'):
+                return False
+            rejected = [documents[error['index']] for error in details.get('writeErrors', [])
+                        if error.get('code') != DUPLICATE_KEY_ERROR and error.get('index') is not None]
+            self._quarantine(rejected, failed_path)
+        except CONNECTION_ERRORS as e:
+            logger.error("DRF ACTIVITY TRACKER EXCEPTION: {}, {}".format(str(e), type(e)))
+            return False
+        except Exception as e:
+            logger.error("DRF ACTIVITY TRACKER EXCEPTION: {}, {}".format(str(e), type(e)))
+            if len(documents) == 1:
+                self._quarantine(documents, failed_path)
+                return True
+            # The whole batch was refused (e.g. DocumentTooLarge), the logs are inserted one by one
+            # to find the rejected ones.
+            for document in documents:
+                if not self._save(save, [document], failed_path):
+                    return False
+        return True
+
+    def _quarantine(self, documents, failed_path):
+        if not documents:
+            return
+        try:
+            with open(failed_path, 'ab') as failed_segment:
+                failed_segment.write(b''.join(bson.encode(document) for document in documents))
+            self.failed_count += len(documents)
+        except Exception as e:
+            self.dropped_count += len(documents)
+            logger.error("DRF ACTIVITY TRACKER JOURNAL EXCEPTION: {}, {}".format(str(e), type(e)))
+
+    def _open_segment(self):
+        self._sequence += 1
+        name = 'segment-{}-{}-{:06d}.open'.format(int(time.time() * 1000), os.getpid(), self._sequence)
+        self._segment_path = os.path.join(self.directory, name)
+        self._segment = open(self._segment_path, 'ab')
+        self._segment_size = 0
+
+    def _close_orphan_segments(self):
+        # Segments left open or half replayed by processes that are gone can be replayed.
+        for path in glob.glob(os.path.join(self.directory, 'segment-*')):
+            if path.endswith('.open'):
+                closed_path = path[:-len('.open')] + '.bson'
+            elif '.replaying-' in path:
+                closed_path = path.rsplit('.replaying-', 1)[0]
+            else:
+                continue
+
+            pid = self._get_owner_pid(path)
+            if pid is None or pid == os.getpid() or self._is_process_alive(pid):
+                continue
+            try:
+                os.replace(path, closed_path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _get_owner_pid(path):
+        name = os.path.basename(path)
+        try:
+            if '.replaying-' in name:
+                return int(name.rsplit('.replaying-', 1)[1])
+            return int(name.split('-')[2])
+        except (IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def _is_process_alive(pid):
+        if os.name == 'nt':
+            # os.kill would terminate the process on Windows.
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            return True
+        return True
+
+    def get_size(self):
+        size = 0
+        for path in glob.glob(os.path.join(self.directory, 'segment-*')):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def get_stats(self):
+        return {
+            'directory': self.directory,
+            'size': self.get_size(),
+            'max_size': self.max_size,
+            'pending_segments': len(self.pending_segments()) + (self._segment is not None),
+            'spilled_count': self.spilled_count,
+            'dropped_count': self.dropped_count,
+            'replayed_count': self.replayed_count,
+            'failed_count': self.failed_count,
+            'failed_segments': len(self.failed_segments()),
+            'replay_time': self.replay_time,
+            'last_replay_throughput': self.last_replay_throughput,
+        }
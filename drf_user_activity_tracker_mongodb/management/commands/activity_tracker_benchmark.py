@@ -0,0 +1,270 @@
+import configparser
+import json
+import os
+import platform
+import statistics
+import time
+from datetime import datetime
+from importlib.metadata import PackageNotFoundError, version
+
+import django
+import jwt
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse
+from django.test import RequestFactory, override_settings
+from django.urls import path, resolve
+
+import drf_user_activity_tracker_mongodb
+from drf_user_activity_tracker_mongodb.backends import get_storage_backend
+from drf_user_activity_tracker_mongodb.backends.memory import MemoryBackend
+from drf_user_activity_tracker_mongodb.codec import JSON_CODECS, get_json_codec
+from drf_user_activity_tracker_mongodb.insert_log_into_database import InsertLogIntoDatabase
+from drf_user_activity_tracker_mongodb.middleware.activity_tracker_middleware import ActivityTrackerMiddleware
+
+LARGE_RESPONSE = {'results': [{'id': index, 'name': 'item {}'.format(index), 'price': '10.00',
+                               'tags': ['a', 'b', 'c'], 'owner': {'id': index, 'email': 'owner@example.com'}}
+                              for index in range(1000)], 'count': 1000}
+
+
+def small_view(request):
+    return JsonResponse({'id': 1, 'name': 'item'})
+
+
+def large_view(request):
+    return JsonResponse(LARGE_RESPONSE)
+
+
+# The benchmark resolves its own routes, the project URLconf is left alone.
+urlpatterns = [
+    path('benchmark/untracked/', small_view, name='benchmark_untracked'),
+    path('benchmark/tracked/', small_view, name='benchmark_tracked'),
+    path('benchmark/large/', large_view, name='benchmark_large'),
+    path('benchmark/upload/', small_view, name='benchmark_upload'),
+]
+
+
+def get_percentiles(times):
+    """
+    Returns the median, p95 and p99 of `times` in microseconds.
+    """
+    times = sorted(times)
+    return {
+        'p50': statistics.median(times) * 1e6,
+        'p95': times[min(len(times) - 1, int(len(times) * 0.95))] * 1e6,
+        'p99': times[min(len(times) - 1, int(len(times) * 0.99))] * 1e6,
+    }
+
+
+class BenchmarkMiddleware(ActivityTrackerMiddleware):
+    """
+    Sends the logs to the benchmark writer instead of the logger thread of the process.
+    """
+
+    def __init__(self, get_response, writer):
+        super().__init__(get_response)
+        self.writer = writer
+
+    def _send_log_data(self, data):
+        self.writer.put_log_data(data=data)
+
+
+class Command(BaseCommand):
+    help = 'measure the middleware overhead per request and the throughput of the logger thread'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=1000, help='requests per scenario')
+        parser.add_argument('--logs', type=int, default=10000, help='logs inserted by the writer benchmark')
+        parser.add_argument('--storage', choices=['memory', 'configured'], default='memory',
+                            help='insert into an in-memory store, or into DRF_ACTIVITY_TRACKER_STORAGE_BACKEND')
+        parser.add_argument('--json', action='store_true', help='print the results as JSON')
+        parser.add_argument('--output', help='also write the JSON results into this file')
+
+    def handle(self, *args, **options):
+        benchmark_settings = {}
+        if options['storage'] == 'memory':
+            # Logs of the in-memory store are never spilled into the journal of the project.
+            benchmark_settings['DRF_ACTIVITY_TRACKER_JOURNAL_DIR'] = None
+        with override_settings(DRF_ACTIVITY_TRACKER_DATABASE=True, DRF_ACTIVITY_TRACKER_SIGNAL=False,
+                               DRF_ACTIVITY_TRACKER_SKIP_URL_NAME=['benchmark_untracked'], **benchmark_settings):
+            backend = MemoryBackend(max_size=options['logs']) if options['storage'] == 'memory' \
+                else get_storage_backend()
+            # Rollups and the journal are built for the backend given to the writer.
+            writer = InsertLogIntoDatabase(backend=backend)
+            middleware = BenchmarkMiddleware(self.get_response, writer)
+
+        token = jwt.encode({'user_id': 1}, settings.SECRET_KEY, algorithm=middleware.JWT_ALGORITHM)
+        self.factory = RequestFactory(HTTP_AUTHORIZATION='Bearer {}'.format(token))
+
+        results = {
+            'version': self.get_version(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'created_time': datetime.utcnow().isoformat(),
+            'number': options['number'],
+            'storage': writer.backend.name,
+            'json_codec': get_json_codec().name,
+            'middleware': {},
+        }
+
+        scenarios = [
+            ('untracked', self.get_untracked_request),
+            ('tracked_get', self.get_tracked_request),
+            ('large_response', self.get_large_request),
+            ('multipart_upload', self.get_upload_request),
+        ]
+        for name, get_request in scenarios:
+            results['middleware'][name] = self.measure_middleware(middleware, get_request, options['number'])
+            writer._queue.clear()
+
+        results['middleware']['buffer_overflow'] = self.measure_buffer_overflow(middleware, writer, options['number'])
+        results['writer'] = self.measure_writer(middleware, writer, options['logs'])
+        results['codec'] = self.measure_codecs(options['number'])
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.write_results(results)
+
+    @staticmethod
+    def get_version():
+        """
+        Returns the version of the installed package, or of setup.cfg when run from a source checkout.
+        """
+        try:
+            return version('drf-user-activity-tracker-mongodb')
+        except PackageNotFoundError:
+            pass
+        config = configparser.ConfigParser()
+        config.read(os.path.join(os.path.dirname(os.path.dirname(drf_user_activity_tracker_mongodb.__file__)),
+                                 'setup.cfg'))
+        return config.get('metadata', 'version', fallback=None)
+
+    @staticmethod
+    def get_response(request):
+        return request.resolver_match.func(request)
+
+    def _prepare(self, request):
+        request.urlconf = __name__
+        request.resolver_match = resolve(request.path, urlconf=__name__)
+        return request
+
+    def get_untracked_request(self):
+        return self._prepare(self.factory.get('/benchmark/untracked/'))
+
+    def get_tracked_request(self):
+        return self._prepare(self.factory.get('/benchmark/tracked/', {'page': 1}))
+
+    def get_large_request(self):
+        return self._prepare(self.factory.get('/benchmark/large/'))
+
+    def get_upload_request(self):
+        upload = SimpleUploadedFile('report.csv', b'id,name\n' * 8192, content_type='text/csv')
+        return self._prepare(self.factory.post('/benchmark/upload/', {'name': 'report', 'file': upload}))
+
+    def measure_middleware(self, middleware, get_request, number):
+        """
+        Times the view alone and the view behind the middleware, with a fresh request every run.
+        Runs are interleaved in alternating order, and the view is timed twice: the difference between
+        both view runs is the noise, an overhead below it can't be told apart from zero.
+        """
+        runs = [(self.get_response, []), (middleware, []), (self.get_response, [])]
+        for index in range(number):
+            for function, times in (runs if index % 2 else reversed(runs)):
+                request = get_request()
+                start_time = time.perf_counter()
+                function(request)
+                times.append(time.perf_counter() - start_time)
+
+        view, tracked, view_again = (get_percentiles(times) for _, times in runs)
+        return {
+            'view_us': view,
+            'middleware_us': tracked,
+            'overhead_us': {key: tracked[key] - view[key] for key in tracked},
+            'noise_us': {key: abs(view_again[key] - view[key]) for key in view},
+        }
+
+    def measure_buffer_overflow(self, middleware, writer, number):
+        """
+        Tracked requests while the buffer is full, every log goes through the overflow policy.
+        Nothing is inserted, this measures the cost of dropping logs and not of a flush.
+        """
+        log = {'url_name': 'benchmark_tracked'}
+        with writer._lock:
+            writer._queue.extend(log for _ in range(writer.DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE -
+                                                    len(writer._queue)))
+        result = self.measure_middleware(middleware, self.get_tracked_request, number)
+        result['dropped_count'] = writer.dropped_newest_count + writer.dropped_oldest_count
+        writer._queue.clear()
+        return result
+
+    def measure_writer(self, middleware, writer, number):
+        """
+        Inserts `number` logs in batches of DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE, as the logger thread does.
+        """
+        writer._queue.clear()
+        middleware(self.get_tracked_request())
+        if not writer._queue:
+            raise CommandError('The tracked request was not logged, check the sampling, rate limit and method '
+                               'settings of the benchmark_tracked url name')
+        middleware_log = writer._queue.pop()
+
+        batch_size = writer.DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE
+        batch_times = []
+        start_time = time.perf_counter()
+        for start in range(0, number, batch_size):
+            for _ in range(min(batch_size, number - start)):
+                writer.put_log_data(dict(middleware_log))
+            batch_start_time = time.perf_counter()
+            writer._start_bulk_insertion()
+            batch_times.append(time.perf_counter() - batch_start_time)
+        duration = time.perf_counter() - start_time
+
+        return {
+            'logs': number,
+            'batch_size': batch_size,
+            'logs_per_second': number / duration if duration else None,
+            'batch_us': get_percentiles(batch_times),
+            'stats': writer.get_stats(),
+        }
+
+    @staticmethod
+    def measure_codecs(number):
+        """
+        Times the decoding and encoding of the large response with every installed JSON codec.
+        """
+        content = JSON_CODECS['json'].dumps(LARGE_RESPONSE)
+        results = {}
+        for name, codec in JSON_CODECS.items():
+            loads_times, dumps_times = [], []
+            for _ in range(number):
+                start_time = time.perf_counter()
+                codec.loads(content)
+                loads_times.append(time.perf_counter() - start_time)
+
+                start_time = time.perf_counter()
+                codec.dumps(LARGE_RESPONSE)
+                dumps_times.append(time.perf_counter() - start_time)
+            results[name] = {'size': len(content), 'loads_us': get_percentiles(loads_times),
+                             'dumps_us': get_percentiles(dumps_times)}
+        return results
+
+    def write_results(self, results):
+        self.stdout.write('version {version}, python {python}, django {django}, storage {storage}, '
+                          'json codec {json_codec}'.format(**results))
+        for name, result in results['middleware'].items():
+            self.stdout.write('{:<17} view p50: {:.1f} us, overhead p50: {:.1f} us (noise {:.1f} us), p95: {:.1f} us, '
+                              'p99: {:.1f} us'.format(name, result['view_us']['p50'], result['overhead_us']['p50'],
+                                                      result['noise_us']['p50'], result['overhead_us']['p95'],
+                                                      result['overhead_us']['p99']))
+        writer = results['writer']
+        self.stdout.write('{:<17} {:.0f} logs/s, batch of {} p50: {:.1f} us, p95: {:.1f} us, p99: {:.1f} us'.format(
+            'writer', writer['logs_per_second'], writer['batch_size'], writer['batch_us']['p50'],
+            writer['batch_us']['p95'], writer['batch_us']['p99']))
+        for name, result in results['codec'].items():
+            self.stdout.write('{:<17} {} bytes, loads p50: {:.1f} us, dumps p50: {:.1f} us'.format(
+                'codec ' + name, result['size'], result['loads_us']['p50'], result['dumps_us']['p50']))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from drf_user_activity_tracker_mongodb.backends import get_storage_backend
+from drf_user_activity_tracker_mongodb.indexes import get_ttl_seconds
+from drf_user_activity_tracker_mongodb.rollups import rollups_enabled
+
+
+class Command(BaseCommand):
+    help = 'check and create the indexes of the activity log collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--create', action='store_true',
+                            help='create the missing indexes and apply DRF_ACTIVITY_TRACKER_TTL_SECONDS')
+        parser.add_argument('--rebuild-ttl', action='store_true',
+                            help='rebuild the created_time index if its TTL can not be changed in place')
+
+    def handle(self, *args, **options):
+        backend = get_storage_backend()
+        manager = backend.get_index_manager(ttl_seconds=get_ttl_seconds())
+        if manager is None:
+            self.stdout.write(self.style.WARNING(
+                'indexes are not supported by the {} storage backend'.format(backend.name)))
+            return
+
+        if options['create']:
+            for name in manager.create_missing_indexes():
+                self.stdout.write(self.style.SUCCESS('created index {}'.format(name)))
+            if not manager.apply_ttl(rebuild=options['rebuild_ttl']):
+                self.stdout.write(self.style.ERROR(
+                    'the TTL of the created_time index could not be changed, run again with --rebuild-ttl'))
+
+        report = manager.get_report()
+        for name in report['missing']:
+            self.stdout.write(self.style.WARNING('missing index {}'.format(name)))
+        for name in report['unknown']:
+            self.stdout.write('unknown index {}'.format(name))
+        if report['unused'] is None:
+            self.stdout.write('index usage is not available ($indexStats is not allowed)')
+        else:
+            for name in report['unused']:
+                self.stdout.write('unused index {} (since the server started)'.format(name))
+
+        if report['ttl_seconds'] != report['current_ttl_seconds']:
+            self.stdout.write(self.style.WARNING('TTL of created_time is {}, expected {}'.format(
+                report['current_ttl_seconds'], report['ttl_seconds'])))
+
+        rollup_missing = []
+        rollup_manager = backend.get_rollup_index_manager() if rollups_enabled() else None
+        if rollup_manager is not None:
+            if options['create']:
+                for name in rollup_manager.create_missing_indexes():
+                    self.stdout.write(self.style.SUCCESS('created rollup index {}'.format(name)))
+            rollup_missing = rollup_manager.get_report()['missing']
+            for name in rollup_missing:
+                self.stdout.write(self.style.WARNING('missing rollup index {}'.format(name)))
+
+        if not report['missing'] and not rollup_missing and report['ttl_seconds'] == report['current_ttl_seconds']:
+            self.stdout.write(self.style.SUCCESS('all indexes are up to date'))
@@ -0,0 +1,83 @@
+import copy
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from drf_user_activity_tracker_mongodb.redaction import SENSITIVE_KEYS, get_redaction_plan
+
+
+def recursive_mask_sensitive_data(data):
+    """
+    The recursive, in place masking used before RedactionPlan, kept as the benchmark baseline.
+    """
+    if not isinstance(data, dict):
+        return data
+
+    for key, value in data.items():
+        if key in SENSITIVE_KEYS:
+            data[key] = "***FILTERED***"
+            value = data[key]
+
+        if isinstance(value, dict):
+            data[key] = recursive_mask_sensitive_data(data[key])
+
+        if isinstance(value, list):
+            data[key] = [recursive_mask_sensitive_data(item) for item in data[key]]
+
+    return data
+
+
+def get_payloads():
+    item = {'id': 1, 'name': 'item', 'price': '10.00', 'tags': ['a', 'b', 'c'], 'owner': {'id': 2, 'email': 'a@b.c'}}
+    return {
+        'small': {'username': 'user', 'password': 'secret', 'remember': True},
+        'wide': {'results': [dict(item, password='secret') for _ in range(1000)], 'count': 1000},
+        # Nothing to hide, the plan copies nothing.
+        'clean': {'results': [dict(item) for _ in range(1000)], 'count': 1000},
+        # Within the default depth budget, so both sides hide the same keys.
+        'deep': _get_deep_payload(30),
+    }
+
+
+def _get_deep_payload(depth):
+    payload = {'password': 'secret'}
+    for _ in range(depth):
+        payload = {'child': payload, 'name': 'node'}
+    return payload
+
+
+class Command(BaseCommand):
+    help = 'compare the redaction plan with the recursive masking of sensitive data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=200, help='runs per payload')
+
+    def handle(self, *args, **options):
+        plan = get_redaction_plan()
+        number = options['number']
+
+        for name, payload in get_payloads().items():
+            plan_time = self.measure(plan.redact, payload, number)
+            copy_time = self.measure(copy.deepcopy, payload, number)
+            try:
+                recursive_result = '{:.1f} us'.format(self.measure(recursive_mask_sensitive_data, payload, number))
+            except RecursionError:
+                recursive_result = 'RecursionError'
+
+            self.stdout.write('{:<6} plan: {:.1f} us, recursive (in place): {}, deepcopy: {:.1f} us'.format(
+                name, plan_time, recursive_result, copy_time))
+
+    @staticmethod
+    def measure(function, payload, number):
+        """
+        Returns the median time of `number` runs in microseconds, every run gets a fresh copy of the payload
+        because the recursive masking changes its input.
+        """
+        times = []
+        for _ in range(number):
+            data = copy.deepcopy(payload)
+            start_time = time.perf_counter()
+            function(data)
+            times.append(time.perf_counter() - start_time)
+        return statistics.median(times) * 1e6
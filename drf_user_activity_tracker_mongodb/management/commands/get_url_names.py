@@ -1,28 +1,26 @@
-import importlib
 import json
 
-from django.apps import apps
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from drf_user_activity_tracker_mongodb.utils import URL_NAME_INDEX
+
 
 class Command(BaseCommand):
     help = 'get all url names'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--qualified', action='store_true',
+                            help='list namespace qualified url names, e.g. "orders:detail"')
+
     def handle(self, *args, **options):
+        if options['qualified']:
+            self.stdout.write(self.style.SUCCESS('\n'.join(URL_NAME_INDEX.get_qualified_names())))
+            return
+
+        event_names = {url_name: '' for url_name in URL_NAME_INDEX.get_url_names()}
+        if isinstance(getattr(settings, 'DRF_ACTIVITY_TRACKER_EVENT_NAME', None), dict):
+            event_names.update(settings.DRF_ACTIVITY_TRACKER_EVENT_NAME)
 
-        list_of_all_urls = list()
-        for name, app in apps.app_configs.items():
-            mod_to_import = f'{name}.urls'
-            try:
-                urls = getattr(importlib.import_module(mod_to_import), 'urlpatterns')
-                list_of_all_urls.extend(urls)
-            except ImportError as ex:
-                # is an app without urls
-                pass
-        for url in list_of_all_urls:
-            if hasattr(url, 'name'):
-                settings.DRF_ACTIVITY_TRACKER_EVENT_NAME.update({url.name: ''})
-
-        result = json.dumps(settings.DRF_ACTIVITY_TRACKER_EVENT_NAME, indent=3)
+        result = json.dumps(event_names, indent=3)
         self.stdout.write(self.style.SUCCESS(result))
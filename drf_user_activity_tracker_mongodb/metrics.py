@@ -0,0 +1,182 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+
+def metrics_enabled():
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_METRICS'):
+        return bool(settings.DRF_ACTIVITY_TRACKER_METRICS)
+    return True  # Metrics are collected by default
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                                    for name, value in pairs))
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def get_samples(self):
+        if not self.label_names:
+            return [(self.name, '', self.get())]
+        return [(self.name, _format_labels(self.label_names, labels), value)
+                for labels, value in sorted(self._values.items())]
+
+    def get_summary(self):
+        if not self.label_names:
+            return self.get()
+        return {','.join(str(value) for value in labels): value for labels, value in sorted(self._values.items())}
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets of upper bounds, as Prometheus histograms.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = list(buckets)
+        self.label_names = ()
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def get_samples(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        samples, cumulative = [], 0
+        for bound, value in zip(self.buckets + ['+Inf'], counts):
+            cumulative += value
+            samples.append(('{}_bucket'.format(self.name), _format_labels((), (), [('le', bound)]), cumulative))
+        samples.append(('{}_sum'.format(self.name), '', total))
+        samples.append(('{}_count'.format(self.name), '', count))
+        return samples
+
+    def get_percentile(self, percentile):
+        """
+        Returns the upper bound of the bucket holding the percentile, None for the last bucket.
+        """
+        rank, seen = self._count * percentile, 0
+        if not self._count:
+            return None
+        for index, value in enumerate(self._counts):
+            seen += value
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else None
+        return None
+
+    def get_summary(self):
+        return {
+            'count': self._count,
+            'sum': self._sum,
+            'avg': self._sum / self._count if self._count else None,
+            'p50': self.get_percentile(0.5),
+            'p95': self.get_percentile(0.95),
+            'p99': self.get_percentile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Metrics of the process. Updating a metric takes one lock, metrics are only formatted when they are read.
+    """
+
+    def __init__(self, prefix='drf_activity_tracker'):
+        self.prefix = prefix
+        self._metrics = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter('{}_{}'.format(self.prefix, name), documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._register(Gauge('{}_{}'.format(self.prefix, name), documentation, label_names))
+
+    def histogram(self, name, documentation, buckets):
+        return self._register(Histogram('{}_{}'.format(self.prefix, name), documentation, buckets))
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for name, labels, value in metric.get_samples():
+                lines.append('{}{} {}'.format(name, labels, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def get_summary(self):
+        return {metric.name[len(self.prefix) + 1:]: metric.get_summary() for metric in self._metrics.values()}
+
+
+METRICS = MetricsRegistry()
+
+# In seconds, the middleware overhead is mostly below a millisecond.
+OVERHEAD_BUCKETS = [0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1]
+
+INSERT_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+BATCH_SIZE_BUCKETS = [1, 10, 50, 100, 500, 1000, 5000, 10000]
+
+REQUESTS = METRICS.counter('requests_total', 'Requests seen by the middleware, by outcome.', ['outcome'])
+MIDDLEWARE_OVERHEAD = METRICS.histogram('middleware_overhead_seconds',
+                                        'Time spent by the middleware on tracked requests, the view excluded.',
+                                        OVERHEAD_BUCKETS)
+LOGS_ENQUEUED = METRICS.counter('logs_enqueued_total', 'Logs handed to the logger thread, dropped ones included.')
+LOGS_DROPPED = METRICS.counter('logs_dropped_total', 'Logs dropped because the buffer was full.')
+QUEUE_DEPTH = METRICS.gauge('queue_depth', 'Logs waiting in the buffer of the logger thread.')
+BATCH_SIZE_TARGET = METRICS.gauge('batch_size_target', 'Logs per insertion the logger thread aims for.')
+FLUSHES = METRICS.counter('flushes_total', 'Wake-ups of the logger thread that inserted the buffer, by trigger.',
+                          ['trigger'])
+BATCH_SIZE = METRICS.histogram('batch_size', 'Logs per insertion.', BATCH_SIZE_BUCKETS)
+INSERT_LATENCY = METRICS.histogram('insert_latency_seconds', 'Time of one insertion into the storage backend.',
+                                   INSERT_BUCKETS)
+LOGS_INSERTED = METRICS.counter('logs_inserted_total', 'Logs inserted into the storage backend.')
+INSERT_FAILURES = METRICS.counter('insert_failures_total', 'Insertions that failed.')
@@ -1,19 +1,41 @@
-import ipaddress
-import json
-import pathlib
+import asyncio
+import atexit
 import time
 
 import jwt
-import geoip2.database
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.urls import resolve
+from django.urls import resolve, Resolver404
 from django.utils import timezone
 from rest_framework.parsers import MultiPartParser
+from rest_framework.request import Empty
 
 from drf_user_activity_tracker_mongodb import ACTIVITY_TRACKER_SIGNAL
-from drf_user_activity_tracker_mongodb.start_logger_when_server_starts import LOGGER_THREAD
-from drf_user_activity_tracker_mongodb.utils import get_headers, get_client_ip, mask_sensitive_data
+from drf_user_activity_tracker_mongodb.codec import get_json_codec
+from drf_user_activity_tracker_mongodb.events import EventDispatcher
+from drf_user_activity_tracker_mongodb.headers import build_header_policy
+from drf_user_activity_tracker_mongodb.metrics import MIDDLEWARE_OVERHEAD, REQUESTS, metrics_enabled
+from drf_user_activity_tracker_mongodb.multipart import get_multipart_metadata, get_parsed_multipart, scan_multipart
+from drf_user_activity_tracker_mongodb.sampling import get_sampling_policy, get_user_rate_limiter
+from drf_user_activity_tracker_mongodb.start_logger_when_server_starts import (get_logger_thread,
+                                                                                get_started_logger_thread)
+from drf_user_activity_tracker_mongodb.utils import (get_client_ip,
+                                                     mask_sensitive_data,
+                                                     GEOIP_COUNTRY_LOOKUP,
+                                                     LRUCache,
+                                                     capture_data,
+                                                     get_too_large_summary,
+                                                     URL_NAME_INDEX)
+
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:  # asgiref < 3.6
+    from asyncio import iscoroutinefunction
+
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
 
 User = get_user_model()
 
@@ -24,10 +46,18 @@ Class: ActivityTrackerMiddleware
 
 
 class ActivityTrackerMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
         # One-time configuration and initialization.
 
+        # Django runs this middleware natively on both WSGI and ASGI.
+        self._is_async = iscoroutinefunction(self.get_response)
+        if self._is_async:
+            markcoroutinefunction(self)
+
         self.DRF_ACTIVITY_TRACKER_DATABASE = False
         if hasattr(settings, 'DRF_ACTIVITY_TRACKER_DATABASE'):
             self.DRF_ACTIVITY_TRACKER_DATABASE = settings.DRF_ACTIVITY_TRACKER_DATABASE
@@ -41,7 +71,8 @@ class ActivityTrackerMiddleware:
             if settings.DRF_ACTIVITY_TRACKER_PATH_TYPE in ['ABSOLUTE', 'RAW_URI', 'FULL_PATH']:
                 self.DRF_ACTIVITY_TRACKER_PATH_TYPE = settings.DRF_ACTIVITY_TRACKER_PATH_TYPE
 
-        self.DRF_ACTIVITY_TRACKER_SKIP_URL_NAME = ['user_history', 'admin_history']
+        self.DRF_ACTIVITY_TRACKER_SKIP_URL_NAME = ['user_history', 'admin_history', 'activity_log:metrics',
+                                                   'activity_log:rollups']
         if hasattr(settings, 'DRF_ACTIVITY_TRACKER_SKIP_URL_NAME'):
             if isinstance(settings.DRF_ACTIVITY_TRACKER_SKIP_URL_NAME, (tuple, list)):
                 self.DRF_ACTIVITY_TRACKER_SKIP_URL_NAME.extend(settings.DRF_ACTIVITY_TRACKER_SKIP_URL_NAME)
@@ -71,141 +102,460 @@ class ActivityTrackerMiddleware:
             if isinstance(settings.DRF_ACTIVITY_TRACKER_REMOVE_DATA_KEYS, (tuple, list)):
                 self.DRF_ACTIVITY_TRACKER_REMOVE_DATA_KEYS = settings.DRF_ACTIVITY_TRACKER_REMOVE_DATA_KEYS
 
-    def __call__(self, request):
-        
-        method = request.method
-
-        # Log only registered methods if available.
-        if len(self.DRF_ACTIVITY_TRACKER_METHODS) > 0 and method not in self.DRF_ACTIVITY_TRACKER_METHODS:
-            return self.get_response(request)
+        self.DRF_ACTIVITY_TRACKER_ROUTE_CACHE_SIZE = 2048  # Default route cache size is 2048 paths
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_ROUTE_CACHE_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_ROUTE_CACHE_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_ROUTE_CACHE_SIZE = settings.DRF_ACTIVITY_TRACKER_ROUTE_CACHE_SIZE
+
+        self.DRF_ACTIVITY_TRACKER_CAPTURE_MODE = 'DATA'
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_CAPTURE_MODE'):
+            if settings.DRF_ACTIVITY_TRACKER_CAPTURE_MODE in ['DATA', 'CONTENT']:
+                self.DRF_ACTIVITY_TRACKER_CAPTURE_MODE = settings.DRF_ACTIVITY_TRACKER_CAPTURE_MODE
+
+        self.DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE = 1024 * 1024  # Default max captured size is 1 MB per body
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE = settings.DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE
+
+        self.DRF_ACTIVITY_TRACKER_MULTIPART_CAPTURE = 'METADATA'
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MULTIPART_CAPTURE'):
+            if settings.DRF_ACTIVITY_TRACKER_MULTIPART_CAPTURE in ['METADATA', 'PARSE']:
+                self.DRF_ACTIVITY_TRACKER_MULTIPART_CAPTURE = settings.DRF_ACTIVITY_TRACKER_MULTIPART_CAPTURE
+
+        self.DRF_ACTIVITY_TRACKER_MULTIPART_VALUE_MAX_LENGTH = 256  # Default to 256 characters per form value
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MULTIPART_VALUE_MAX_LENGTH'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_MULTIPART_VALUE_MAX_LENGTH, int):
+                self.DRF_ACTIVITY_TRACKER_MULTIPART_VALUE_MAX_LENGTH = \
+                    settings.DRF_ACTIVITY_TRACKER_MULTIPART_VALUE_MAX_LENGTH
+
+        self.DRF_ACTIVITY_TRACKER_MULTIPART_SCAN_MAX_SIZE = 10 * 1024 * 1024  # Default to 10 MB per scanned body
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MULTIPART_SCAN_MAX_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_MULTIPART_SCAN_MAX_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_MULTIPART_SCAN_MAX_SIZE = \
+                    settings.DRF_ACTIVITY_TRACKER_MULTIPART_SCAN_MAX_SIZE
+
+        self.JWT_ALGORITHM = 'HS256'
+        if hasattr(settings, 'JWT_ALGORITHM') and isinstance(settings.JWT_ALGORITHM, str):
+            self.JWT_ALGORITHM = settings.JWT_ALGORITHM
+
+        self.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_SIZE = 1024  # Default token cache size is 1024 tokens
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_TOKEN_CACHE_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_SIZE = settings.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_SIZE
+
+        self.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_TTL = 300  # Tokens without "exp" are cached for 5 minutes
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_TOKEN_CACHE_TTL'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_TTL, int):
+                self.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_TTL = settings.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_TTL
+
+        self.DRF_ACTIVITY_TRACKER_USE_REQUEST_AUTH = False
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_USE_REQUEST_AUTH'):
+            self.DRF_ACTIVITY_TRACKER_USE_REQUEST_AUTH = bool(settings.DRF_ACTIVITY_TRACKER_USE_REQUEST_AUTH)
+
+        self.DRF_ACTIVITY_TRACKER_SIGNAL_DISPATCH = 'SYNC'
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_SIGNAL_DISPATCH'):
+            if settings.DRF_ACTIVITY_TRACKER_SIGNAL_DISPATCH in ['SYNC', 'THREAD']:
+                self.DRF_ACTIVITY_TRACKER_SIGNAL_DISPATCH = settings.DRF_ACTIVITY_TRACKER_SIGNAL_DISPATCH
+
+        if self.DRF_ACTIVITY_TRACKER_SIGNAL and self.DRF_ACTIVITY_TRACKER_SIGNAL_DISPATCH == 'THREAD':
+            self._set_signal_dispatcher()
+
+        # Lookup tables used on every request.
+        self._enabled = bool(self.DRF_ACTIVITY_TRACKER_DATABASE or self.DRF_ACTIVITY_TRACKER_SIGNAL)
+        self._methods = frozenset(self.DRF_ACTIVITY_TRACKER_METHODS)
+        self._skip_url_names = frozenset(self.DRF_ACTIVITY_TRACKER_SKIP_URL_NAME)
+        self._skip_namespaces = frozenset(self.DRF_ACTIVITY_TRACKER_SKIP_NAMESPACE)
+        self._dont_skip_url_names = frozenset(self.DRF_ACTIVITY_TRACKER_DONT_SKIP_URL_NAME)
+        self._route_cache = LRUCache(max_size=self.DRF_ACTIVITY_TRACKER_ROUTE_CACHE_SIZE)
+        self._token_cache = LRUCache(max_size=self.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_SIZE)
+        self._sampling_policy = get_sampling_policy()
+        self._user_rate_limiter = get_user_rate_limiter()
+        self._metrics_enabled = metrics_enabled()
+        self._json_codec = get_json_codec()
+        self._header_policy = build_header_policy()
+
+    @staticmethod
+    def _set_signal_dispatcher():
+        if ACTIVITY_TRACKER_SIGNAL.listen.dispatcher is not None:
+            return
+
+        workers = 2  # Default to 2 worker threads
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_SIGNAL_WORKERS'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_SIGNAL_WORKERS, int):
+                workers = settings.DRF_ACTIVITY_TRACKER_SIGNAL_WORKERS
+
+        max_size = 1000  # Default to 1000 pending events
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_SIGNAL_QUEUE_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_SIGNAL_QUEUE_SIZE, int):
+                max_size = settings.DRF_ACTIVITY_TRACKER_SIGNAL_QUEUE_SIZE
+
+        block_timeout = 0  # Drop the event at once when the queue is full
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_SIGNAL_BLOCK_TIMEOUT'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_SIGNAL_BLOCK_TIMEOUT, (int, float)):
+                block_timeout = settings.DRF_ACTIVITY_TRACKER_SIGNAL_BLOCK_TIMEOUT
+
+        dispatcher = EventDispatcher(workers=workers, max_size=max_size, block_timeout=block_timeout)
+        ACTIVITY_TRACKER_SIGNAL.listen.set_dispatcher(dispatcher)
+        atexit.register(dispatcher.shutdown)
+
+    def _get_route(self, request):
+        """
+        Returns (url_name, namespace, track) for the request path.
+        Each path is resolved once, then the decision is served from the route cache.
+        """
+        urlconf = getattr(request, 'urlconf', None)
+        # Routes cached before the URLconf was reloaded are never served again.
+        key = (URL_NAME_INDEX.get_version(urlconf), urlconf, request.path)
+        route = self._route_cache.get(key)
+        if route is not None:
+            return route
+
+        try:
+            match = resolve(request.path, urlconf=urlconf)
+        except Resolver404:
+            # Unknown paths are not cached, so they can't flood the route cache.
+            return None, None, False
+
+        url_name, namespace = match.url_name, match.namespace
+        # Always skip Admin panel, skipped url names and skipped namespaces.
+        # Skipped url names can be namespace qualified, e.g. "orders:detail".
+        track = (namespace != 'admin' and url_name not in self._skip_url_names and
+                 match.view_name not in self._skip_url_names and namespace not in self._skip_namespaces)
+        route = (url_name, namespace, track)
+        self._route_cache.set(key, route)
+        return route
+
+    def _get_token_payload(self, token):
+        """
+        Returns the payload keys of a token. Raises if the token is invalid.
+        Decoded tokens are cached until their "exp" claim, so a reused access token is verified once.
+        """
+        payload_data = self._token_cache.get(token)
+        if payload_data is not None:
+            return payload_data
+
+        user_token = jwt.decode(jwt=token, key=settings.SECRET_KEY, algorithms=[self.JWT_ALGORITHM])
+        payload_data = self._get_payload_keys(user_token)
+
+        expires_at = user_token.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            expires_at = time.time() + self.DRF_ACTIVITY_TRACKER_TOKEN_CACHE_TTL
+        self._token_cache.set(token, payload_data, expires_at=expires_at)
+        return payload_data
+
+    def _get_payload_keys(self, payload):
+        """
+        Returns the payload keys of a decoded token.
+        A numeric user id claim (Simple JWT stores it as a string) is logged as an int, like `user.pk`.
+        """
+        payload_data = {key: payload.get(key) for key in self.DRF_ACTIVITY_TRACKER_TOKEN_PAYLOAD_KEYS}
+        user_id = payload_data.get('user_id')
+        if isinstance(user_id, str) and user_id.isdigit():
+            payload_data['user_id'] = int(user_id)
+        return payload_data
+
+    def _get_request_auth_payload(self, request):
+        """
+        Returns the payload keys of a request already authenticated by DRF, or None.
+        """
+        auth = getattr(request, 'auth', None)
+        if auth is None:
+            return None
+
+        # Simple JWT sets request.auth to the validated token.
+        payload = getattr(auth, 'payload', None)
+        if isinstance(payload, dict):
+            return self._get_payload_keys(payload)
+
+        user = getattr(request, 'user', None)
+        if set(self.DRF_ACTIVITY_TRACKER_TOKEN_PAYLOAD_KEYS) == {'user_id'} and user is not None and \
+                user.is_authenticated:
+            return {'user_id': user.pk}
+        return None
+
+    def _get_payload_data(self, request, response, url_name):
+        header_token = request.META.get("HTTP_AUTHORIZATION")
+        if header_token:
+            try:
+                token = header_token.split()[1]
+                return self._get_token_payload(token)
+            except:
+                return None
 
+        elif hasattr(response, 'data') and isinstance(response.data, dict) and response.data.get('access'):
+            try:
+                return self._get_token_payload(response.data.get('access'))
+            except:
+                return None
+
+        elif url_name in self._dont_skip_url_names:
+            return {key: None for key in self.DRF_ACTIVITY_TRACKER_TOKEN_PAYLOAD_KEYS}
+
+        return None
+
+    def _get_json_request_body(self, request):
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        # The body is not even read when it is too large to be logged.
+        if content_length > self.DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE:
+            return get_too_large_summary(content_length)
+        return self._json_codec.loads(request.body) if request.body else ''
+
+    def _get_parsed_request_data(self, request, response):
+        renderer_context = getattr(response, 'renderer_context', None) or {}
+        drf_request = renderer_context.get('request')
+        parsed_data = getattr(drf_request, '_full_data', Empty)
+        if parsed_data is not Empty:
+            return capture_data(parsed_data, self.DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE) if parsed_data else ''
+
+        # The view didn't parse the body, so it is still readable.
+        try:
+            return self._get_json_request_body(request)
+        except:
+            return ''
+
+    def _get_multipart_metadata(self, request, response):
+        """
+        Metadata of a multipart body, from the data parsed by the view or by scanning the unread body.
+        """
+        try:
+            parsed = get_parsed_multipart(request, response)
+            if parsed is not None:
+                return get_multipart_metadata(*parsed, self.DRF_ACTIVITY_TRACKER_MULTIPART_VALUE_MAX_LENGTH)
+            return scan_multipart(request, self.DRF_ACTIVITY_TRACKER_MULTIPART_SCAN_MAX_SIZE,
+                                  self.DRF_ACTIVITY_TRACKER_MULTIPART_VALUE_MAX_LENGTH) or ''
+        except:
+            return ''
+
+    def _get_response_body(self, response):
+        if getattr(response, 'streaming', False):
+            return '** Streaming **'
+
+        if self.DRF_ACTIVITY_TRACKER_CAPTURE_MODE == 'DATA' and hasattr(response, 'data'):
+            return capture_data(response.data, self.DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE)
+
+        content = response.content
+        if len(content) > self.DRF_ACTIVITY_TRACKER_CAPTURE_MAX_SIZE:
+            return get_too_large_summary(len(content))
+        return self._json_codec.loads(content)
+
+    def _check_request(self, request):
+        """
+        Returns (track, url_name, sample_weight). Untracked requests pay only for the cached checks.
+        A sample weight of 0 means the request is only logged if it fails.
+        """
         # Run only if logger is enabled.
-        if self.DRF_ACTIVITY_TRACKER_DATABASE or self.DRF_ACTIVITY_TRACKER_SIGNAL:
+        if not self._enabled:
+            return False, None, 0
 
-            url_name = resolve(request.path).url_name
-            namespace = resolve(request.path).namespace
+        # Log only registered methods if available.
+        if self._methods and request.method not in self._methods:
+            return False, None, 0
+
+        url_name, namespace, track = self._get_route(request)
+        sample_weight = 1
+        if track and self._sampling_policy is not None and url_name not in self._dont_skip_url_names:
+            sample_weight = self._sampling_policy.get_sample_weight(url_name, namespace, request.method)
+        return track, url_name, sample_weight
+
+    def _is_rate_limited(self, payload_data, response):
+        # Errors are never dropped.
+        if self._user_rate_limiter is None or response.status_code >= 400:
+            return False
+        user_id = payload_data.get('user_id')
+        return user_id is not None and not self._user_rate_limiter.allow(user_id)
+
+    @staticmethod
+    def _is_json_request(request):
+        return request.content_type.find('application/json') != -1 or request.content_type.find(
+            'application/vnd.api+json') != -1
+
+    def _get_request_data(self, request):
+        request_data = ''
+        try:
+            # In DATA mode JSON bodies are taken from DRF's parsed data once the view has run.
+            if self._is_json_request(request) and self.DRF_ACTIVITY_TRACKER_CAPTURE_MODE == 'CONTENT':
+                request_data = self._get_json_request_body(request)
+            elif request.content_type == 'multipart/form-data' and \
+                    self.DRF_ACTIVITY_TRACKER_MULTIPART_CAPTURE == 'PARSE':
+                parser_obj = MultiPartParser()
+                context = {'request': request}
+                request_data = parser_obj.parse(stream=request._stream, media_type=request.META['CONTENT_TYPE'],
+                                                parser_context=context) if request.body else ''
+                request_data = dict(request_data.data)
+        except:
+            pass
+        return request_data
+
+    def _get_log_data(self, request, response, url_name, request_data, start_time, sample_weight=1):
+        """
+        Builds the log of a tracked request once the view has run, or returns None if it must not be logged.
+        """
+        payload_data = None
+        if self.DRF_ACTIVITY_TRACKER_USE_REQUEST_AUTH:
+            payload_data = self._get_request_auth_payload(request)
+
+        if payload_data is None:
+            payload_data = self._get_payload_data(request, response, url_name)
+            if payload_data is None:
+                return None
+
+        if url_name not in self._dont_skip_url_names and self._is_rate_limited(payload_data, response):
+            return None
+
+        if response.get('content-type') not in ('application/json', 'application/vnd.api+json',):
+            return None
+
+        if self._is_json_request(request) and self.DRF_ACTIVITY_TRACKER_CAPTURE_MODE == 'DATA':
+            request_data = self._get_parsed_request_data(request, response)
+        elif request.content_type == 'multipart/form-data' and \
+                self.DRF_ACTIVITY_TRACKER_MULTIPART_CAPTURE == 'METADATA':
+            request_data = self._get_multipart_metadata(request, response)
+
+        # Headers are redacted while they are captured.
+        headers = self._header_policy.capture(request.META)
+        response_body = self._get_response_body(response)
+
+        if self.DRF_ACTIVITY_TRACKER_PATH_TYPE == 'ABSOLUTE':
+            api = request.build_absolute_uri()
+        elif self.DRF_ACTIVITY_TRACKER_PATH_TYPE == 'FULL_PATH':
+            api = request.get_full_path()
+        elif self.DRF_ACTIVITY_TRACKER_PATH_TYPE == 'RAW_URI':
+            api = request.get_raw_uri()
+        else:
+            api = request.build_absolute_uri()
+
+        ip = get_client_ip(request)
+        country_name = GEOIP_COUNTRY_LOOKUP.country_name(ip)
+
+        data = dict(
+            url_name=url_name,
+            url_path=request.path,
+            api=api,
+            headers=headers,
+            body=mask_sensitive_data(request_data),
+            method=request.method,
+            client_ip_address=ip,
+            response=mask_sensitive_data(response_body),
+            status_code=response.status_code,
+            execution_time=time.time() - start_time,
+            created_time=timezone.now(),
+            country=country_name,
+        )
+        data.update(payload_data)
+        # Errors are always kept, so each one stands for itself.
+        if sample_weight != 1 and response.status_code < 400:
+            data['sample_weight'] = sample_weight
+        for must_remove_data in self.DRF_ACTIVITY_TRACKER_REMOVE_DATA_KEYS:
+            data.pop(must_remove_data, None)
+        return data
+
+    def _send_log_data(self, data):
+        if self.DRF_ACTIVITY_TRACKER_DATABASE:
+            self._put_log_data(get_logger_thread(), data)
+        if self.DRF_ACTIVITY_TRACKER_SIGNAL:
+            ACTIVITY_TRACKER_SIGNAL.listen(**data)
+
+    async def _asend_log_data(self, data):
+        """
+        Sends the log from the event loop. Starting the logger thread (database connection, journal scan),
+        SYNC signal listeners and a dispatcher that may wait for room run in a thread.
+        """
+        if self.DRF_ACTIVITY_TRACKER_DATABASE:
+            logger_thread = get_started_logger_thread()
+            if logger_thread is None:
+                logger_thread = await sync_to_async(get_logger_thread, thread_sensitive=False)()
+            self._put_log_data(logger_thread, data)
+        if self.DRF_ACTIVITY_TRACKER_SIGNAL:
+            dispatcher = ACTIVITY_TRACKER_SIGNAL.listen.dispatcher
+            if dispatcher is None or dispatcher.block_timeout:
+                await sync_to_async(ACTIVITY_TRACKER_SIGNAL.listen)(**data)
+            else:
+                ACTIVITY_TRACKER_SIGNAL.listen(**data)
 
-            # Always skip Admin panel
-            if namespace == 'admin':
-                return self.get_response(request)
+    def _put_log_data(self, logger_thread, data):
+        if logger_thread:
+            # The writer compresses fields and adds _id in place, listeners get the log as it was built.
+            logger_thread.put_log_data(data=dict(data) if self.DRF_ACTIVITY_TRACKER_SIGNAL else data)
 
-            # Skip for url name
-            if url_name in self.DRF_ACTIVITY_TRACKER_SKIP_URL_NAME:
-                return self.get_response(request)
+    def _track_metrics(self, outcome, start_time=None, view_time=0):
+        REQUESTS.inc(labels=(outcome,))
+        if start_time is not None:
+            MIDDLEWARE_OVERHEAD.observe(time.perf_counter() - start_time - view_time)
 
-            # Skip entire app using namespace
-            if namespace in self.DRF_ACTIVITY_TRACKER_SKIP_NAMESPACE:
-                return self.get_response(request)
+    def __call__(self, request):
+        if self._is_async:
+            return self.__acall__(request)
+
+        check_start_time = time.perf_counter()
+        track, url_name, sample_weight = self._check_request(request)
+        if not track:
+            if self._metrics_enabled:
+                self._track_metrics('untracked')
+            return self.get_response(request)
 
-            start_time = time.time()
-            request_data = ''
-            try:
-                if request.content_type.find('application/json') != -1 or request.content_type.find(
-                        'application/vnd.api+json') != -1:
-                    request_data = json.loads(request.body) if request.body else ''
-                elif request.content_type == 'multipart/form-data':
-                    parser_obj = MultiPartParser()
-                    context = {'request': request}
-                    request_data = parser_obj.parse(stream=request._stream, media_type=request.META['CONTENT_TYPE'],
-                                                    parser_context=context) if request.body else ''
-                    request_data = dict(request_data.data)
-            except:
-                pass
-
-            # Code to be executed for each request before
-            # the view (and later middleware) are called.
-            response = self.get_response(request)
-
-            # Code to be executed for each request/response after
-            # the view is called.
-
-            header_token = request.META.get("HTTP_AUTHORIZATION")
-            algorithm = 'HS256'
-            if hasattr(settings, "JWT_ALGORITHM") and isinstance(settings.JWT_ALGORITHM, str):
-                algorithm = settings.JWT_ALGORITHM
-
-            payload_data = {}
-            if header_token:
-                try:
-                    token = header_token.split()[1]
-                    user_token = jwt.decode(jwt=token, key=settings.SECRET_KEY, algorithms=[algorithm])
-                except:
-                    return response
-                for key in self.DRF_ACTIVITY_TRACKER_TOKEN_PAYLOAD_KEYS:
-                    payload_data[key] = user_token.get(key)
-
-            elif hasattr(response, 'data') and isinstance(response.data, dict) and response.data.get('access'):
-                try:
-                    user_token = jwt.decode(jwt=response.data.get('access'), key=settings.SECRET_KEY,
-                                            algorithms=[algorithm])
-                except:
-                    return response
-                for key in self.DRF_ACTIVITY_TRACKER_TOKEN_PAYLOAD_KEYS:
-                    payload_data[key] = user_token.get(key)
-
-            elif url_name in self.DRF_ACTIVITY_TRACKER_DONT_SKIP_URL_NAME:
-                for key in self.DRF_ACTIVITY_TRACKER_TOKEN_PAYLOAD_KEYS:
-                    payload_data[key] = None
-            else:
-                return response
-
-            headers = get_headers(request=request)
-
-
-            if response.get('content-type') in ('application/json', 'application/vnd.api+json',):
-                if getattr(response, 'streaming', False):
-                    response_body = '** Streaming **'
-                else:
-                    if isinstance(response.content, bytes):
-                        response_body = json.loads(response.content.decode())
-                    else:
-                        response_body = json.loads(response.content)
-                if self.DRF_ACTIVITY_TRACKER_PATH_TYPE == 'ABSOLUTE':
-                    api = request.build_absolute_uri()
-                elif self.DRF_ACTIVITY_TRACKER_PATH_TYPE == 'FULL_PATH':
-                    api = request.get_full_path()
-                elif self.DRF_ACTIVITY_TRACKER_PATH_TYPE == 'RAW_URI':
-                    api = request.get_raw_uri()
-                else:
-                    api = request.build_absolute_uri()
-
-                ip = get_client_ip(request)
-                try:
-                    with geoip2.database.Reader(
-                            '{}/geo_databases/GeoLite2-Country.mmdb'.format(pathlib.Path(__file__).parent.parent)
-                    ) as reader:
-                        country_response = reader.country(ip)
-                        country_name = country_response.country.name
-                except:
-                    country_name = ''
-
-                data = dict(
-                    url_name=url_name,
-                    url_path=request.path,
-                    api=api,
-                    headers=mask_sensitive_data(headers),
-                    body=mask_sensitive_data(request_data),
-                    method=method,
-                    client_ip_address=ip,
-                    response=mask_sensitive_data(response_body),
-                    status_code=response.status_code,
-                    execution_time=time.time() - start_time,
-                    created_time=timezone.now(),
-                    country=country_name,
-                )
-                data.update(payload_data)
-                for must_remove_data in self.DRF_ACTIVITY_TRACKER_REMOVE_DATA_KEYS:
-                    data.pop(must_remove_data, None)
-
-                if self.DRF_ACTIVITY_TRACKER_DATABASE:
-                    if LOGGER_THREAD:
-                        LOGGER_THREAD.put_log_data(data=data)
-                if self.DRF_ACTIVITY_TRACKER_SIGNAL:
-                    ACTIVITY_TRACKER_SIGNAL.listen(**data)
-            else:
-                return response
+        start_time = time.time()
+        # Bodies of requests left out of the sample are never parsed.
+        request_data = self._get_request_data(request) if sample_weight else ''
+
+        # Code to be executed for each request before
+        # the view (and later middleware) are called.
+        view_start_time = time.perf_counter()
+        response = self.get_response(request)
+        view_time = time.perf_counter() - view_start_time
+
+        # Code to be executed for each request/response after
+        # the view is called.
+        outcome = self._log_response(request, response, url_name, request_data, start_time, sample_weight)
+        if self._metrics_enabled:
+            self._track_metrics(outcome, check_start_time, view_time)
+        return response
 
-        else:
-            response = self.get_response(request)
+    async def __acall__(self, request):
+        """
+        ASGI path. The log is built on the event loop without a thread hop, the logger
+        buffer never blocks, and the database insertion runs in the logger thread.
+        Blocking work of _asend_log_data runs in a thread.
+        """
+        check_start_time = time.perf_counter()
+        track, url_name, sample_weight = self._check_request(request)
+        if not track:
+            if self._metrics_enabled:
+                self._track_metrics('untracked')
+            return await self.get_response(request)
+
+        start_time = time.time()
+        request_data = self._get_request_data(request) if sample_weight else ''
+
+        view_start_time = time.perf_counter()
+        response = await self.get_response(request)
+        view_time = time.perf_counter() - view_start_time
+
+        outcome, data = self._build_log(request, response, url_name, request_data, start_time, sample_weight)
+        if data is not None:
+            await self._asend_log_data(data)
+        if self._metrics_enabled:
+            self._track_metrics(outcome, check_start_time, view_time)
         return response
 
+    def _build_log(self, request, response, url_name, request_data, start_time, sample_weight):
+        """
+        Returns the outcome counted by the metrics, and the log of a tracked request or None if it isn't logged.
+        """
+        if not sample_weight and response.status_code < 400:
+            return 'unsampled', None
+        data = self._get_log_data(request, response, url_name, request_data, start_time, sample_weight)
+        if data is None:
+            return 'skipped', None
+        return 'logged', data
+
+    def _log_response(self, request, response, url_name, request_data, start_time, sample_weight):
+        """
+        Sends the log of a tracked request, and returns the outcome counted by the metrics.
+        """
+        outcome, data = self._build_log(request, response, url_name, request_data, start_time, sample_weight)
+        if data is not None:
+            self._send_log_data(data)
+        return outcome
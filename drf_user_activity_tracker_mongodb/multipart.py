@@ -0,0 +1,115 @@
+from io import BytesIO
+
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParser
+from rest_framework.request import Empty
+
+from drf_user_activity_tracker_mongodb.redaction import TRUNCATED_MARKER
+
+
+class FileMetadataUploadHandler(FileUploadHandler):
+    """
+    Upload handler that keeps the name, size and content type of the files, and drops their content.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.files = []
+        self.size = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.files.append((self.field_name, get_file_metadata(self.file_name, self.size, self.content_type)))
+        return None
+
+
+def get_file_metadata(name, size, content_type):
+    return {'name': name, 'size': size, 'content_type': content_type}
+
+
+def _capture_field(value, max_length):
+    if isinstance(value, str) and len(value) > max_length:
+        return value[:max_length] + TRUNCATED_MARKER
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)[:max_length]
+
+
+def _add(metadata, key, value):
+    if key in metadata:
+        if not isinstance(metadata[key], list):
+            metadata[key] = [metadata[key]]
+        metadata[key].append(value)
+    else:
+        metadata[key] = value
+
+
+def get_multipart_metadata(data, files, max_length):
+    """
+    Returns the fields of a multipart body with values cut to max_length characters,
+    and the name, size and content type of its files. File contents are never read.
+    """
+    metadata = {}
+    if data is not None:
+        items = data.lists() if hasattr(data, 'lists') else ((key, [value]) for key, value in data.items())
+        for key, values in items:
+            for value in values:
+                if hasattr(value, 'size') and hasattr(value, 'name'):
+                    # DRF keeps the uploaded files in request.data too.
+                    continue
+                _add(metadata, key, _capture_field(value, max_length))
+    if files is not None:
+        for key, uploaded_files in files.lists():
+            for uploaded_file in uploaded_files:
+                _add(metadata, key, get_file_metadata(uploaded_file.name, uploaded_file.size,
+                                                      getattr(uploaded_file, 'content_type', None)))
+    return metadata
+
+
+def get_parsed_multipart(request, response):
+    """
+    Returns the (data, files) already parsed by the view, or None if the view didn't parse the body.
+    """
+    renderer_context = getattr(response, 'renderer_context', None) or {}
+    drf_request = renderer_context.get('request')
+    if drf_request is not None and getattr(drf_request, '_full_data', Empty) is not Empty:
+        return getattr(drf_request, '_data', None), getattr(drf_request, '_files', None)
+
+    # Django sets _post and _files once request.POST or request.FILES is read.
+    if '_files' in request.__dict__:
+        return request.__dict__.get('_post'), request.__dict__['_files']
+    return None
+
+
+def scan_multipart(request, max_size, max_length):
+    """
+    Parses a multipart body the view didn't read, and returns its metadata. The file contents are dropped
+    chunk by chunk. Returns None when the body is larger than max_size bytes or was already streamed by the view.
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return None
+    if not content_length or content_length > max_size:
+        return None
+
+    if hasattr(request, '_body'):
+        stream = BytesIO(request._body)
+    elif not getattr(request, '_read_started', False):
+        stream = request
+    else:
+        return None
+
+    handler = FileMetadataUploadHandler(request)
+    data, _ = MultiPartParser(request.META, stream, [handler], request.encoding).parse()
+    metadata = get_multipart_metadata(data, None, max_length)
+    for key, file_metadata in handler.files:
+        _add(metadata, key, file_metadata)
+    return metadata
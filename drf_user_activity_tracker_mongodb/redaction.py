@@ -0,0 +1,218 @@
+import fnmatch
+import re
+import threading
+
+from django.conf import settings
+
+FILTERED_MARKER = '***FILTERED***'
+TRUNCATED_MARKER = '** Truncated **'
+
+SENSITIVE_KEYS = ['password', 'access', 'refresh']
+if hasattr(settings, 'DRF_ACTIVITY_TRACKER_EXCLUDE_KEYS'):
+    if isinstance(settings.DRF_ACTIVITY_TRACKER_EXCLUDE_KEYS, (list, tuple)):
+        SENSITIVE_KEYS.extend(settings.DRF_ACTIVITY_TRACKER_EXCLUDE_KEYS)
+
+# Types that never hold anything to hide, skipped by the scan without any Python level check.
+SCALAR_TYPES = frozenset([int, float, bool, type(None)])
+SCALAR_AND_STRING_TYPES = SCALAR_TYPES | {str}
+
+# Card numbers of 13 to 19 digits, optionally grouped by spaces or dashes.
+CARD_NUMBER_PATTERN = r'\b(?:\d[ -]?){12,18}\d\b'
+
+
+def _compile_patterns(patterns, glob=False):
+    """
+    Compiles strings and re.Pattern objects into one regex. Strings are globs when `glob` is True.
+    """
+    sources = []
+    for pattern in patterns:
+        if isinstance(pattern, re.Pattern):
+            sources.append(pattern.pattern)
+        elif isinstance(pattern, str):
+            sources.append(fnmatch.translate(pattern) if glob else pattern)
+    if not sources:
+        return None
+    return re.compile('|'.join('(?:{})'.format(source) for source in sources), re.IGNORECASE if glob else 0)
+
+
+class RedactionPlan:
+    """
+    Hides sensitive keys and values of nested dicts and lists in a single iterative pass, level by level.
+    Containers are copied only when something inside them is hidden, the caller's data is never changed.
+    Containers nested deeper than `max_depth`, or past `max_nodes` containers counted from the top level down,
+    are replaced with TRUNCATED_MARKER, so no unchecked data is ever returned.
+    """
+    KEY_CACHE_SIZE = 4096
+
+    def __init__(self, keys=(), ignore_case=False, key_patterns=(), value_patterns=(), max_depth=32,
+                 max_nodes=10000):
+        self.ignore_case = ignore_case
+        self.keys = frozenset(key.lower() if ignore_case and isinstance(key, str) else key for key in keys)
+        self.key_pattern = _compile_patterns(key_patterns, glob=True)
+        self.value_pattern = _compile_patterns(value_patterns)
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self._key_cache = {}
+        # Without patterns, a dict with no sensitive key is found by one set operation.
+        self._exact_keys_only = self.key_pattern is None and not ignore_case
+
+    def is_sensitive_key(self, key):
+        try:
+            return self._key_cache[key]
+        except KeyError:
+            pass
+        except TypeError:  # Unhashable keys can't be sensitive
+            return False
+
+        lookup_key = key.lower() if self.ignore_case and isinstance(key, str) else key
+        sensitive = lookup_key in self.keys or bool(
+            self.key_pattern is not None and isinstance(key, str) and self.key_pattern.match(key))
+        if len(self._key_cache) < self.KEY_CACHE_SIZE:
+            self._key_cache[key] = sensitive
+        return sensitive
+
+    def _redact_string(self, value):
+        if self.value_pattern is None:
+            return value
+        return self.value_pattern.sub(FILTERED_MARKER, value)
+
+    def redact(self, data):
+        if isinstance(data, str):
+            return self._redact_string(data)
+        if not isinstance(data, (dict, list, tuple)):
+            return data
+
+        nodes = self.max_nodes
+        max_depth = self.max_depth
+        keys = self.keys
+        exact_keys_only = self._exact_keys_only
+        key_cache = self._key_cache
+        value_pattern = self.value_pattern
+        skipped_types = SCALAR_TYPES if value_pattern is not None else SCALAR_AND_STRING_TYPES
+        copy_container = self._copy
+        # Containers are visited level by level. An entry is (container, index of its parent in the level above,
+        # key in the parent), the copies of a level are kept by index.
+        levels = []
+        level = [(data, None, None)]
+        depth = 0
+        changed = False
+        while level:
+            copies = {}
+            next_level = []
+            add = next_level.append
+            truncate = depth >= max_depth
+            for index, (container, _, _) in enumerate(level):
+                copy = None
+                hidden = None
+                if isinstance(container, dict):
+                    if exact_keys_only:
+                        if not keys.isdisjoint(container):
+                            hidden = keys.intersection(container)
+                    else:
+                        for key in container:
+                            sensitive = key_cache.get(key)
+                            if sensitive is None:
+                                sensitive = self.is_sensitive_key(key)
+                            if sensitive:
+                                if hidden is None:
+                                    hidden = set()
+                                hidden.add(key)
+                    if hidden:
+                        copy = dict(container)
+                        for key in hidden:
+                            copy[key] = FILTERED_MARKER
+                        # Hidden values are strings in the copy, so they are never visited.
+                        items = copy.items()
+                    else:
+                        items = container.items()
+                else:
+                    items = enumerate(container)
+
+                for key, value in items:
+                    value_type = value.__class__
+                    if value_type in skipped_types:
+                        continue
+                    if value_type is dict or value_type is list or isinstance(value, (dict, list, tuple)):
+                        if truncate or nodes <= 0:
+                            if copy is None:
+                                copy = copy_container(container)
+                            copy[key] = TRUNCATED_MARKER
+                        else:
+                            nodes -= 1
+                            add((value, index, key))
+                    elif value_pattern is not None and isinstance(value, str):
+                        redacted = value_pattern.sub(FILTERED_MARKER, value)
+                        if redacted != value:
+                            if copy is None:
+                                copy = copy_container(container)
+                            copy[key] = redacted
+                if copy is not None:
+                    copies[index] = copy
+                    changed = True
+            levels.append((level, copies))
+            level = next_level
+            depth += 1
+
+        if not changed:
+            return data
+        # Copies are put into copies of their parents, from the deepest level up.
+        for depth in range(len(levels) - 1, 0, -1):
+            level, copies = levels[depth]
+            parent_level, parent_copies = levels[depth - 1]
+            for index, copy in copies.items():
+                _, parent_index, key = level[index]
+                parent_copy = parent_copies.get(parent_index)
+                if parent_copy is None:
+                    parent_copy = parent_copies[parent_index] = copy_container(parent_level[parent_index][0])
+                parent_copy[key] = copy
+        return levels[0][1].get(0, data)
+
+    @staticmethod
+    def _copy(container):
+        return dict(container) if isinstance(container, dict) else list(container)
+
+
+_redaction_plan = None
+_redaction_plan_lock = threading.Lock()
+
+
+def get_redaction_plan():
+    """
+    Returns the redaction plan compiled from settings, built on first use.
+    """
+    global _redaction_plan
+
+    if _redaction_plan is None:
+        with _redaction_plan_lock:
+            if _redaction_plan is None:
+                _redaction_plan = build_redaction_plan()
+    return _redaction_plan
+
+
+def build_redaction_plan():
+    ignore_case = False
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_EXCLUDE_KEYS_IGNORE_CASE'):
+        ignore_case = bool(settings.DRF_ACTIVITY_TRACKER_EXCLUDE_KEYS_IGNORE_CASE)
+
+    key_patterns = []
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_EXCLUDE_KEY_PATTERNS'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_EXCLUDE_KEY_PATTERNS, (list, tuple)):
+            key_patterns = settings.DRF_ACTIVITY_TRACKER_EXCLUDE_KEY_PATTERNS
+
+    value_patterns = []
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_EXCLUDE_VALUE_PATTERNS'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_EXCLUDE_VALUE_PATTERNS, (list, tuple)):
+            value_patterns = settings.DRF_ACTIVITY_TRACKER_EXCLUDE_VALUE_PATTERNS
+
+    max_depth = 32  # Default to 32 nested containers
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_REDACTION_MAX_DEPTH'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_REDACTION_MAX_DEPTH, int):
+            max_depth = settings.DRF_ACTIVITY_TRACKER_REDACTION_MAX_DEPTH
+
+    max_nodes = 10000  # Default to 10000 containers per payload
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_REDACTION_MAX_NODES'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_REDACTION_MAX_NODES, int):
+            max_nodes = settings.DRF_ACTIVITY_TRACKER_REDACTION_MAX_NODES
+
+    return RedactionPlan(keys=SENSITIVE_KEYS, ignore_case=ignore_case, key_patterns=key_patterns,
+                         value_patterns=value_patterns, max_depth=max_depth, max_nodes=max_nodes)
@@ -0,0 +1,283 @@
+import logging
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from drf_user_activity_tracker_mongodb.utils import MONGO_CLIENTS
+
+logger = logging.getLogger('error')
+
+# Upper bounds in seconds of the latency histogram, the last bucket counts the slower requests.
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+ROLLUP_INDEXES = [
+    # Upserts of the writer and dashboards filtered by url name.
+    [('url_name', ASCENDING), ('method', ASCENDING), ('status_class', ASCENDING), ('minute', ASCENDING)],
+    # Dashboards of every endpoint over a period.
+    [('minute', ASCENDING)],
+]
+
+ROLLUP_KEY_FIELDS = ['url_name', 'method', 'status_class', 'minute']
+
+
+def rollups_enabled():
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_ROLLUPS'):
+        return bool(settings.DRF_ACTIVITY_TRACKER_ROLLUPS)
+    return False
+
+
+def get_rollup_collection_name():
+    collection_name = '{}_rollups'.format(settings.DRF_ACTIVITY_TRACKER_MONGO_DB_COLLECTION_NAME)
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MONGO_ROLLUP_COLLECTION_NAME'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_MONGO_ROLLUP_COLLECTION_NAME, str):
+            collection_name = settings.DRF_ACTIVITY_TRACKER_MONGO_ROLLUP_COLLECTION_NAME
+    return collection_name
+
+
+def get_status_class(status_code):
+    if not isinstance(status_code, int):
+        return None
+    return '{}xx'.format(status_code // 100)
+
+
+class RollupAggregator:
+    """
+    Folds logs into per minute counters of (url_name, method, status class), and writes them as upserts.
+    Counters that could not be written are kept and merged into the next write,
+    except a counter refused by the collection, which is dropped so it is not retried forever.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._buckets = {}
+        self.dropped_count = 0
+
+    def add(self, logs):
+        with self._lock:
+            for log in logs:
+                created_time = log.get('created_time')
+                if created_time is None:
+                    continue
+                status_code = log.get('status_code')
+                key = (log.get('url_name'), log.get('method'), get_status_class(status_code),
+                       created_time.replace(second=0, microsecond=0))
+
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = {
+                        'count': 0, 'weighted_count': 0.0, 'error_count': 0, 'execution_time_sum': 0.0,
+                        'execution_time_min': None, 'execution_time_max': None,
+                        'histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+                    }
+                bucket['count'] += 1
+                # Sampled logs stand for 1 / rate requests.
+                bucket['weighted_count'] += log.get('sample_weight', 1)
+                if isinstance(status_code, int) and status_code >= 500:
+                    bucket['error_count'] += 1
+
+                execution_time = log.get('execution_time')
+                if isinstance(execution_time, (int, float)):
+                    bucket['execution_time_sum'] += execution_time
+                    if bucket['execution_time_min'] is None or execution_time < bucket['execution_time_min']:
+                        bucket['execution_time_min'] = execution_time
+                    if bucket['execution_time_max'] is None or execution_time > bucket['execution_time_max']:
+                        bucket['execution_time_max'] = execution_time
+                    bucket['histogram'][bisect_left(LATENCY_BUCKETS, execution_time)] += 1
+
+    def __len__(self):
+        return len(self._buckets)
+
+    @staticmethod
+    def _get_update(key, bucket):
+        increments = {
+            'count': bucket['count'],
+            'weighted_count': bucket['weighted_count'],
+            'error_count': bucket['error_count'],
+            'execution_time_sum': bucket['execution_time_sum'],
+        }
+        for index, value in enumerate(bucket['histogram']):
+            if value:
+                increments['histogram.{}'.format(index)] = value
+
+        update = {'$inc': increments}
+        if bucket['execution_time_min'] is not None:
+            update['$min'] = {'execution_time_min': bucket['execution_time_min']}
+            update['$max'] = {'execution_time_max': bucket['execution_time_max']}
+        return UpdateOne(dict(zip(ROLLUP_KEY_FIELDS, key)), update, upsert=True)
+
+    def flush(self, collection):
+        """
+        Writes the counters into `collection` with one bulk write. Returns False if the write failed.
+        """
+        with self._lock:
+            buckets, self._buckets = self._buckets, {}
+        if not buckets:
+            return True
+
+        keys = list(buckets)
+        try:
+            collection.bulk_write([self._get_update(key, buckets[key]) for key in keys], ordered=True)
+            return True
+        except BulkWriteError as e:
+            write_errors = (e.details or {}).get('writeErrors')
+            if write_errors:
+                # Ordered writes stop at the first error, the updates before it are applied.
+                # The refused update is dropped, only the updates after it are written again.
+                failed_index = write_errors[0]['index']
+                self.dropped_count += 1
+                message = "DRF ACTIVITY TRACKER EXCEPTION: {}, {}, dropped rollup: {}".format(
+                    str(e), type(e), keys[failed_index])
+                keys = keys[failed_index + 1:]
+            else:
+                # Only the write concern failed, the updates were applied and are not written twice.
+                message = "DRF ACTIVITY TRACKER EXCEPTION: {}, {}".format(str(e), type(e))
+                keys = []
+        except Exception as e:
+            message = "DRF ACTIVITY TRACKER EXCEPTION: {}, {}".format(str(e), type(e))
+        logger.error(message)
+
+        self._restore(dict((key, buckets[key]) for key in keys))
+        return False
+
+    def _restore(self, buckets):
+        with self._lock:
+            for key, bucket in buckets.items():
+                current = self._buckets.get(key)
+                if current is None:
+                    self._buckets[key] = bucket
+                else:
+                    merge_bucket(current, bucket)
+
+    def get_buckets(self):
+        with self._lock:
+            return dict(self._buckets)
+
+
+def merge_bucket(current, bucket):
+    current['count'] += bucket['count']
+    current['weighted_count'] += bucket['weighted_count']
+    current['error_count'] += bucket['error_count']
+    current['execution_time_sum'] += bucket['execution_time_sum']
+    for name, choose in (('execution_time_min', min), ('execution_time_max', max)):
+        values = [value for value in (current[name], bucket[name]) if value is not None]
+        current[name] = choose(values) if values else None
+    current['histogram'] = [a + b for a, b in zip(current['histogram'], bucket['histogram'])]
+
+
+class RollupCollection:
+    """
+    Reads the rollups of the activity logs for dashboards.
+    """
+
+    def __init__(self):
+        self.collection = MONGO_CLIENTS.get_database()[get_rollup_collection_name()]
+        self.read_collection = MONGO_CLIENTS.get_database(read=True)[get_rollup_collection_name()]
+
+    def summary(self, time_delta=None, url_name=None, group_by='endpoint'):
+        """
+        Sums the rollups matching the filters, by (url_name, method, status_class) or by minute.
+        """
+        filter_params = {}
+        if time_delta:
+            filter_params.update({'minute': time_delta})
+        if url_name:
+            filter_params.update({'url_name': url_name})
+
+        if group_by == 'minute':
+            group_id = '$minute'
+            sort = {'_id': 1}
+        else:
+            group_id = {'url_name': '$url_name', 'method': '$method', 'status_class': '$status_class'}
+            sort = {'count': -1}
+
+        group = {
+            '_id': group_id,
+            'count': {'$sum': '$count'},
+            'weighted_count': {'$sum': '$weighted_count'},
+            'error_count': {'$sum': '$error_count'},
+            'execution_time_sum': {'$sum': '$execution_time_sum'},
+            'execution_time_min': {'$min': '$execution_time_min'},
+            'execution_time_max': {'$max': '$execution_time_max'},
+        }
+        for index in range(len(LATENCY_BUCKETS) + 1):
+            group['histogram_{}'.format(index)] = {'$sum': '$histogram.{}'.format(index)}
+
+        rows = []
+        for row in self.read_collection.aggregate([{'$match': filter_params}, {'$group': group}, {'$sort': sort}]):
+            histogram = [row.pop('histogram_{}'.format(index)) for index in range(len(LATENCY_BUCKETS) + 1)]
+            rows.append(get_summary_row(row, row.pop('_id'), histogram, group_by))
+        return rows
+
+
+def get_summary_row(row, key, histogram, group_by):
+    if group_by == 'minute':
+        row['minute'] = key
+    else:
+        row.update(key)
+    row['execution_time_avg'] = row['execution_time_sum'] / row['count'] if row['count'] else None
+    minimum, maximum = row['execution_time_min'], row['execution_time_max']
+    row['execution_time_p50'] = get_percentile(histogram, 0.5, minimum, maximum)
+    row['execution_time_p95'] = get_percentile(histogram, 0.95, minimum, maximum)
+    row['execution_time_p99'] = get_percentile(histogram, 0.99, minimum, maximum)
+    return row
+
+
+def summarize_logs(logs, group_by='endpoint'):
+    """
+    Same summary as RollupCollection.summary, computed from raw logs by backends without a rollup collection.
+    """
+    aggregator = RollupAggregator()
+    aggregator.add(logs)
+
+    groups = {}
+    for (url_name, method, status_class, minute), bucket in aggregator.get_buckets().items():
+        if group_by == 'minute':
+            key = minute
+        else:
+            key = (url_name, method, status_class)
+        if key in groups:
+            merge_bucket(groups[key], bucket)
+        else:
+            groups[key] = bucket
+
+    rows = []
+    for key, bucket in groups.items():
+        histogram = bucket.pop('histogram')
+        if group_by != 'minute':
+            key = dict(zip(['url_name', 'method', 'status_class'], key))
+        rows.append(get_summary_row(bucket, key, histogram, group_by))
+
+    if group_by == 'minute':
+        rows.sort(key=lambda row: row['minute'])
+    else:
+        rows.sort(key=lambda row: row['count'], reverse=True)
+    return rows
+
+
+def get_percentile(histogram, percentile, minimum=None, maximum=None):
+    """
+    Returns the percentile interpolated inside the histogram bucket holding it, within [minimum, maximum].
+    The last bucket has no upper bound, it ends at `maximum`, or at the last bound when the maximum is unknown.
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = total * percentile
+    seen = 0
+    for index, value in enumerate(histogram):
+        if not value or seen + value < rank:
+            seen += value
+            continue
+
+        lower = LATENCY_BUCKETS[index - 1] if index else 0
+        upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else lower
+        if minimum is not None:
+            lower = max(lower, minimum)
+        if maximum is not None:
+            upper = maximum if index == len(LATENCY_BUCKETS) else min(upper, maximum)
+        upper = max(upper, lower)
+        return lower + (upper - lower) * (rank - seen) / value
+    return None
@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+HTTP_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'])
+
+
+class SamplingPolicy:
+    """
+    Sampling rates of the tracked requests. Rules are dicts of "url_name", "namespace" and "method"
+    conditions (all optional) and a "rate" between 0 and 1, the first matching rule wins.
+    Requests matching no rule are always kept.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = []
+        for rule in rules:
+            rate = rule.get('rate', 1)
+            if not isinstance(rate, (int, float)) or not 0 <= rate <= 1:
+                raise Exception("""
+                DRF ACTIVITY TRACKER EXCEPTION
+                Rate of DRF_ACTIVITY_TRACKER_SAMPLING_RULES must be between 0 and 1
+                """)
+            method = rule.get('method')
+            self.rules.append((rule.get('url_name'), rule.get('namespace'), method.upper() if method else None,
+                               rate))
+        self._methods = HTTP_METHODS.union(rule_method for _, _, rule_method, _ in self.rules if rule_method)
+        self._rates = {}
+
+    def get_rate(self, url_name, namespace, method):
+        # Clients choose the method, other methods share one entry that only rules without a method match.
+        if method not in self._methods:
+            method = None
+        key = (url_name, namespace, method)
+        rate = self._rates.get(key)
+        if rate is None:
+            rate = 1
+            for rule_url_name, rule_namespace, rule_method, rule_rate in self.rules:
+                if (rule_url_name is None or rule_url_name == url_name) and \
+                        (rule_namespace is None or rule_namespace == namespace) and \
+                        (rule_method is None or rule_method == method):
+                    rate = rule_rate
+                    break
+            # Routes come from the URLconf and methods are known, so the cache stays as small as the URLconf.
+            self._rates[key] = rate
+        return rate
+
+    def get_sample_weight(self, url_name, namespace, method):
+        """
+        Returns the number of requests a kept request stands for, or 0 if the request is not sampled.
+        """
+        rate = self.get_rate(url_name, namespace, method)
+        if rate >= 1:
+            return 1
+        if rate <= 0 or random.random() >= rate:
+            return 0
+        return 1 / rate
+
+
+class TokenBucketLimiter:
+    """
+    Allows `rate` logs per second per key, with bursts of up to `burst` logs.
+    The buckets of the `max_keys` most recent keys are kept.
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.limited_count = 0
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens, updated_time = bucket
+                tokens = min(self.burst, tokens + (now - updated_time) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.limited_count += 1
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
+
+
+def get_sampling_policy():
+    rules = []
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_SAMPLING_RULES'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_SAMPLING_RULES, (list, tuple)):
+            rules = settings.DRF_ACTIVITY_TRACKER_SAMPLING_RULES
+    if not rules:
+        return None
+    return SamplingPolicy(rules)
+
+
+def get_user_rate_limiter():
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_USER_RATE_LIMIT'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_USER_RATE_LIMIT, dict):
+            user_rate_limit = settings.DRF_ACTIVITY_TRACKER_USER_RATE_LIMIT
+            rate = user_rate_limit.get('rate', 1)
+            # Below one token a bucket never allows a log, a rate under 1 log per second still allows one.
+            burst = user_rate_limit.get('burst', max(1, rate))
+            if not isinstance(burst, (int, float)) or burst < 1:
+                raise Exception("""
+                DRF ACTIVITY TRACKER EXCEPTION
+                Burst of DRF_ACTIVITY_TRACKER_USER_RATE_LIMIT must be at least 1
+                """)
+            return TokenBucketLimiter(rate=rate, burst=burst, max_keys=user_rate_limit.get('max_users', 10000))
+    return None
@@ -46,6 +46,13 @@ class ActivityLogSerializer(serializers.Serializer):
     class Meta:
         fields = ['_id', 'event_name', 'client_ip_address', 'created_time']
 
+    @classmethod
+    def get_projection(cls):
+        """
+        Fields of the log read by the serializer, event_name is made from url_name.
+        """
+        return {field_name: 1 for field_name in cls._declared_fields if field_name != 'event_name'}
+
     def get_event_name(self, obj):
         event_name = obj.get('url_name', '')
         if hasattr(settings, 'DRF_ACTIVITY_TRACKER_EVENT_NAME'):
@@ -61,3 +68,23 @@ class ActivityLogAdminSerializer(ActivityLogSerializer):
 
     class Meta:
         fields = ['_id', 'user_id', 'event_name', 'client_ip_address', 'created_time']
+
+
+class RollupQueryParamsValidatorSerializer(QueryParamsValidatorSerializer):
+    group_by = serializers.ChoiceField(choices=['endpoint', 'minute'], required=False, default='endpoint')
+
+
+class ActivityRollupSerializer(serializers.Serializer):
+    url_name = serializers.CharField(required=False)
+    method = serializers.CharField(required=False)
+    status_class = serializers.CharField(required=False)
+    minute = serializers.DateTimeField(required=False)
+    count = serializers.IntegerField()
+    weighted_count = serializers.FloatField()
+    error_count = serializers.IntegerField()
+    execution_time_avg = serializers.FloatField(allow_null=True)
+    execution_time_min = serializers.FloatField(allow_null=True)
+    execution_time_max = serializers.FloatField(allow_null=True)
+    execution_time_p50 = serializers.FloatField(allow_null=True)
+    execution_time_p95 = serializers.FloatField(allow_null=True)
+    execution_time_p99 = serializers.FloatField(allow_null=True)
@@ -1,22 +1,119 @@
+import atexit
+import os
+import signal
+import threading
+
+from django.conf import settings
+
 from drf_user_activity_tracker_mongodb.utils import database_log_enabled
 
+LOG_THREAD_NAME = 'insert_log_into_database'
+
 LOGGER_THREAD = None
 
-if database_log_enabled():
+_logger_thread_pid = None
+# Reentrant, the SIGTERM handler may interrupt the main thread while it holds the lock.
+_logger_thread_lock = threading.RLock()
+# Set once the logger thread is stopped, logs of the process are dropped from then on.
+_logger_stopped = False
+
+
+def get_logger_thread():
+    """
+    Returns the logger thread of the current process, starting it on first use.
+    Threads don't survive os.fork, so a forked worker (gunicorn --preload, uwsgi)
+    starts its own logger thread the first time it logs.
+    Returns None once the logger thread was stopped, e.g. for a log added during interpreter shutdown.
+    """
+    global LOGGER_THREAD, _logger_thread_pid
+
+    if _logger_thread_pid == os.getpid():
+        return LOGGER_THREAD
+
+    if _logger_stopped or not database_log_enabled():
+        return None
+
     from drf_user_activity_tracker_mongodb.insert_log_into_database import InsertLogIntoDatabase
-    import threading
 
-    LOG_THREAD_NAME = 'insert_log_into_database'
+    with _logger_thread_lock:
+        if _logger_stopped:
+            return None
+        if _logger_thread_pid != os.getpid():
+            t = InsertLogIntoDatabase()
+            t.daemon = True
+            t.name = LOG_THREAD_NAME
+            t.start()
+            LOGGER_THREAD = t
+            _logger_thread_pid = os.getpid()
+            atexit.register(stop_logger_thread)
+    return LOGGER_THREAD
+
+
+def get_started_logger_thread():
+    """
+    Returns the logger thread of the current process, or None if it isn't started yet. Never blocks.
+    """
+    return LOGGER_THREAD if _logger_thread_pid == os.getpid() else None
+
+
+def get_shutdown_timeout():
+    shutdown_timeout = 5  # Default to 5 seconds
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_SHUTDOWN_TIMEOUT'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_SHUTDOWN_TIMEOUT, (int, float)):
+            shutdown_timeout = settings.DRF_ACTIVITY_TRACKER_SHUTDOWN_TIMEOUT
+    return shutdown_timeout
+
+
+def stop_logger_thread(timeout=None):
+    """
+    Inserts the logs still in the buffer and stops the logger thread, waiting at most `timeout` seconds.
+    Later logs of the process are dropped, a new logger thread is never started after this.
+    """
+    global LOGGER_THREAD, _logger_thread_pid, _logger_stopped
+
+    with _logger_thread_lock:
+        _logger_stopped = True
+        if _logger_thread_pid != os.getpid() or LOGGER_THREAD is None:
+            return
+        t, LOGGER_THREAD, _logger_thread_pid = LOGGER_THREAD, None, None
+
+    if timeout is None:
+        timeout = get_shutdown_timeout()
+    t.stop(timeout=timeout)
+
+
+def install_sigterm_handler():
+    """
+    Stops the logger thread on SIGTERM before calling the previous handler, if DRF_ACTIVITY_TRACKER_HANDLE_SIGTERM
+    is set. Called from AppConfig.ready(), signal handlers can only be installed from the main thread.
+    """
+    handle_sigterm = False  # Default to False
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_HANDLE_SIGTERM'):
+        handle_sigterm = bool(settings.DRF_ACTIVITY_TRACKER_HANDLE_SIGTERM)
+
+    if handle_sigterm and threading.current_thread() is threading.main_thread():
+        previous_handler = signal.getsignal(signal.SIGTERM)
+
+        def handle_sigterm_signal(signum, frame):
+            stop_logger_thread()
+            if callable(previous_handler):
+                previous_handler(signum, frame)
+            elif previous_handler != signal.SIG_IGN:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                os.kill(os.getpid(), signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, handle_sigterm_signal)
+
+
+def _reset_after_fork():
+    global LOGGER_THREAD, _logger_thread_pid, _logger_thread_lock, _logger_stopped
 
-    already_exists = False
+    # The parent's logger thread and its buffered logs stay with the parent.
+    LOGGER_THREAD = None
+    _logger_thread_pid = None
+    _logger_thread_lock = threading.RLock()
+    _logger_stopped = False
 
-    for t in threading.enumerate():
-        if t.getName() == LOG_THREAD_NAME:
-            already_exists = True
 
-    if not already_exists:
-        t = InsertLogIntoDatabase()
-        t.daemon = True
-        t.setName(LOG_THREAD_NAME)
-        t.start()
-        LOGGER_THREAD = t
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
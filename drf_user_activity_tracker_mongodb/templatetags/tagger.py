@@ -2,6 +2,7 @@ from urllib.parse import urlencode
 
 from django import template
 
+from drf_user_activity_tracker_mongodb.codec import get_json_codec
 from drf_user_activity_tracker_mongodb.utils import CustomPaginator
 
 register = template.Library()
@@ -14,10 +15,11 @@ def under_score_tag(obj, attribute):
 
 
 @register.simple_tag
-def clean_url_encode(data, remove):
+def clean_url_encode(data, *remove):
     attrs = data.copy()
-    if remove in data:
-        attrs.pop(remove)
+    for key in remove:
+        if key in attrs:
+            attrs.pop(key)
     return urlencode(attrs)
 
 
@@ -27,3 +29,13 @@ def get_proper_elided_page_range(p, count, number, on_each_side=3, on_ends=2):
     return paginator.get_elided_page_range(number=number,
                                            on_each_side=on_each_side,
                                            on_ends=on_ends)
+
+
+@register.filter
+def to_json(value):
+    if value is None or isinstance(value, str):
+        return value
+    try:
+        return get_json_codec().dumps(value, indent=True).decode('utf-8')
+    except Exception:
+        return value
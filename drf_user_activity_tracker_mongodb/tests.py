@@ -0,0 +1,1085 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock, skipIf
+
+import bson
+import uuid
+from decimal import Decimal
+import jwt
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import clear_url_caches, include, path, resolve
+from django.utils.datastructures import MultiValueDict
+from pymongo.errors import AutoReconnect, BulkWriteError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from drf_user_activity_tracker_mongodb.backends.memory import MemoryBackend
+from drf_user_activity_tracker_mongodb.backends.sqlite import SQLiteBackend
+from drf_user_activity_tracker_mongodb.compression import FieldCompressor, decompress_log, is_compressed, zstandard
+from drf_user_activity_tracker_mongodb.events import BatchListener, EventDispatcher, Events, flush_batch_listeners
+from drf_user_activity_tracker_mongodb import start_logger_when_server_starts
+from drf_user_activity_tracker_mongodb.codec import (ActivityJSONRenderer, OrjsonCodec, StdlibJSONCodec, get_json_codec,
+                                                     orjson)
+from drf_user_activity_tracker_mongodb.indexes import IndexManager
+from drf_user_activity_tracker_mongodb.headers import HeaderPolicy, build_header_policy, to_meta_key
+from drf_user_activity_tracker_mongodb.insert_log_into_database import InsertLogIntoDatabase
+from drf_user_activity_tracker_mongodb.journal import SpillJournal
+from drf_user_activity_tracker_mongodb.metrics import MetricsRegistry
+from drf_user_activity_tracker_mongodb.middleware.activity_tracker_middleware import ActivityTrackerMiddleware
+from drf_user_activity_tracker_mongodb.multipart import get_multipart_metadata, scan_multipart
+from drf_user_activity_tracker_mongodb.rollups import LATENCY_BUCKETS, RollupAggregator, get_percentile, summarize_logs
+from drf_user_activity_tracker_mongodb.redaction import FILTERED_MARKER, TRUNCATED_MARKER, RedactionPlan
+from drf_user_activity_tracker_mongodb.sampling import SamplingPolicy, TokenBucketLimiter, get_user_rate_limiter
+from drf_user_activity_tracker_mongodb.serializers import ActivityLogSerializer
+from drf_user_activity_tracker_mongodb.views import ActivityMetricsView
+from drf_user_activity_tracker_mongodb.utils import LogQuerySet, UrlNameIndex, decode_cursor, encode_cursor
+
+
+class OverflowPolicyTests(SimpleTestCase):
+
+    def get_writer(self, policy, **options):
+        with override_settings(DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE=2, DRF_ACTIVITY_TRACKER_BUFFER_MAX_SIZE=2,
+                               DRF_ACTIVITY_TRACKER_OVERFLOW_POLICY=policy, DRF_ACTIVITY_TRACKER_JOURNAL_DIR=None,
+                               **options):
+            return InsertLogIntoDatabase(backend=MemoryBackend())
+
+    def put_logs(self, writer, count):
+        for index in range(count):
+            writer.put_log_data({'index': index, 'created_time': datetime(2024, 1, 1)})
+        return [log['index'] for log in writer._queue]
+
+    def test_drop_newest(self):
+        writer = self.get_writer('DROP_NEWEST')
+        self.assertEqual(self.put_logs(writer, 4), [0, 1])
+        self.assertEqual(writer.dropped_newest_count, 2)
+        self.assertEqual(writer.dropped_oldest_count, 0)
+
+    def test_drop_oldest(self):
+        writer = self.get_writer('DROP_OLDEST')
+        self.assertEqual(self.put_logs(writer, 4), [2, 3])
+        self.assertEqual(writer.dropped_oldest_count, 2)
+        self.assertEqual(writer.dropped_newest_count, 0)
+
+    def test_sample(self):
+        writer = self.get_writer('SAMPLE', DRF_ACTIVITY_TRACKER_OVERFLOW_SAMPLE_RATE=0.5)
+        with mock.patch('drf_user_activity_tracker_mongodb.insert_log_into_database.random.random',
+                        side_effect=[0.9, 0.1]):
+            self.assertEqual(self.put_logs(writer, 4), [1, 3])
+        self.assertEqual(writer.dropped_newest_count, 1)
+        self.assertEqual(writer.dropped_oldest_count, 1)
+
+    def test_buffer_is_inserted(self):
+        writer = self.get_writer('DROP_NEWEST')
+        self.put_logs(writer, 2)
+        writer._start_bulk_insertion()
+        self.assertEqual(writer.backend.count(), 2)
+        self.assertFalse(writer._queue)
+
+
+class SpillJournalTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = SpillJournal(self.directory)
+        self.logs = [{'_id': ObjectId(), 'index': index} for index in range(5)]
+        self.journal.append(self.logs)
+        self.saved = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_failed_documents(self):
+        documents = []
+        for path in self.journal.failed_segments():
+            with open(path, 'rb') as failed_segment:
+                documents.extend(bson.decode_file_iter(failed_segment))
+        return documents
+
+    def test_replay(self):
+        self.assertTrue(self.journal.replay(self.saved.extend, batch_size=2))
+        self.assertEqual([log['index'] for log in self.saved], [0, 1, 2, 3, 4])
+        self.assertFalse(self.journal.has_pending_segments())
+        self.assertEqual(self.journal.replayed_count, 5)
+
+    def test_poison_document_of_bulk_write(self):
+        def save(documents):
+            errors = [{'index': index, 'code': 121, 'errmsg': 'Document failed validation'}
+                      for index, document in enumerate(documents) if document['index'] == 2]
+            self.saved.extend(document for document in documents if document['index'] != 2)
+            if errors:
+                raise BulkWriteError({'writeErrors': errors})
+
+        self.assertTrue(self.journal.replay(save, batch_size=2))
+        self.assertEqual([log['index'] for log in self.saved], [0, 1, 3, 4])
+        self.assertEqual([log['index'] for log in self.get_failed_documents()], [2])
+        self.assertFalse(self.journal.pending_segments())
+        self.assertEqual(self.journal.get_stats()['failed_count'], 1)
+
+    def test_poison_document_of_refused_batch(self):
+        def save(documents):
+            if any(document['index'] == 3 for document in documents):
+                raise ValueError('document too large')
+            self.saved.extend(documents)
+
+        self.assertTrue(self.journal.replay(save, batch_size=2))
+        self.assertEqual([log['index'] for log in self.saved], [0, 1, 2, 4])
+        self.assertEqual([log['index'] for log in self.get_failed_documents()], [3])
+
+    def test_duplicates_are_not_failures(self):
+        def save(documents):
+            raise BulkWriteError({'writeErrors': [{'index': 0, 'code': 11000, 'errmsg': 'duplicate key'}]})
+
+        self.assertTrue(self.journal.replay(save))
+        self.assertFalse(self.journal.failed_segments())
+
+    def test_unreachable_database_keeps_the_segment(self):
+        def save(documents):
+            raise AutoReconnect('connection refused')
+
+        self.assertFalse(self.journal.replay(save))
+        self.assertEqual(len(self.journal.pending_segments()), 1)
+        self.assertTrue(self.journal.replay(self.saved.extend))
+        self.assertEqual(len(self.saved), 5)
+
+    def test_unencodable_log_is_dropped_alone(self):
+        self.assertTrue(self.journal.append([{'index': 5}, {'index': object()}]))
+        self.assertEqual(self.journal.dropped_count, 1)
+        self.assertEqual(self.journal.spilled_count, 6)
+
+    def test_full_journal(self):
+        journal = SpillJournal(os.path.join(self.directory, 'small'), max_size=10)
+        self.assertFalse(journal.append(self.logs))
+        self.assertEqual(journal.dropped_count, 5)
+
+
+class CursorPaginationTests(SimpleTestCase):
+
+    def setUp(self):
+        self.backend = MemoryBackend()
+        created_time = datetime(2024, 1, 1, 12)
+        # Logs share created times, the _id breaks the ties.
+        self.backend.save_many([{'_id': ObjectId(), 'created_time': created_time + timedelta(seconds=index // 3),
+                                 'url_name': 'items', 'status_code': 200, 'user_id': 1} for index in range(7)])
+        self.logs = self.backend.list()
+
+    def get_ids(self, logs):
+        return [log['_id'] for log in logs]
+
+    def test_pages_cover_every_log_once(self):
+        ids, after = [], None
+        while True:
+            page = self.backend.list(dataset_limit=3, after=after)
+            if not page:
+                break
+            ids.extend(self.get_ids(page))
+            after = decode_cursor(encode_cursor(page[-1]))
+        self.assertEqual(ids, self.get_ids(self.logs))
+
+    def test_previous_page(self):
+        second_page = self.backend.list(dataset_limit=3, after=decode_cursor(encode_cursor(self.logs[2])))
+        first_page = self.backend.list(dataset_limit=3, before=decode_cursor(encode_cursor(second_page[0])))
+        self.assertEqual(self.get_ids(first_page), self.get_ids(self.logs[:3]))
+
+    def test_boundaries(self):
+        self.assertEqual(self.backend.list(dataset_limit=3, after=(self.logs[-1]['created_time'],
+                                                                   self.logs[-1]['_id'])), [])
+        self.assertEqual(self.backend.list(dataset_limit=3, before=(self.logs[0]['created_time'],
+                                                                    self.logs[0]['_id'])), [])
+        last_page = self.backend.list(dataset_limit=3, after=(self.logs[3]['created_time'], self.logs[3]['_id']))
+        self.assertEqual(self.get_ids(last_page), self.get_ids(self.logs[4:]))
+
+    def test_invalid_cursor(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        self.assertIsNone(decode_cursor('20240101_not-an-id'))
+
+
+class LogQuerySetTests(SimpleTestCase):
+
+    def setUp(self):
+        self.collection = mock.MagicMock()
+        self.cursor = self.collection.find.return_value
+        self.cursor.sort.return_value = self.cursor
+        self.cursor.skip.return_value = self.cursor
+        self.cursor.limit.return_value = self.cursor
+        self.cursor.__iter__.side_effect = lambda: iter([{'_id': 1}])
+        self.queryset = LogQuerySet(self.collection, {'user_id': 1}, projection={'url_name': 1},
+                                    sort=[('created_time', -1)], max_size=100)
+
+    def test_slice_runs_on_the_server(self):
+        self.assertEqual(self.queryset[20:30], [{'_id': 1}])
+        self.collection.find.assert_called_once_with({'user_id': 1}, {'url_name': 1})
+        self.cursor.sort.assert_called_once_with([('created_time', -1)])
+        self.cursor.skip.assert_called_once_with(20)
+        self.cursor.limit.assert_called_once_with(10)
+
+    def test_slices_stop_at_max_size(self):
+        self.queryset[90:200]
+        self.cursor.limit.assert_called_once_with(10)
+        self.assertEqual(self.queryset[150:200], [])
+
+    def test_count_is_capped(self):
+        self.collection.count_documents.return_value = 100
+        self.assertEqual(len(self.queryset), 100)
+        self.assertEqual(self.queryset.count(), 100)
+        self.collection.count_documents.assert_called_once_with({'user_id': 1}, limit=100)
+
+    def test_index(self):
+        self.assertEqual(self.queryset[3], {'_id': 1})
+        self.cursor.__iter__.side_effect = lambda: iter([])
+        with self.assertRaises(IndexError):
+            self.queryset[200]
+
+    def test_serializer_projection(self):
+        projection = ActivityLogSerializer.get_projection()
+        self.assertNotIn('event_name', projection)
+        self.assertNotIn('body', projection)
+        self.assertEqual(projection['url_name'], 1)
+
+
+class RedactionPlanTests(SimpleTestCase):
+
+    def test_sensitive_keys_and_values(self):
+        plan = RedactionPlan(keys=['password'], key_patterns=['*token*'], value_patterns=[r'\d{16}'])
+        data = {'password': 'x', 'items': [{'api_token': 'y', 'card': 'card 4111111111111111'}], 'name': 'a'}
+        self.assertEqual(plan.redact(data), {'password': FILTERED_MARKER, 'name': 'a',
+                                             'items': [{'api_token': FILTERED_MARKER,
+                                                        'card': 'card ' + FILTERED_MARKER}]})
+        self.assertEqual(data['password'], 'x')
+        self.assertEqual(data['items'][0]['api_token'], 'y')
+
+    def test_clean_data_is_not_copied(self):
+        plan = RedactionPlan(keys=['password'])
+        data = {'results': [{'id': 1, 'tags': ['a']}], 'count': 1}
+        self.assertIs(plan.redact(data), data)
+
+    def test_ignore_case(self):
+        plan = RedactionPlan(keys=['Password'], ignore_case=True)
+        self.assertEqual(plan.redact({'PASSWORD': 'x'}), {'PASSWORD': FILTERED_MARKER})
+
+    def test_depth_budget(self):
+        plan = RedactionPlan(keys=['password'], max_depth=2)
+        within = {'a': {'b': {'c': 1}}}
+        self.assertIs(plan.redact(within), within)
+        self.assertEqual(plan.redact({'a': {'b': {'c': {'d': 1}}}}), {'a': {'b': {'c': TRUNCATED_MARKER}}})
+
+    def test_node_budget(self):
+        plan = RedactionPlan(keys=['password'], max_nodes=2)
+        within = {'a': [1], 'b': [2]}
+        self.assertIs(plan.redact(within), within)
+        self.assertEqual(plan.redact({'a': [1], 'b': [2], 'c': [3]}), {'a': [1], 'b': [2], 'c': TRUNCATED_MARKER})
+
+    def test_deep_data_does_not_recurse(self):
+        data = {'password': 'x'}
+        for _ in range(5000):
+            data = {'child': data}
+        redacted = RedactionPlan(keys=['password'], max_depth=10000, max_nodes=10000).redact(data)
+        for _ in range(5000):
+            redacted = redacted['child']
+        self.assertEqual(redacted, {'password': FILTERED_MARKER})
+
+
+class SamplingTests(SimpleTestCase):
+
+    def test_first_matching_rule_wins(self):
+        policy = SamplingPolicy([{'url_name': 'items', 'method': 'get', 'rate': 0.5},
+                                 {'url_name': 'items', 'rate': 0.2},
+                                 {'namespace': 'admin', 'rate': 0}])
+        self.assertEqual(policy.get_rate('items', None, 'GET'), 0.5)
+        self.assertEqual(policy.get_rate('items', None, 'POST'), 0.2)
+        self.assertEqual(policy.get_rate('index', 'admin', 'GET'), 0)
+        self.assertEqual(policy.get_rate('other', None, 'GET'), 1)
+
+    def test_unknown_methods_share_one_entry(self):
+        policy = SamplingPolicy([{'url_name': 'items', 'method': 'GET', 'rate': 0.5}])
+        for index in range(100):
+            self.assertEqual(policy.get_rate('items', None, 'X-{}'.format(index)), 1)
+        self.assertEqual(len(policy._rates), 1)
+
+    def test_sample_weight(self):
+        policy = SamplingPolicy([{'url_name': 'items', 'rate': 0.25}, {'url_name': 'none', 'rate': 0}])
+        with mock.patch('drf_user_activity_tracker_mongodb.sampling.random.random', side_effect=[0.1, 0.5]):
+            self.assertEqual(policy.get_sample_weight('items', None, 'GET'), 4)
+            self.assertEqual(policy.get_sample_weight('items', None, 'GET'), 0)
+        self.assertEqual(policy.get_sample_weight('none', None, 'GET'), 0)
+        self.assertEqual(policy.get_sample_weight('other', None, 'GET'), 1)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(Exception):
+            SamplingPolicy([{'rate': 2}])
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('drf_user_activity_tracker_mongodb.sampling.time')
+        self.time = patcher.start()
+        self.time.monotonic.return_value = 100.0
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_rate(self):
+        limiter = TokenBucketLimiter(rate=2, burst=3)
+        self.assertEqual([limiter.allow(1) for _ in range(4)], [True, True, True, False])
+        self.time.monotonic.return_value = 100.5
+        self.assertEqual([limiter.allow(1) for _ in range(2)], [True, False])
+        self.assertEqual(limiter.limited_count, 2)
+
+    def test_keys_have_their_own_bucket(self):
+        limiter = TokenBucketLimiter(rate=1, burst=1)
+        self.assertTrue(limiter.allow(1))
+        self.assertFalse(limiter.allow(1))
+        self.assertTrue(limiter.allow(2))
+
+    def test_least_recent_keys_are_evicted(self):
+        limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=2)
+        for key in (1, 2, 3):
+            limiter.allow(key)
+        self.assertEqual(list(limiter._buckets), [2, 3])
+        self.assertTrue(limiter.allow(1))
+
+    def test_rate_below_one_allows_a_log(self):
+        with override_settings(DRF_ACTIVITY_TRACKER_USER_RATE_LIMIT={'rate': 0.1}):
+            limiter = get_user_rate_limiter()
+        self.assertEqual(limiter.burst, 1)
+        self.assertTrue(limiter.allow(1))
+        self.assertFalse(limiter.allow(1))
+        self.time.monotonic.return_value = 110.0
+        self.assertTrue(limiter.allow(1))
+
+    def test_invalid_burst(self):
+        with override_settings(DRF_ACTIVITY_TRACKER_USER_RATE_LIMIT={'rate': 1, 'burst': 0.5}):
+            with self.assertRaises(Exception):
+                get_user_rate_limiter()
+
+
+class CompressionTests(SimpleTestCase):
+
+    def get_log(self):
+        return {'body': {'items': ['item {}'.format(index) for index in range(200)]}, 'response': 'ok',
+                'headers': {}, 'status_code': 200}
+
+    def assert_round_trip(self, compressor):
+        log = compressor.compress_log(self.get_log())
+        self.assertTrue(is_compressed(log['body']))
+        # Small and empty fields are kept as they are.
+        self.assertEqual(log['response'], 'ok')
+        self.assertEqual(log['headers'], {})
+        stored = bson.decode(bson.encode(log))
+        self.assertEqual(decompress_log(stored), self.get_log())
+        self.assertEqual(compressor.compressed_count, 1)
+        self.assertGreater(compressor.get_stats()['compression_ratio'], 1)
+
+    def test_zlib_round_trip(self):
+        self.assert_round_trip(FieldCompressor(codec='zlib', threshold=100))
+
+    @skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd_round_trip(self):
+        self.assert_round_trip(FieldCompressor(codec='zstd', threshold=100))
+
+    def test_compressed_fields_are_left_alone(self):
+        compressor = FieldCompressor(codec='zlib', threshold=100)
+        log = compressor.compress_log(self.get_log())
+        body = log['body']
+        self.assertIs(compressor.compress_log(log)['body'], body)
+
+    def test_invalid_codec(self):
+        with self.assertRaises(Exception):
+            FieldCompressor(codec='lzma')
+
+
+class HeaderPolicyTests(SimpleTestCase):
+    meta = {
+        'HTTP_USER_AGENT': 'agent',
+        'HTTP_AUTHORIZATION': 'Bearer token',
+        'HTTP_COOKIE': 'sessionid=1',
+        'HTTP_X_LONG': 'x' * 20,
+        'CONTENT_TYPE': 'application/json',
+    }
+
+    def test_meta_keys(self):
+        self.assertEqual(to_meta_key('User-Agent'), 'HTTP_USER_AGENT')
+        self.assertEqual(to_meta_key('user_agent'), 'HTTP_USER_AGENT')
+        self.assertEqual(to_meta_key('HTTP_USER_AGENT'), 'HTTP_USER_AGENT')
+
+    def test_exclude(self):
+        policy = HeaderPolicy(exclude=['Cookie'], max_length=10,
+                              redaction_plan=RedactionPlan(keys=['authorization'], ignore_case=True))
+        self.assertEqual(policy.capture(self.meta), {'USER_AGENT': 'agent', 'AUTHORIZATION': FILTERED_MARKER,
+                                                     'X_LONG': 'x' * 10 + TRUNCATED_MARKER})
+
+    def test_include(self):
+        policy = HeaderPolicy(include=['User-Agent', 'X-Long', 'Cookie', 'X-Missing'], exclude=['Cookie'],
+                              max_lengths={'X-Long': 5})
+        self.assertEqual(policy.capture(self.meta), {'USER_AGENT': 'agent', 'X_LONG': 'x' * 5 + TRUNCATED_MARKER})
+
+    def test_default_policy_excludes_cookies(self):
+        headers = build_header_policy().capture(self.meta)
+        self.assertNotIn('COOKIE', headers)
+        self.assertIn('USER_AGENT', headers)
+        self.assertNotIn('CONTENT_TYPE', headers)
+
+
+class MultipartMetadataTests(SimpleTestCase):
+
+    def get_request(self):
+        upload = SimpleUploadedFile('report.csv', b'id,name\n' * 100, content_type='text/csv')
+        return RequestFactory().post('/upload/', {'name': 'report', 'note': 'n' * 20, 'file': upload})
+
+    def test_scan_unread_body(self):
+        metadata = scan_multipart(self.get_request(), max_size=1024 * 1024, max_length=10)
+        self.assertEqual(metadata, {'name': 'report', 'note': 'n' * 10 + TRUNCATED_MARKER,
+                                    'file': {'name': 'report.csv', 'size': 800, 'content_type': 'text/csv'}})
+
+    def test_scan_limits(self):
+        self.assertIsNone(scan_multipart(self.get_request(), max_size=100, max_length=10))
+        request = self.get_request()
+        request.read()
+        self.assertIsNone(scan_multipart(request, max_size=1024 * 1024, max_length=10))
+
+    def test_parsed_data(self):
+        request = self.get_request()
+        metadata = get_multipart_metadata(request.POST, request.FILES, max_length=256)
+        self.assertEqual(metadata['name'], 'report')
+        self.assertEqual(metadata['file'], {'name': 'report.csv', 'size': 800, 'content_type': 'text/csv'})
+
+    def test_repeated_fields(self):
+        files = MultiValueDict({'file': [SimpleUploadedFile('a.txt', b'a'), SimpleUploadedFile('b.txt', b'bb')]})
+        metadata = get_multipart_metadata(MultiValueDict({'tag': ['a', 'b']}), files, max_length=256)
+        self.assertEqual(metadata['tag'], ['a', 'b'])
+        self.assertEqual([file['size'] for file in metadata['file']], [1, 2])
+
+
+MIDDLEWARE_MODULE = 'drf_user_activity_tracker_mongodb.middleware.activity_tracker_middleware'
+
+
+async def async_view(request):
+    return JsonResponse({'ok': True})
+
+
+urlpatterns = [
+    path('async/', async_view, name='async_view'),
+    path('async/skipped/', async_view, name='async_skipped'),
+    path('logs/', include('drf_user_activity_tracker_mongodb.urls')),
+    path('orders/', include(([path('<int:pk>/', async_view, name='detail')], 'orders'))),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, MIDDLEWARE=[MIDDLEWARE_MODULE + '.ActivityTrackerMiddleware'],
+                   DRF_ACTIVITY_TRACKER_DATABASE=True, DRF_ACTIVITY_TRACKER_SIGNAL=False,
+                   DRF_ACTIVITY_TRACKER_SKIP_URL_NAME=['async_skipped'])
+class AsyncMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.writer = mock.MagicMock()
+        token = jwt.encode({'user_id': 1}, settings.SECRET_KEY, algorithm='HS256')
+        # Headers of the ASGI scope are given per request.
+        self.headers = {'Authorization': 'Bearer {}'.format(token)}
+
+    async def test_async_view_is_logged(self):
+        with mock.patch(MIDDLEWARE_MODULE + '.get_started_logger_thread', return_value=self.writer):
+            response = await self.async_client.get('/async/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.writer.put_log_data.assert_called_once()
+        log = self.writer.put_log_data.call_args.kwargs['data']
+        self.assertEqual(log['url_name'], 'async_view')
+        self.assertEqual(log['user_id'], 1)
+        self.assertEqual(log['response'], {'ok': True})
+
+    async def test_logger_thread_is_started_in_a_thread(self):
+        with mock.patch(MIDDLEWARE_MODULE + '.get_started_logger_thread', return_value=None), \
+                mock.patch(MIDDLEWARE_MODULE + '.get_logger_thread', return_value=self.writer) as get_logger_thread, \
+                mock.patch(MIDDLEWARE_MODULE + '.sync_to_async', wraps=sync_to_async) as offload:
+            await self.async_client.get('/async/', headers=self.headers)
+        offload.assert_called_once_with(get_logger_thread, thread_sensitive=False)
+        get_logger_thread.assert_called_once_with()
+        self.writer.put_log_data.assert_called_once()
+
+    async def test_skipped_url_is_not_logged(self):
+        with mock.patch(MIDDLEWARE_MODULE + '.get_started_logger_thread', return_value=self.writer), \
+                mock.patch.object(ActivityTrackerMiddleware, '_build_log') as build_log:
+            response = await self.async_client.get('/async/skipped/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        build_log.assert_not_called()
+        self.writer.put_log_data.assert_not_called()
+
+
+@override_settings(DRF_ACTIVITY_TRACKER_SIGNAL=False)
+class TokenCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.middleware = ActivityTrackerMiddleware(lambda request: None)
+        self.expires_at = int(time.time()) + 60
+        self.token = jwt.encode({'user_id': '1', 'exp': self.expires_at}, settings.SECRET_KEY, algorithm='HS256')
+
+    def get_request(self, auth=None, user=None):
+        request = RequestFactory().get('/')
+        request.auth = auth
+        request.user = user or SimpleNamespace(pk=1, is_authenticated=True)
+        return request
+
+    def test_cache_hit_skips_decoding(self):
+        with mock.patch(MIDDLEWARE_MODULE + '.jwt.decode', wraps=jwt.decode) as decode:
+            self.assertEqual(self.middleware._get_token_payload(self.token), {'user_id': 1})
+            self.assertEqual(self.middleware._get_token_payload(self.token), {'user_id': 1})
+        self.assertEqual(decode.call_count, 1)
+
+    def test_entry_expires_at_exp(self):
+        with mock.patch(MIDDLEWARE_MODULE + '.jwt.decode', wraps=jwt.decode) as decode:
+            self.middleware._get_token_payload(self.token)
+            with mock.patch('time.time', return_value=self.expires_at - 1):
+                self.middleware._get_token_payload(self.token)
+            self.assertEqual(decode.call_count, 1)
+            with mock.patch('time.time', return_value=self.expires_at):
+                self.middleware._get_token_payload(self.token)
+        self.assertEqual(decode.call_count, 2)
+
+    def test_invalid_token_is_not_cached(self):
+        invalid_token = jwt.encode({'user_id': 2}, 'another secret key' * 4, algorithm='HS256')
+        with self.assertRaises(jwt.InvalidTokenError):
+            self.middleware._get_token_payload(invalid_token)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION='Bearer {}'.format(invalid_token))
+        self.assertIsNone(self.middleware._get_payload_data(request, None, 'items'))
+        self.assertEqual(len(self.middleware._token_cache), 0)
+        self.assertEqual(self.middleware._get_token_payload(self.token), {'user_id': 1})
+
+    def test_request_auth_payload(self):
+        request = self.get_request(auth=SimpleNamespace(payload={'user_id': '1', 'exp': self.expires_at}))
+        self.assertEqual(self.middleware._get_request_auth_payload(request), {'user_id': 1})
+
+    def test_request_user_fallback(self):
+        self.assertEqual(self.middleware._get_request_auth_payload(self.get_request(auth='token')), {'user_id': 1})
+        anonymous_user = SimpleNamespace(pk=None, is_authenticated=False)
+        self.assertIsNone(self.middleware._get_request_auth_payload(self.get_request(auth='token',
+                                                                                     user=anonymous_user)))
+        self.assertIsNone(self.middleware._get_request_auth_payload(self.get_request()))
+
+
+class RollupTests(SimpleTestCase):
+
+    def get_logs(self, *execution_times):
+        return [{'created_time': datetime(2024, 1, 1, 12, index), 'url_name': 'items', 'method': 'GET',
+                 'status_code': 200, 'execution_time': execution_time}
+                for index, execution_time in enumerate(execution_times)]
+
+    def test_percentiles_stay_within_min_and_max(self):
+        row = summarize_logs(self.get_logs(0.011, 0.012, 0.013))[0]
+        for name in ['execution_time_p50', 'execution_time_p95', 'execution_time_p99']:
+            self.assertGreaterEqual(row[name], 0.011)
+            self.assertLessEqual(row[name], 0.013)
+
+    def test_overflow_bucket(self):
+        histogram = [0] * len(LATENCY_BUCKETS) + [2]
+        self.assertEqual(get_percentile(histogram, 0.5), LATENCY_BUCKETS[-1])
+        self.assertEqual(get_percentile(histogram, 1, 11, 30), 30)
+        self.assertAlmostEqual(summarize_logs(self.get_logs(20, 40))[0]['execution_time_p99'], 39.8)
+
+    def test_empty_histogram(self):
+        self.assertIsNone(get_percentile([0] * (len(LATENCY_BUCKETS) + 1), 0.5))
+
+    def test_refused_update_is_dropped(self):
+        aggregator = RollupAggregator()
+        aggregator.add(self.get_logs(0.1, 0.2, 0.3))
+        keys = list(aggregator.get_buckets())
+        collection = mock.MagicMock()
+        collection.bulk_write.side_effect = BulkWriteError({'writeErrors': [{'index': 1, 'code': 121}]})
+        self.assertFalse(aggregator.flush(collection))
+        self.assertEqual(list(aggregator.get_buckets()), keys[2:])
+        self.assertEqual(aggregator.dropped_count, 1)
+
+        collection.bulk_write.side_effect = None
+        self.assertTrue(aggregator.flush(collection))
+        self.assertEqual(len(collection.bulk_write.call_args.args[0]), 1)
+        self.assertEqual(len(aggregator), 0)
+
+    def test_failed_write_is_restored(self):
+        aggregator = RollupAggregator()
+        aggregator.add(self.get_logs(0.1, 0.2))
+        collection = mock.MagicMock()
+        collection.bulk_write.side_effect = AutoReconnect('connection refused')
+        self.assertFalse(aggregator.flush(collection))
+        self.assertEqual(len(aggregator), 2)
+
+    def test_write_concern_error_is_not_restored(self):
+        aggregator = RollupAggregator()
+        aggregator.add(self.get_logs(0.1))
+        collection = mock.MagicMock()
+        collection.bulk_write.side_effect = BulkWriteError({'writeErrors': [], 'writeConcernErrors': [{}]})
+        self.assertFalse(aggregator.flush(collection))
+        self.assertEqual(len(aggregator), 0)
+
+    def test_rollups_api_is_skipped(self):
+        middleware = ActivityTrackerMiddleware(lambda request: None)
+        self.assertIn('activity_log:rollups', middleware.DRF_ACTIVITY_TRACKER_SKIP_URL_NAME)
+
+
+class FlushTriggerTests(SimpleTestCase):
+
+    def get_writer(self, **options):
+        options.setdefault('DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE', 40)
+        with override_settings(DRF_ACTIVITY_TRACKER_INTERVAL=10, DRF_ACTIVITY_TRACKER_JOURNAL_DIR=None, **options):
+            return InsertLogIntoDatabase(backend=MemoryBackend())
+
+    def put_logs(self, writer, count):
+        for index in range(count):
+            writer.put_log_data({'index': index})
+
+    def test_count(self):
+        writer = self.get_writer(DRF_ACTIVITY_TRACKER_QUEUE_MAX_SIZE=2)
+        self.put_logs(writer, 1)
+        self.assertFalse(writer._flush_event.is_set())
+        self.assertIsNone(writer._get_flush_trigger(time.monotonic()))
+        self.put_logs(writer, 1)
+        self.assertTrue(writer._flush_event.is_set())
+        self.assertEqual(writer._get_flush_trigger(time.monotonic()), 'count')
+
+    def test_bytes(self):
+        writer = self.get_writer(DRF_ACTIVITY_TRACKER_BATCH_MAX_BYTES=150)
+        writer.avg_log_size = 100
+        self.put_logs(writer, 1)
+        self.assertFalse(writer._flush_event.is_set())
+        self.put_logs(writer, 1)
+        self.assertTrue(writer._flush_event.is_set())
+        self.assertEqual(writer._get_flush_trigger(time.monotonic()), 'bytes')
+
+    def test_age(self):
+        writer = self.get_writer(DRF_ACTIVITY_TRACKER_BATCH_MAX_AGE=1)
+        self.put_logs(writer, 1)
+        # The first log wakes the thread up to start its age timer.
+        self.assertTrue(writer._flush_event.is_set())
+        self.assertLessEqual(writer._get_wait_timeout(time.monotonic()), 1)
+        self.assertIsNone(writer._get_flush_trigger(time.monotonic()))
+        writer._oldest_time -= 1
+        self.assertEqual(writer._get_flush_trigger(time.monotonic()), 'age')
+
+    def test_interval(self):
+        writer = self.get_writer()
+        self.assertIsNone(writer._get_flush_trigger(time.monotonic()))
+        self.assertEqual(writer._get_flush_trigger(time.monotonic() - 10), 'interval')
+
+    def test_adapt_batch_size(self):
+        writer = self.get_writer(DRF_ACTIVITY_TRACKER_BATCH_TARGET_LATENCY=0.1)
+        writer._adapt_batch_size(40, 0.2)
+        self.assertEqual(writer.batch_size, 20)
+        writer._adapt_batch_size(20, 0.01)
+        self.assertEqual(writer.batch_size, 25)
+        # A partial batch says nothing about a bigger one.
+        writer._adapt_batch_size(10, 0.01)
+        self.assertEqual(writer.batch_size, 25)
+        writer._adapt_batch_size(25, 0.07)
+        self.assertEqual(writer.batch_size, 25)
+
+    def test_adapt_batch_size_bounds(self):
+        writer = self.get_writer(DRF_ACTIVITY_TRACKER_BATCH_TARGET_LATENCY=0.1, DRF_ACTIVITY_TRACKER_BATCH_MIN_SIZE=15,
+                                 DRF_ACTIVITY_TRACKER_BATCH_MAX_SIZE=45)
+        for _ in range(3):
+            writer._adapt_batch_size(writer.batch_size, 1)
+        self.assertEqual(writer.batch_size, 15)
+        for _ in range(10):
+            writer._adapt_batch_size(writer.batch_size, 0)
+        self.assertEqual(writer.batch_size, 45)
+
+    def test_fixed_batch_size(self):
+        writer = self.get_writer()
+        writer._adapt_batch_size(40, 100)
+        self.assertEqual(writer.batch_size, 40)
+
+
+class BatchListenerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.delivered = threading.Event()
+
+    def save_events(self, events):
+        self.batches.append(events)
+        self.delivered.set()
+
+    def test_due_batch_without_new_event(self):
+        listener = BatchListener(self.save_events, batch_size=10, max_wait=0.05)
+        listener(index=0)
+        self.assertTrue(self.delivered.wait(timeout=5))
+        self.assertEqual(self.batches, [[{'index': 0}]])
+
+    def test_due_batch_is_delivered_by_the_dispatcher(self):
+        dispatcher = EventDispatcher(workers=1)
+        slot = Events().on_log
+        slot.set_dispatcher(dispatcher)
+        listener = BatchListener(self.save_events, batch_size=10, max_wait=0.05)
+        slot += listener
+        self.addCleanup(dispatcher.shutdown)
+        slot(index=0)
+        self.assertTrue(self.delivered.wait(timeout=5))
+        self.assertEqual(self.batches, [[{'index': 0}]])
+        self.assertIs(listener.dispatcher, dispatcher)
+        self.assertIsNone(listener._timer)
+
+    def test_full_batch(self):
+        listener = BatchListener(self.save_events, batch_size=2, max_wait=60)
+        listener(index=0)
+        listener(index=1)
+        self.assertEqual(self.batches, [[{'index': 0}, {'index': 1}]])
+
+    def test_pending_batch_is_delivered_at_exit(self):
+        listener = BatchListener(self.save_events, batch_size=10, max_wait=60)
+        listener(index=0)
+        self.assertEqual(self.batches, [])
+        flush_batch_listeners()
+        self.assertEqual(self.batches, [[{'index': 0}]])
+
+    def test_pending_batch_is_delivered_on_dispatcher_shutdown(self):
+        dispatcher = EventDispatcher(workers=1)
+        slot = Events().on_log
+        slot.set_dispatcher(dispatcher)
+        listener = BatchListener(self.save_events, batch_size=10, max_wait=60)
+        slot += listener
+        slot(index=0)
+        dispatcher.shutdown()
+        self.assertEqual(self.batches, [[{'index': 0}]])
+        self.assertIsNone(listener.dispatcher)
+
+
+class SQLiteBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(os.path.join(self.directory, 'activity_log.sqlite3'))
+        created_time = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+        self.logs = [{'created_time': created_time + timedelta(seconds=index * 20), 'user_id': index % 2 + 1,
+                      'url_name': 'items', 'method': 'GET', 'status_code': 500 if index == 4 else 200,
+                      'execution_time': 0.25 * (index + 1)} for index in range(5)]
+        self.backend.save_many(self.logs)
+
+    def tearDown(self):
+        self.backend.close()
+        shutil.rmtree(self.directory)
+
+    def test_logs_are_not_changed(self):
+        self.assertEqual(self.logs[0]['created_time'], datetime(2024, 1, 1, 12, tzinfo=timezone.utc))
+        self.assertIsInstance(self.logs[0]['_id'], ObjectId)
+
+    def test_list_and_count(self):
+        logs = self.backend.list()
+        self.assertEqual([log['_id'] for log in logs], [log['_id'] for log in reversed(self.logs)])
+        self.assertEqual(logs[0]['created_time'], datetime(2024, 1, 1, 12, 1, 20))
+        self.assertEqual(len(self.backend.list(user_id=2)), 2)
+        self.assertEqual(self.backend.count(), 5)
+        self.assertEqual(self.backend.count(user_id=1), 3)
+        self.assertEqual(self.backend.count(status_code=500), 1)
+        self.assertEqual(self.backend.count(limit=2), 2)
+
+    def test_pages(self):
+        first_page = self.backend.list(dataset_limit=2)
+        second_page = self.backend.list(dataset_limit=2, after=(first_page[-1]['created_time'],
+                                                                first_page[-1]['_id']))
+        self.assertEqual([log['_id'] for log in first_page + second_page],
+                         [log['_id'] for log in reversed(self.logs[1:])])
+
+    def test_replayed_log_is_ignored(self):
+        self.backend.save_many([dict(self.logs[0])])
+        self.assertEqual(self.backend.count(), 5)
+
+    def test_detail(self):
+        log = self.backend.detail(str(self.logs[2]['_id']))
+        self.assertEqual(log['execution_time'], self.logs[2]['execution_time'])
+        self.assertIsNone(self.backend.detail('not-an-id'))
+        self.assertIsNone(self.backend.detail(str(ObjectId())))
+
+    def test_aggregate(self):
+        rows = self.backend.aggregate()
+        self.assertEqual([(row['status_class'], row['count'], row['error_count']) for row in rows],
+                         [('2xx', 4, 0), ('5xx', 1, 1)])
+        self.assertEqual(rows, summarize_logs(self.backend.list()))
+
+    def test_aggregate_by_minute(self):
+        rows = self.backend.aggregate(group_by='minute')
+        self.assertEqual([(row['minute'], row['count']) for row in rows],
+                         [(datetime(2024, 1, 1, 12), 3), (datetime(2024, 1, 1, 12, 1), 2)])
+        self.assertEqual(rows, summarize_logs(self.backend.list(), group_by='minute'))
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_prometheus_format(self):
+        registry = MetricsRegistry(prefix='test')
+        requests = registry.counter('requests_total', 'Requests.', ['outcome'])
+        depth = registry.gauge('queue_depth', 'Depth.')
+        latency = registry.histogram('latency_seconds', 'Latency.', [0.1, 1])
+        requests.inc(labels=('logged',))
+        requests.inc(2, labels=('skipped "x"',))
+        depth.set(3)
+        for value in [0.05, 0.1, 0.5, 2.0]:
+            latency.observe(value)
+
+        self.assertEqual(registry.to_prometheus(), '\n'.join([
+            '# HELP test_requests_total Requests.',
+            '# TYPE test_requests_total counter',
+            'test_requests_total{outcome="logged"} 1',
+            'test_requests_total{outcome="skipped \\"x\\""} 2',
+            '# HELP test_queue_depth Depth.',
+            '# TYPE test_queue_depth gauge',
+            'test_queue_depth 3',
+            '# HELP test_latency_seconds Latency.',
+            '# TYPE test_latency_seconds histogram',
+            'test_latency_seconds_bucket{le="0.1"} 2',
+            'test_latency_seconds_bucket{le="1"} 3',
+            'test_latency_seconds_bucket{le="+Inf"} 4',
+            'test_latency_seconds_sum 2.65',
+            'test_latency_seconds_count 4',
+        ]) + '\n')
+        self.assertEqual(registry.get_summary()['requests_total'], {'logged': 1, 'skipped "x"': 2})
+        self.assertEqual(latency.get_summary()['p50'], 0.1)
+
+    def get_response(self, user=None):
+        request = APIRequestFactory().get('/activity-logs/metrics/')
+        if user is not None:
+            force_authenticate(request, user=user)
+        return ActivityMetricsView.as_view()(request)
+
+    def test_anonymous_request(self):
+        self.assertEqual(self.get_response().status_code, 401)
+
+    def test_missing_permission(self):
+        user = mock.Mock(is_authenticated=True)
+        user.has_perm.return_value = False
+        self.assertEqual(self.get_response(user).status_code, 403)
+        user.has_perm.assert_called_once_with('drf_user_activity_tracker_mongodb.view_activitylog')
+
+    def test_metrics_view(self):
+        user = mock.Mock(is_authenticated=True)
+        user.has_perm.return_value = True
+        response = self.get_response(user)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE drf_activity_tracker_requests_total counter', response.content)
+
+
+class IndexManagerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.collection = mock.MagicMock()
+        self.collection.name = 'logs'
+        self.collection.index_information.return_value = {
+            '_id_': {'key': [('_id', 1)]},
+            # Directions are floats in indexes created from the mongo shell.
+            'created_time_-1__id_-1': {'key': [('created_time', -1.0), ('_id', -1)]},
+            'created_time_1': {'key': [('created_time', 1)], 'expireAfterSeconds': 100},
+            'legacy': {'key': [('event_name', 1)]},
+        }
+        self.collection.aggregate.return_value = [
+            {'name': 'created_time_-1__id_-1', 'accesses': {'ops': 5}},
+            {'name': 'legacy', 'accesses': {'ops': 0}},
+        ]
+        self.manager = IndexManager(self.collection, ttl_seconds=3600)
+
+    def test_report(self):
+        report = self.manager.get_report()
+        self.assertEqual(report['missing'], ['user_id_1_created_time_-1__id_-1',
+                                             'url_name_1_created_time_-1__id_-1_status_code_1',
+                                             'user_id_1_url_name_1_created_time_-1__id_-1'])
+        self.assertEqual(report['unknown'], ['legacy'])
+        self.assertEqual(report['unused'], ['legacy'])
+        self.assertEqual(report['ttl_seconds'], 3600)
+        self.assertEqual(report['current_ttl_seconds'], 100)
+
+    def test_unused_indexes_without_index_stats(self):
+        self.collection.aggregate.side_effect = Exception('not authorized')
+        self.assertIsNone(self.manager.get_report()['unused'])
+
+    def test_create_missing_indexes(self):
+        self.manager.create_missing_indexes()
+        self.assertEqual(self.collection.create_index.call_count, 3)
+
+    def test_ttl_is_changed_with_coll_mod(self):
+        self.assertTrue(self.manager.apply_ttl())
+        self.collection.database.command.assert_called_once_with(
+            'collMod', 'logs', index={'keyPattern': {'created_time': 1}, 'expireAfterSeconds': 3600})
+        self.collection.drop_index.assert_not_called()
+
+    def test_ttl_rebuild(self):
+        self.collection.database.command.side_effect = Exception('InvalidOptions')
+        self.assertFalse(self.manager.apply_ttl())
+        self.collection.drop_index.assert_not_called()
+        self.assertTrue(self.manager.apply_ttl(rebuild=True))
+        self.collection.drop_index.assert_called_once_with('created_time_1')
+        self.collection.create_index.assert_called_once_with([('created_time', 1)], name='created_time_1',
+                                                             expireAfterSeconds=3600)
+
+    def test_same_ttl(self):
+        self.assertTrue(IndexManager(self.collection, ttl_seconds=100).apply_ttl())
+        self.collection.database.command.assert_not_called()
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class UrlNameIndexTests(SimpleTestCase):
+
+    def test_index_is_built_once(self):
+        index = UrlNameIndex()
+        version = index.get_version()
+        with mock.patch.object(index, '_walk') as walk:
+            self.assertEqual(index.get_version(), version)
+            self.assertIn('async_view', index.get_url_names())
+        walk.assert_not_called()
+
+    def test_reloaded_urlconf_is_indexed_again(self):
+        index = UrlNameIndex()
+        version = index.get_version()
+        clear_url_caches()
+        self.assertEqual(index.get_version(), version + 1)
+        with override_settings(ROOT_URLCONF='drf_user_activity_tracker_mongodb.urls'):
+            self.assertEqual(index.get_version(), version + 2)
+            self.assertEqual(index.get_url_names(), ['admin_history', 'metrics', 'rollups', 'user_history'])
+            self.assertNotIn('async_view', index.get_url_names())
+
+    def test_qualified_names(self):
+        routes = UrlNameIndex().get_routes()
+        self.assertEqual(routes['activity_log:metrics'], ('metrics', 'activity_log'))
+        self.assertEqual(routes['async_view'], ('async_view', ''))
+
+
+class LoggerThreadTests(SimpleTestCase):
+
+    def setUp(self):
+        module = start_logger_when_server_starts
+        state = (module.LOGGER_THREAD, module._logger_thread_pid, module._logger_stopped)
+        self.addCleanup(self.restore_state, *state)
+        module.LOGGER_THREAD, module._logger_thread_pid, module._logger_stopped = None, None, False
+        for patcher in [mock.patch.object(module, 'database_log_enabled', return_value=True),
+                        mock.patch.object(module, 'atexit')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def restore_state(logger_thread, pid, stopped):
+        module = start_logger_when_server_starts
+        module.LOGGER_THREAD, module._logger_thread_pid, module._logger_stopped = logger_thread, pid, stopped
+
+    def patch_thread_class(self, **kwargs):
+        return mock.patch('drf_user_activity_tracker_mongodb.insert_log_into_database.InsertLogIntoDatabase',
+                          **kwargs)
+
+    def test_started_once_per_process(self):
+        with self.patch_thread_class() as thread_class:
+            self.assertIsNone(start_logger_when_server_starts.get_started_logger_thread())
+            logger_thread = start_logger_when_server_starts.get_logger_thread()
+            self.assertIs(start_logger_when_server_starts.get_logger_thread(), logger_thread)
+        thread_class.assert_called_once_with()
+        logger_thread.start.assert_called_once_with()
+        self.assertIs(start_logger_when_server_starts.get_started_logger_thread(), logger_thread)
+
+    def test_new_thread_in_a_new_process(self):
+        with self.patch_thread_class(side_effect=lambda: mock.MagicMock()):
+            parent_thread = start_logger_when_server_starts.get_logger_thread()
+            # The thread of the parent process doesn't run in the child.
+            start_logger_when_server_starts._logger_thread_pid = os.getpid() + 1
+            self.assertIsNone(start_logger_when_server_starts.get_started_logger_thread())
+            child_thread = start_logger_when_server_starts.get_logger_thread()
+        self.assertIsNot(child_thread, parent_thread)
+        child_thread.start.assert_called_once_with()
+
+    def test_reset_after_fork(self):
+        with self.patch_thread_class(side_effect=lambda: mock.MagicMock()):
+            parent_thread = start_logger_when_server_starts.get_logger_thread()
+            start_logger_when_server_starts._reset_after_fork()
+            self.assertIsNone(start_logger_when_server_starts.get_started_logger_thread())
+            self.assertIsNot(start_logger_when_server_starts.get_logger_thread(), parent_thread)
+
+    def test_clean_stop(self):
+        backend = MemoryBackend()
+        with override_settings(DRF_ACTIVITY_TRACKER_JOURNAL_DIR=None), \
+                self.patch_thread_class(side_effect=lambda: InsertLogIntoDatabase(backend=backend)):
+            logger_thread = start_logger_when_server_starts.get_logger_thread()
+        logger_thread.put_log_data({'created_time': datetime(2024, 1, 1)})
+        start_logger_when_server_starts.stop_logger_thread(timeout=5)
+        self.assertFalse(logger_thread.is_alive())
+        self.assertEqual(backend.count(), 1)
+        # Logs added during interpreter shutdown are dropped, no thread is started again.
+        self.assertIsNone(start_logger_when_server_starts.get_logger_thread())
+        self.assertIsNone(start_logger_when_server_starts.get_started_logger_thread())
+
+
+CODEC_DATA = {
+    'text': 'caf\u00e9 \u2028',
+    'numbers': [1, 2.5, -3, Decimal('1.10')],
+    'when': datetime(2024, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'nested': {'empty': [], 'none': None, 'flag': True},
+}
+
+
+class CodecTests(SimpleTestCase):
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_matches_stdlib(self):
+        self.assertEqual(OrjsonCodec().dumps(CODEC_DATA), StdlibJSONCodec().dumps(CODEC_DATA))
+        self.assertEqual(OrjsonCodec().dumps(CODEC_DATA, indent=True), StdlibJSONCodec().dumps(CODEC_DATA, indent=True))
+        content = StdlibJSONCodec().dumps(CODEC_DATA)
+        self.assertEqual(OrjsonCodec().loads(content), StdlibJSONCodec().loads(content))
+
+    @skipIf(orjson is None, 'orjson is not installed')
+    def test_orjson_rejected_data(self):
+        data = {'big': 2 ** 70, 'nan': float('nan')}
+        self.assertEqual(OrjsonCodec().dumps(data), StdlibJSONCodec().dumps(data))
+        self.assertEqual(OrjsonCodec().loads(b'{"nan": NaN}')['nan'].__class__, float)
+
+    def test_fallback_without_orjson(self):
+        with mock.patch('drf_user_activity_tracker_mongodb.codec.orjson', None):
+            with override_settings(DRF_ACTIVITY_TRACKER_JSON_CODEC='auto'):
+                self.assertEqual(get_json_codec().name, 'json')
+            with override_settings(DRF_ACTIVITY_TRACKER_JSON_CODEC='orjson'):
+                with self.assertRaises(Exception):
+                    get_json_codec()
+
+    def test_unknown_codec(self):
+        with override_settings(DRF_ACTIVITY_TRACKER_JSON_CODEC='ujson'):
+            with self.assertRaises(Exception):
+                get_json_codec()
+
+    def test_renderer_matches_drf(self):
+        for codec in ['json', 'auto']:
+            with override_settings(DRF_ACTIVITY_TRACKER_JSON_CODEC=codec):
+                self.assertEqual(ActivityJSONRenderer().render(CODEC_DATA), JSONRenderer().render(CODEC_DATA))
+                self.assertEqual(ActivityJSONRenderer().render(None), b'')
+        self.assertEqual(ActivityJSONRenderer().render(CODEC_DATA, 'application/json; indent=4'),
+                         JSONRenderer().render(CODEC_DATA, 'application/json; indent=4'))
+
+
+@override_settings(ROOT_URLCONF=__name__, DRF_ACTIVITY_TRACKER_SKIP_URL_NAME=['orders:detail'])
+class RouteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.middleware = ActivityTrackerMiddleware(lambda request: None)
+
+    def get_route(self, path):
+        return self.middleware._get_route(RequestFactory().get(path))
+
+    def test_cache_hit(self):
+        with mock.patch(MIDDLEWARE_MODULE + '.resolve', wraps=resolve) as resolve_path:
+            self.assertEqual(self.get_route('/async/'), ('async_view', '', True))
+            self.assertEqual(self.get_route('/async/'), ('async_view', '', True))
+        resolve_path.assert_called_once()
+        self.assertEqual(self.middleware._route_cache.hits, 1)
+
+    def test_namespaced_routes(self):
+        self.assertEqual(self.get_route('/orders/1/'), ('detail', 'orders', False))
+        self.assertEqual(self.get_route('/logs/rollups/'), ('rollups', 'activity_log', False))
+        self.assertEqual(self.get_route('/logs/user-history/'), ('user_history', 'activity_log', False))
+
+    def test_unknown_path_is_not_cached(self):
+        self.assertEqual(self.get_route('/missing/'), (None, None, False))
+        self.assertEqual(len(self.middleware._route_cache), 0)
+
+    def test_reloaded_urlconf_is_resolved_again(self):
+        self.get_route('/async/')
+        clear_url_caches()
+        with mock.patch(MIDDLEWARE_MODULE + '.resolve', wraps=resolve) as resolve_path:
+            self.get_route('/async/')
+        resolve_path.assert_called_once()
@@ -1,5 +1,6 @@
 from django.urls import path
-from drf_user_activity_tracker_mongodb.views import ActivityLogView, ActivityLogAdminView
+from drf_user_activity_tracker_mongodb.views import ActivityLogView, ActivityLogAdminView, ActivityRollupView, \
+    ActivityMetricsView
 
 app_name = "activity_log"
 
@@ -7,6 +8,8 @@ app_name = "activity_log"
 urlpatterns = [
     path('user-history/', ActivityLogView.as_view(), name='user_history'),
     path('admin-history/', ActivityLogAdminView.as_view(), name='admin_history'),
+    path('rollups/', ActivityRollupView.as_view(), name='rollups'),
+    path('metrics/', ActivityMetricsView.as_view(), name='metrics'),
 ]
 
 
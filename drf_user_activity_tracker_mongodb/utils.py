@@ -1,19 +1,187 @@
+import atexit
 import collections.abc
-import re
+import ipaddress
+import os
+import pathlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 from math import ceil
 
+import geoip2.database
 from bson import ObjectId
 from django.conf import settings
 from django.core.paginator import Paginator
-from django.urls import URLPattern, URLResolver
+from django.urls import URLPattern, URLResolver, get_resolver
 from django.utils import timezone
 from django.utils.functional import cached_property
-from pymongo import MongoClient
+from maxminddb import MODE_MMAP
+from pymongo import MongoClient, WriteConcern
+from rest_framework.utils.encoders import JSONEncoder
 
-SENSITIVE_KEYS = ['password', 'access', 'refresh']
-if hasattr(settings, 'DRF_ACTIVITY_TRACKER_EXCLUDE_KEYS'):
-    if isinstance(settings.DRF_ACTIVITY_TRACKER_EXCLUDE_KEYS, (list, tuple)):
-        SENSITIVE_KEYS.extend(settings.DRF_ACTIVITY_TRACKER_EXCLUDE_KEYS)
+from drf_user_activity_tracker_mongodb.compression import decompress_log
+from drf_user_activity_tracker_mongodb.redaction import SENSITIVE_KEYS, TRUNCATED_MARKER, get_redaction_plan
+
+
+GEO_DATABASE_PATH = '{}/geo_databases/GeoLite2-Country.mmdb'.format(pathlib.Path(__file__).parent)
+
+
+class LRUCache:
+    """
+    Thread-safe, bounded LRU cache.
+    Entries may expire at a given timestamp, or after `ttl` seconds when the cache has one.
+    """
+    _MISSING = object()
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, self._MISSING)
+            if item is self._MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get_stats(self):
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class GeoIPCountryLookup:
+    """
+    Resolves client IP addresses to country names.
+    The GeoLite2 database is opened once in memory-mapped mode and reopened only when the file changes.
+    """
+
+    def __init__(self, path=GEO_DATABASE_PATH):
+        self.path = path
+        self._reader = None
+        self._mtime = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+        self.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_SIZE = 10000  # Default cache size is 10000 addresses
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_GEOIP_CACHE_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_SIZE = settings.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_SIZE
+
+        self.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_TTL = 3600  # Default cache TTL is 1 hour
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_GEOIP_CACHE_TTL'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_TTL, int):
+                self.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_TTL = settings.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_TTL
+
+        self.DRF_ACTIVITY_TRACKER_GEOIP_CHECK_INTERVAL = 60  # Look for a new database file every minute
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_GEOIP_CHECK_INTERVAL'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_GEOIP_CHECK_INTERVAL, int):
+                self.DRF_ACTIVITY_TRACKER_GEOIP_CHECK_INTERVAL = settings.DRF_ACTIVITY_TRACKER_GEOIP_CHECK_INTERVAL
+
+        self.cache = LRUCache(max_size=self.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_SIZE,
+                              ttl=self.DRF_ACTIVITY_TRACKER_GEOIP_CACHE_TTL)
+
+    def country_name(self, ip):
+        if not ip:
+            return ''
+
+        country_name = self.cache.get(ip)
+        if country_name is not None:
+            return country_name
+
+        try:
+            address = ipaddress.ip_address(ip.strip())
+        except ValueError:
+            return ''
+
+        # Private and loopback addresses are never in the database.
+        if address.is_private or address.is_loopback or address.is_link_local or address.is_unspecified:
+            return ''
+
+        reader = self._get_reader()
+        if reader is None:
+            return ''
+
+        try:
+            country_name = reader.country(str(address)).country.name or ''
+        except Exception:
+            country_name = ''
+
+        self.cache.set(ip, country_name)
+        return country_name
+
+    def _get_reader(self):
+        now = time.time()
+        if now - self._checked_at < self.DRF_ACTIVITY_TRACKER_GEOIP_CHECK_INTERVAL:
+            return self._reader
+
+        with self._lock:
+            if now - self._checked_at < self.DRF_ACTIVITY_TRACKER_GEOIP_CHECK_INTERVAL:
+                return self._reader
+            self._checked_at = now
+
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                self._reader, self._mtime = None, None
+                return None
+
+            if mtime != self._mtime:
+                # The previous reader is not closed here, a running lookup may still use it.
+                try:
+                    self._reader = geoip2.database.Reader(self.path, mode=MODE_MMAP)
+                    self._mtime = mtime
+                except Exception:
+                    self._reader, self._mtime = None, None
+                self.cache.clear()
+            return self._reader
+
+    def get_stats(self):
+        return self.cache.get_stats()
+
+
+GEOIP_COUNTRY_LOOKUP = GeoIPCountryLookup()
 
 
 def get_headers(request=None):
@@ -21,9 +189,7 @@ def get_headers(request=None):
         Function:       get_headers(self, request)
         Description:    To get all the headers from request
     """
-    regex = re.compile('^HTTP_')
-    return dict((regex.sub('', header), value) for (header, value)
-                in request.META.items() if header.startswith('HTTP_'))
+    return {header[5:]: value for header, value in request.META.items() if header.startswith('HTTP_')}
 
 
 def get_client_ip(request):
@@ -58,53 +224,245 @@ def database_log_enabled():
 
 def mask_sensitive_data(data):
     """
-    Hides sensitive keys specified in sensitive_keys settings.
-    Loops recursively over nested dictionaries.
+    Returns a copy of data with sensitive keys and values hidden, see redaction.RedactionPlan.
     """
+    return get_redaction_plan().redact(data)
 
-    if not isinstance(data, dict):
-        return data
 
-    for key, value in data.items():
-        if key in SENSITIVE_KEYS:
-            data[key] = "***FILTERED***"
-            value = data[key]
+_json_encoder = JSONEncoder()
 
-        if isinstance(value, dict):
-            data[key] = mask_sensitive_data(data[key])
 
-        if isinstance(value, list):
-            data[key] = [mask_sensitive_data(item) for item in data[key]]
+def get_too_large_summary(size):
+    return '** Too Large: {} bytes **'.format(size)
 
-    return data
 
+def capture_data(data, max_size, max_depth=32):
+    """
+    Returns a copy of data made of JSON compatible types, within a budget of max_size bytes.
+    Strings and containers beyond the budget are cut and marked with TRUNCATED_MARKER,
+    so an oversized payload is never copied in full.
+    """
+    budget = [max_size]
+    return _capture_value(data, budget, max_depth)
+
+
+def _capture_value(value, budget, depth):
+    if budget[0] <= 0 or depth < 0:
+        return TRUNCATED_MARKER
+
+    if value is None or isinstance(value, (bool, int, float)):
+        budget[0] -= 8
+        return value
+
+    if isinstance(value, str):
+        if len(value) > budget[0]:
+            value = value[:budget[0]] + TRUNCATED_MARKER
+        budget[0] -= len(value)
+        return value
+
+    if isinstance(value, collections.abc.Mapping):
+        result = {}
+        for key, item in value.items():
+            if budget[0] <= 0:
+                result[TRUNCATED_MARKER] = True
+                break
+            key = str(key)
+            budget[0] -= len(key)
+            result[key] = _capture_value(item, budget, depth - 1)
+        return result
+
+    if isinstance(value, (list, tuple)):
+        result = []
+        for item in value:
+            if budget[0] <= 0:
+                result.append(TRUNCATED_MARKER)
+                break
+            result.append(_capture_value(item, budget, depth - 1))
+        return result
+
+    # Dates, decimals, UUIDs etc. are stored as DRF renders them.
+    try:
+        value = _json_encoder.default(value)
+    except Exception:
+        value = str(value)
+    return _capture_value(value, budget, depth)
+
+
+class MongoClientRegistry:
+    """
+    Process-wide registry of pooled MongoClient instances.
+    Clients are created lazily on first use and shared by every reader and writer
+    of the process. A client inherited through os.fork is never reused by the child.
+    """
 
-class MongoConnection(object):
     def __init__(self):
-        client = MongoClient(settings.DRF_ACTIVITY_TRACKER_MONGO_CONNECTION, serverSelectionTimeoutMs=5000)
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+        self.DRF_ACTIVITY_TRACKER_MONGO_MAX_POOL_SIZE = 100  # Default pymongo pool size
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MONGO_MAX_POOL_SIZE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_MONGO_MAX_POOL_SIZE, int):
+                self.DRF_ACTIVITY_TRACKER_MONGO_MAX_POOL_SIZE = settings.DRF_ACTIVITY_TRACKER_MONGO_MAX_POOL_SIZE
+
+        self.DRF_ACTIVITY_TRACKER_MONGO_MAX_IDLE_TIME_MS = None  # Idle connections are kept by default
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MONGO_MAX_IDLE_TIME_MS'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_MONGO_MAX_IDLE_TIME_MS, int):
+                self.DRF_ACTIVITY_TRACKER_MONGO_MAX_IDLE_TIME_MS = settings.DRF_ACTIVITY_TRACKER_MONGO_MAX_IDLE_TIME_MS
+
+        self.DRF_ACTIVITY_TRACKER_MONGO_READ_CONNECTION = None  # Reads use the write connection by default
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MONGO_READ_CONNECTION'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_MONGO_READ_CONNECTION, str):
+                self.DRF_ACTIVITY_TRACKER_MONGO_READ_CONNECTION = settings.DRF_ACTIVITY_TRACKER_MONGO_READ_CONNECTION
+
+        self.DRF_ACTIVITY_TRACKER_MONGO_READ_PREFERENCE = None
+        if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MONGO_READ_PREFERENCE'):
+            if isinstance(settings.DRF_ACTIVITY_TRACKER_MONGO_READ_PREFERENCE, str):
+                self.DRF_ACTIVITY_TRACKER_MONGO_READ_PREFERENCE = settings.DRF_ACTIVITY_TRACKER_MONGO_READ_PREFERENCE
+
+    def get_client(self, read=False):
+        self._check_pid()
+        options = {
+            'serverSelectionTimeoutMs': 5000,
+            'maxPoolSize': self.DRF_ACTIVITY_TRACKER_MONGO_MAX_POOL_SIZE,
+            'maxIdleTimeMS': self.DRF_ACTIVITY_TRACKER_MONGO_MAX_IDLE_TIME_MS,
+        }
+        connection = settings.DRF_ACTIVITY_TRACKER_MONGO_CONNECTION
+        if read:
+            if self.DRF_ACTIVITY_TRACKER_MONGO_READ_CONNECTION:
+                connection = self.DRF_ACTIVITY_TRACKER_MONGO_READ_CONNECTION
+            if self.DRF_ACTIVITY_TRACKER_MONGO_READ_PREFERENCE:
+                options['readPreference'] = self.DRF_ACTIVITY_TRACKER_MONGO_READ_PREFERENCE
+
+        # Read and write handles share one client unless they are configured differently.
+        key = (connection, tuple(sorted(options.items())))
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = MongoClient(connection, **options)
+                    self._clients[key] = client
+        return client
+
+    def get_database(self, read=False):
+        return self.get_client(read=read)[settings.DRF_ACTIVITY_TRACKER_MONGO_DB_NAME]
+
+    def close(self):
+        self._check_pid()
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            client.close()
+
+    def _check_pid(self):
+        # Sockets of a client created before os.fork belong to the parent process.
+        # The child drops the references and builds its own clients on demand.
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._clients = {}
+            self._pid = os.getpid()
+
+
+MONGO_CLIENTS = MongoClientRegistry()
+atexit.register(MONGO_CLIENTS.close)
+
+
+def close_mongo_clients():
+    MONGO_CLIENTS.close()
+
 
-        self.db = client[settings.DRF_ACTIVITY_TRACKER_MONGO_DB_NAME]
+class MongoConnection(object):
+    def __init__(self):
+        self.db = MONGO_CLIENTS.get_database()
         self.collection = self.db[settings.DRF_ACTIVITY_TRACKER_MONGO_DB_COLLECTION_NAME]
 
+        read_db = MONGO_CLIENTS.get_database(read=True)
+        self.read_collection = read_db[settings.DRF_ACTIVITY_TRACKER_MONGO_DB_COLLECTION_NAME]
 
-class MyCollection(MongoConnection):
 
-    def data_count(self, user_id=None, url_name=None, status_code=None, time_delta=None):
-        filter_params = {}
-        if user_id:
-            filter_params.update({'user_id': user_id})
-        if url_name:
-            filter_params.update({'url_name': url_name})
-        if status_code:
-            filter_params.update({'status_code': {'$gte': status_code, '$lt': status_code + 100}})
-        if time_delta:
-            filter_params.update({'created_time': time_delta})
-        return self.collection.count_documents(filter_params)
+class LogQuerySet:
+    """
+    Lazy, sliceable view of a find() query for DRF pagination.
+    Slicing runs the query with skip and limit, count() counts on the server, and at most
+    `max_size` logs are ever reachable.
+    """
+
+    def __init__(self, collection, filter_params, projection=None, sort=None, max_size=None):
+        self.collection = collection
+        self.filter_params = filter_params
+        self.projection = projection
+        self.sort = sort
+        self.max_size = max_size
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if self.max_size:
+                self._count = self.collection.count_documents(self.filter_params, limit=self.max_size)
+            else:
+                self._count = self.collection.count_documents(self.filter_params)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[0:self.max_size])
 
-    def save(self, obj_list):
-        self.collection.insert_many(obj_list)
+    def __getitem__(self, index):
+        if isinstance(index, int):
+            if index < 0:
+                raise IndexError('Negative indexing is not supported.')
+            result = self[index:index + 1]
+            if not result:
+                raise IndexError('Log index out of range.')
+            return result[0]
+
+        if index.step is not None or (index.start or 0) < 0 or (index.stop is not None and index.stop < 0):
+            raise ValueError('Only positive slices without step are supported.')
+
+        start, stop = index.start or 0, index.stop
+        if self.max_size and (stop is None or stop > self.max_size):
+            stop = self.max_size
+        if stop is not None and stop <= start:
+            return []
+        return self._fetch(start, stop)
+
+    def _fetch(self, start, stop):
+        cursor = self.collection.find(self.filter_params, self.projection)
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+        if start:
+            cursor = cursor.skip(start)
+        if stop is not None:
+            cursor = cursor.limit(stop - start)
+        return list(cursor)
+
+
+def get_api_limit():
+    limit = 1500  # Default to 1500 logs
+    if hasattr(settings, 'DRF_ACTIVITI_API_LIMIT'):
+        if isinstance(settings.DRF_ACTIVITI_API_LIMIT, int):
+            limit = settings.DRF_ACTIVITI_API_LIMIT
+    return limit
+
+
+def get_write_concern():
+    """
+    Returns the write concern of the log insertions, e.g. {'w': 1, 'j': False}. None keeps the one of the client.
+    """
+    if hasattr(settings, 'DRF_ACTIVITY_TRACKER_MONGO_WRITE_CONCERN'):
+        if isinstance(settings.DRF_ACTIVITY_TRACKER_MONGO_WRITE_CONCERN, dict):
+            return WriteConcern(**settings.DRF_ACTIVITY_TRACKER_MONGO_WRITE_CONCERN)
+    return None
 
-    def list(self, user_id=None, url_name=None, status_code=None, time_delta=None, dataset_limit=0, skip=0):
+
+class MyCollection(MongoConnection):
+    SORT = [('created_time', -1), ('_id', -1)]
+
+    @staticmethod
+    def _get_filter_params(user_id=None, url_name=None, status_code=None, time_delta=None):
         filter_params = {}
         if user_id:
             filter_params.update({'user_id': user_id})
@@ -114,35 +472,89 @@ class MyCollection(MongoConnection):
             filter_params.update({'url_name': url_name})
         if status_code:
             filter_params.update({'status_code': {'$gte': status_code, '$lt': status_code + 100}})
-        return list(self.collection.find(filter_params).sort('created_time', -1).limit(dataset_limit).skip(skip))
+        return filter_params
 
-    def api_list(self, user_id=None, time_delta=None, url_name=None):
+    def data_count(self, user_id=None, url_name=None, status_code=None, time_delta=None, limit=None):
+        """
+        Counts the matching logs. With `limit`, counting stops after `limit` logs.
+        """
+        filter_params = self._get_filter_params(user_id=user_id, url_name=url_name, status_code=status_code,
+                                                time_delta=time_delta)
+        if not filter_params:
+            # Read from the collection metadata instead of scanning it.
+            return self.read_collection.estimated_document_count()
+        if limit:
+            return self.read_collection.count_documents(filter_params, limit=limit)
+        return self.read_collection.count_documents(filter_params)
+
+    def save(self, obj_list, ordered=True, write_concern=None):
+        collection = self.collection
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=write_concern)
+        collection.insert_many(obj_list, ordered=ordered)
+
+    def list(self, user_id=None, url_name=None, status_code=None, time_delta=None, dataset_limit=0, skip=0,
+             after=None, before=None):
+        """
+        Returns logs from the newest. `after` and `before` are (created_time, _id) cursors:
+        only logs older than `after`, or newer than `before`, are returned.
+        """
+        filter_params = self._get_filter_params(user_id=user_id, url_name=url_name, status_code=status_code,
+                                                time_delta=time_delta)
+        sort = self.SORT
+        if after:
+            filter_params = {'$and': [filter_params, self._get_cursor_filter(after, '$lt')]}
+        elif before:
+            # Logs right after the cursor are fetched from the oldest, then put back in order.
+            filter_params = {'$and': [filter_params, self._get_cursor_filter(before, '$gt')]}
+            sort = [(key, 1) for key, direction in self.SORT]
+
+        dataset = list(self.read_collection.find(filter_params).sort(sort).limit(dataset_limit).skip(skip))
+        if before:
+            dataset.reverse()
+        return dataset
+
+    @staticmethod
+    def _get_cursor_filter(cursor, operator):
+        created_time, pk = cursor
+        return {'$or': [{'created_time': {operator: created_time}},
+                        {'created_time': created_time, '_id': {operator: pk}}]}
+
+    @staticmethod
+    def _get_api_filter_params(user_id=None, time_delta=None, url_name=None):
         filter_params = {}
-        limit = 1500
-        if hasattr(settings, 'DRF_ACTIVITI_API_LIMIT'):
-            if isinstance(settings.DRF_ACTIVITI_API_LIMIT, (tuple, list)):
-                limit = settings.DRF_ACTIVITI_API_LIMIT
         if user_id:
             filter_params.update({'user_id': user_id})
 
         if time_delta:
             filter_params.update({'created_time': time_delta})
 
+        url_name_filter = {}
         if url_name:
-            filter_params.update({'url_name': url_name})
+            url_name_filter.update({'$eq': url_name})
 
         if hasattr(settings, 'DRF_ACTIVITI_API_UNNECESSARY_URL_NAME'):
             if isinstance(settings.DRF_ACTIVITI_API_UNNECESSARY_URL_NAME, list):
-                filter_params.update({'url_name': {'$nin': settings.DRF_ACTIVITI_API_UNNECESSARY_URL_NAME}})
+                url_name_filter.update({'$nin': settings.DRF_ACTIVITI_API_UNNECESSARY_URL_NAME})
+
+        if url_name_filter:
+            filter_params.update({'url_name': url_name_filter})
+        return filter_params
 
-        return list(self.collection.find(filter_params).sort('created_time', -1).limit(limit))
+    def api_list(self, user_id=None, time_delta=None, url_name=None, projection=None):
+        """
+        Returns a LogQuerySet of the history API, only `projection` fields are fetched.
+        """
+        filter_params = self._get_api_filter_params(user_id=user_id, time_delta=time_delta, url_name=url_name)
+        return LogQuerySet(self.read_collection, filter_params, projection=projection, sort=self.SORT,
+                           max_size=get_api_limit())
 
     def detail(self, pk):
         try:
             pk = ObjectId(pk)
         except:
             return None
-        return self.collection.find_one({'_id': pk})
+        return decompress_log(self.read_collection.find_one({'_id': pk}))
 
 
 def get_all_url_names(urlpatterns):
@@ -160,11 +572,103 @@ def get_all_url_names(urlpatterns):
     return url_names
 
 
+class UrlNameIndex:
+    """
+    URL names of the URLconf, built once per process.
+    Django caches one resolver per URLconf and drops it when the URLconf changes
+    (clear_url_caches, ROOT_URLCONF overridden in tests), so a new resolver means a new index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self.version = 0
+
+    def _get_index(self, urlconf=None):
+        resolver = get_resolver(urlconf)
+        index = self._indexes.get(urlconf)
+        if index is not None and index['resolver'] is resolver:
+            return index
+
+        with self._lock:
+            index = self._indexes.get(urlconf)
+            if index is None or index['resolver'] is not resolver:
+                routes = {}
+                self._walk(resolver.url_patterns, [], routes)
+                index = {
+                    'resolver': resolver,
+                    'routes': routes,
+                    'url_names': sorted(set(url_name for url_name, namespace in routes.values())),
+                    'qualified_names': sorted(routes),
+                }
+                self._indexes[urlconf] = index
+                self.version += 1
+        return index
+
+    def _walk(self, urlpatterns, namespaces, routes):
+        for pattern in urlpatterns:
+            if isinstance(pattern, URLPattern):
+                if pattern.name:
+                    namespace = ':'.join(namespaces)
+                    routes[':'.join(namespaces + [pattern.name])] = (pattern.name, namespace)
+            elif isinstance(pattern, URLResolver):
+                self._walk(pattern.url_patterns, namespaces + [pattern.namespace] if pattern.namespace
+                           else namespaces, routes)
+
+    def get_version(self, urlconf=None):
+        """
+        Returns a number that changes every time the URLconf is reloaded.
+        """
+        self._get_index(urlconf)
+        return self.version
+
+    def get_url_names(self, urlconf=None):
+        return self._get_index(urlconf)['url_names']
+
+    def get_qualified_names(self, urlconf=None):
+        return self._get_index(urlconf)['qualified_names']
+
+    def get_routes(self, urlconf=None):
+        """
+        Returns {qualified name: (url name, namespace)}.
+        """
+        return self._get_index(urlconf)['routes']
+
+
+URL_NAME_INDEX = UrlNameIndex()
+
+
+CURSOR_TIME_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def encode_cursor(document):
+    return '{}_{}'.format(document['created_time'].strftime(CURSOR_TIME_FORMAT), document['_id'])
+
+
+def decode_cursor(value):
+    try:
+        created_time, pk = value.split('_')
+        return datetime.strptime(created_time, CURSOR_TIME_FORMAT), ObjectId(pk)
+    except Exception:
+        return None
+
+
+def format_count(count, limit=None):
+    if limit and count > limit:
+        return '{:,}+'.format(limit)
+    return '{:,}'.format(count)
+
+
 class ParamsHandler:
 
     def __init__(self, request):
         self.params = request.GET
 
+    def get_cursor(self, name):
+        value = self.params.get(name)
+        if value:
+            return decode_cursor(value)
+
     def get_url_name(self):
         return self.params.get('url_name')
 
@@ -209,6 +713,10 @@ class CustomPaginator(Paginator):
         number = self.validate_number(number)
         return self._get_page(self.dataset, number, self)
 
+    def cursor_page(self, has_next, has_previous):
+        """Return a Page object of keyset pagination, that links to its neighbours by cursor."""
+        return Page(self.dataset, None, self, has_next=has_next, has_previous=has_previous)
+
     @cached_property
     def count(self):
         return None
@@ -255,12 +763,17 @@ class CustomPaginator(Paginator):
 
 class Page(collections.abc.Sequence):
 
-    def __init__(self, dataset, number, paginator):
+    def __init__(self, dataset, number, paginator, has_next=None, has_previous=None):
         self.dataset = dataset
         self.number = number
         self.paginator = paginator
+        self.is_cursor_page = number is None
+        self._has_next = has_next
+        self._has_previous = has_previous
 
     def __repr__(self):
+        if self.is_cursor_page:
+            return '<Page of %s>' % self.paginator.per_page
         return '<Page %s of %s>' % (self.number, self.paginator.num_pages)
 
     def __len__(self):
@@ -275,11 +788,21 @@ class Page(collections.abc.Sequence):
         return self.dataset
 
     def has_next(self):
+        if self.is_cursor_page:
+            return bool(self._has_next and self.dataset)
         return self.number < self.paginator.num_pages
 
     def has_previous(self):
+        if self.is_cursor_page:
+            return bool(self._has_previous and self.dataset)
         return self.number > 1
 
+    def next_cursor(self):
+        return encode_cursor(self.dataset[-1]) if self.dataset else None
+
+    def previous_cursor(self):
+        return encode_cursor(self.dataset[0]) if self.dataset else None
+
     def has_other_pages(self):
         return self.has_previous() or self.has_next()
 
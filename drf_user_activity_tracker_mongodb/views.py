@@ -1,13 +1,18 @@
+from django.http import HttpResponse
 from rest_framework import mixins
 from rest_framework.generics import GenericAPIView
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from drf_user_activity_tracker_mongodb.backends import get_storage_backend
+from drf_user_activity_tracker_mongodb.codec import get_renderer_classes
+from drf_user_activity_tracker_mongodb.metrics import METRICS
 from drf_user_activity_tracker_mongodb.permissions import CanViewAdminHistory
 from drf_user_activity_tracker_mongodb.serializers import ActivityLogSerializer, ActivityLogAdminSerializer, \
-    QueryParamsValidatorSerializer
-from drf_user_activity_tracker_mongodb.utils import MyCollection, create_time_delta_for_api
+    QueryParamsValidatorSerializer, ActivityRollupSerializer, RollupQueryParamsValidatorSerializer
+from drf_user_activity_tracker_mongodb.utils import create_time_delta_for_api
 
 
 class ActivityLogView(mixins.ListModelMixin, GenericAPIView):
@@ -15,6 +20,7 @@ class ActivityLogView(mixins.ListModelMixin, GenericAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = ActivityLogSerializer
     pagination_class = LimitOffsetPagination
+    renderer_classes = get_renderer_classes()
 
     def get_queryset(self):
         date_validator_serializer = QueryParamsValidatorSerializer(data=self.request.query_params)
@@ -24,9 +30,11 @@ class ActivityLogView(mixins.ListModelMixin, GenericAPIView):
         created_time_before = date_validator_serializer.validated_data.get("created_time_before")
         time_delta = create_time_delta_for_api(created_time_after, created_time_before)
         if time_delta:
-            return MyCollection().api_list(user_id=self.request.user.id, time_delta=time_delta)
+            return get_storage_backend().api_list(user_id=self.request.user.id, time_delta=time_delta,
+                                                  projection=self.get_serializer_class().get_projection())
 
-        return MyCollection().api_list(user_id=self.request.user.id)
+        return get_storage_backend().api_list(user_id=self.request.user.id,
+                                              projection=self.get_serializer_class().get_projection())
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
@@ -37,6 +45,7 @@ class ActivityLogAdminView(mixins.ListModelMixin, GenericAPIView):
     permission_classes = [IsAuthenticated, CanViewAdminHistory]
     serializer_class = ActivityLogAdminSerializer
     pagination_class = LimitOffsetPagination
+    renderer_classes = get_renderer_classes()
 
     def get_queryset(self):
         query_params_validator_serializer = QueryParamsValidatorSerializer(data=self.request.query_params)
@@ -49,7 +58,40 @@ class ActivityLogAdminView(mixins.ListModelMixin, GenericAPIView):
         url_name = query_params_validator_serializer.validated_data.get('url_name')
         user_id = query_params_validator_serializer.validated_data.get('user_id')
 
-        return MyCollection().api_list(time_delta=time_delta, url_name=url_name, user_id=user_id)
+        return get_storage_backend().api_list(time_delta=time_delta, url_name=url_name, user_id=user_id,
+                                              projection=self.get_serializer_class().get_projection())
 
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
+
+
+class ActivityRollupView(mixins.ListModelMixin, GenericAPIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, CanViewAdminHistory]
+    serializer_class = ActivityRollupSerializer
+    renderer_classes = get_renderer_classes()
+
+    def get_queryset(self):
+        query_params_validator_serializer = RollupQueryParamsValidatorSerializer(data=self.request.query_params)
+        query_params_validator_serializer.is_valid(raise_exception=True)
+
+        created_time_after = query_params_validator_serializer.validated_data.get("created_time_after")
+        created_time_before = query_params_validator_serializer.validated_data.get("created_time_before")
+        time_delta = create_time_delta_for_api(created_time_after, created_time_before)
+
+        url_name = query_params_validator_serializer.validated_data.get('url_name')
+        group_by = query_params_validator_serializer.validated_data.get('group_by')
+
+        return get_storage_backend().aggregate(time_delta=time_delta, url_name=url_name, group_by=group_by)
+
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+
+class ActivityMetricsView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, CanViewAdminHistory]
+
+    def get(self, request, *args, **kwargs):
+        # Prometheus text exposition format.
+        return HttpResponse(METRICS.to_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')